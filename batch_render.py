@@ -0,0 +1,177 @@
+#
+# Headless batch rendering of parameter files
+# https://github.com/LEMettler
+#
+# python3 batch_render.py configs/ --workers 4 --out-dir renders/
+# python3 batch_render.py configs/ --minify --svgz --compress-level 9
+#
+
+
+import os, sys
+import argparse
+import contextlib
+import glob
+import gzip
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from collision_builder import validate_parameters, render_parameters
+from render_cache import RenderCache
+from profiling import RenderStats
+
+
+
+def collect_parameter_files(paths):
+    '''
+    Expand directories to the *.json files inside, keep the order of the arguments.
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.json')))
+        else:
+            files.append(path)
+    return files
+
+
+def output_name(params, parameter_file, out_dir, svgz=False):
+    name = params.get('name') or os.path.splitext(os.path.basename(parameter_file))[0] + '.svg'
+    if out_dir is not None:
+        name = os.path.join(out_dir, os.path.basename(name))
+    if svgz and not name.endswith('.svgz'):
+        name = os.path.splitext(name)[0] + '.svgz'
+    return name
+
+
+@contextlib.contextmanager
+def atomicOutput(name, compresslevel=9):
+    '''
+    Like openSvgTarget for a file name, but the document goes to a temporary file next to it,
+    which replaces name only once it is complete. A failed render leaves no broken file behind.
+    '''
+    tmp_path = f'{name}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as file:
+            if name.endswith('.svgz'):
+                # the header carries the final name and mtime=0, the same bytes as openSvgTarget
+                with gzip.GzipFile(name, 'wb', compresslevel=compresslevel, fileobj=file, mtime=0) as compressed:
+                    yield compressed
+            else:
+                yield file
+        os.replace(tmp_path, name)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def render_file(parameter_file, out_dir=None, seed=None, cache_dir=None, cache_bytes=256<<20, profile=False,
+                minify=False, svgz=False, compresslevel=9):
+    '''
+    Load, validate and render one parameter file. Never raises, the outcome is reported in the result.
+    - seed: used if the file does not specify its own 'seed'
+    - cache_dir: directory of a RenderCache shared by all workers
+    - profile: add the stage times (RenderStats.as_dict) to the result
+    - minify: whitespace free documents
+    - svgz: write gzip compressed .svgz files with compresslevel (also used for names ending in .svgz)
+    '''
+    result = {'file': parameter_file, 'output': None, 'status': 'ok', 'message': '',
+              'paths': 0, 'bytes': 0, 'seconds': 0., 'stats': None}
+    stats = RenderStats() if profile else None
+    start = time.perf_counter()
+
+    try:
+        with open(parameter_file) as f:
+            params = json.load(f)
+    except (OSError, json.JSONDecodeError) as error:
+        result.update(status='error', message=str(error))
+        return result
+
+    if seed is not None:
+        params.setdefault('seed', seed)
+
+    errors = validate_parameters(params)
+    if errors:
+        result.update(status='invalid', message='; '.join(errors))
+        return result
+
+    result['output'] = output_name(params, parameter_file, out_dir, svgz)
+    try:
+        os.makedirs(os.path.dirname(result['output']) or '.', exist_ok=True)
+        cache = RenderCache(cache_dir, cache_bytes) if cache_dir is not None else None
+        with atomicOutput(result['output'], compresslevel) as target:
+            collision = render_parameters(params, target, cache=cache, stats=stats, minify=minify)
+        if collision is None:
+            result['status'] = 'cached'
+        else:
+            result['paths'] = len(collision.primary_paths) + len(collision.secondary_paths)
+        result['bytes'] = os.path.getsize(result['output'])
+    except Exception as error:
+        result.update(status='error', message=f'{type(error).__name__}: {error}')
+
+    result['seconds'] = time.perf_counter() - start
+    if stats is not None:
+        result['stats'] = stats.as_dict()
+    return result
+
+
+def print_summary(results, wall_time):
+    width = max([len(result['file']) for result in results] + [4])
+    print(f'{"file":<{width}}  {"status":<7}  {"paths":>6}  {"bytes":>9}  {"time":>8}')
+    for result in results:
+        print(f'{result["file"]:<{width}}  {result["status"]:<7}  {result["paths"]:>6}  '
+              f'{result["bytes"]:>9}  {result["seconds"]*1e3:>6.1f}ms'
+              + (f'  {result["message"]}' if result['message'] else ''))
+
+    n_ok = sum(result['status'] in ['ok', 'cached'] for result in results)
+    n_cached = sum(result['status'] == 'cached' for result in results)
+    busy = sum(result['seconds'] for result in results)
+    print(f'\n{n_ok}/{len(results)} rendered ({n_cached} from cache), {busy:.2f}s render time, {wall_time:.2f}s wall time')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render parameter files (configs/*.json) to svg without any interaction.')
+    parser.add_argument('paths', nargs='+', help='parameter files or directories containing them')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('-o', '--out-dir', default=None, help='write all svgs into this directory (default: the "name" of each file)')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='seed of files without a "seed" entry (default: random)')
+    parser.add_argument('-c', '--cache', default=None, help='directory of a render cache for seeded files')
+    parser.add_argument('--cache-size', type=float, default=256, help='maximum size of the render cache in MB')
+    parser.add_argument('--profile', action='store_true', help='print the time of every render stage, summed over all files')
+    parser.add_argument('--minify', action='store_true', help='no whitespace between and inside the elements')
+    parser.add_argument('--svgz', action='store_true', help='write gzip compressed .svgz files')
+    parser.add_argument('--compress-level', type=int, default=9, choices=range(1, 10), metavar='1-9',
+                        help='gzip level of .svgz files (1 fastest, 9 smallest)')
+    args = parser.parse_args(argv)
+    cache_bytes = int(args.cache_size*2**20)
+
+    files = collect_parameter_files(args.paths)
+    if not files:
+        print('No parameter files found.')
+        return 1
+
+    start = time.perf_counter()
+    if args.workers <= 1 or len(files) == 1:
+        results = [render_file(f, args.out_dir, args.seed, args.cache, cache_bytes, args.profile,
+                               args.minify, args.svgz, args.compress_level) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            n = len(files)
+            results = list(pool.map(render_file, files, [args.out_dir]*n, [args.seed]*n, [args.cache]*n, [cache_bytes]*n,
+                                    [args.profile]*n, [args.minify]*n, [args.svgz]*n, [args.compress_level]*n,
+                                    chunksize=max(1, n//(4*args.workers))))
+
+    print_summary(results, time.perf_counter() - start)
+
+    if args.profile:
+        stats = RenderStats()
+        for result in results:
+            if result['stats'] is not None:
+                stats.merge(result['stats'])
+        print('\n' + stats.report())
+    return 0 if all(result['status'] in ['ok', 'cached'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
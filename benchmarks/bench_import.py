@@ -0,0 +1,70 @@
+#
+# Benchmark: import time of the headless modules (python -X importtime)
+# python3 benchmarks/bench_import.py [--budget-ms 250] [--repeat 5]
+#
+# Fails (exit code 1) if a module exceeds the budget or pulls in plotting, browser or GUI packages.
+#
+
+
+import os, sys
+import argparse
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['pathset', 'collision_builder', 'consecutive_collisions', 'batch_render']
+FORBIDDEN = ['matplotlib', 'webbrowser', 'PyQt5']
+
+
+def import_profile(module):
+    '''
+    Import module in a fresh interpreter. Returns the cumulative time in ms, the slowest direct
+    dependencies [(ms, name), ...] and the forbidden packages that were loaded.
+    '''
+    check = f'import sys, {module}; print(",".join(m for m in {FORBIDDEN!r} if m in sys.modules))'
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', check],
+                             cwd=ROOT, capture_output=True, text=True, check=True)
+
+    total, children, pending = None, [], []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '):
+            # a top level module, its direct imports were listed right before it
+            if name.strip() == module:
+                total, children = int(cumulative)/1e3, pending
+            pending = []
+        elif not name[3:].startswith(' '):
+            pending.append((int(cumulative)/1e3, name.strip()))
+
+    loaded = [m for m in process.stdout.strip().split(',') if m]
+    return total, sorted(children, reverse=True)[:3], loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import time budget of the headless core.')
+    parser.add_argument('--budget-ms', type=float, default=250, help='maximum cumulative import time per module')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module, the fastest counts')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in MODULES:
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        total, children, loaded = min(runs, key=lambda run: run[0])
+        slowest = ', '.join(f'{name} {ms:.0f}ms' for ms, name in children)
+
+        status = 'ok'
+        if total > args.budget_ms:
+            status, failed = 'SLOW', True
+        if loaded:
+            status, failed = 'LOADS ' + ','.join(loaded), True
+        print(f'{module:>24}: {total:7.1f} ms  {status:<8} ({slowest})')
+
+    print(f'{"budget":>24}: {args.budget_ms:7.1f} ms')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
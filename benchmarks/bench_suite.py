@@ -0,0 +1,228 @@
+#
+# Benchmark suite: geometry, serialization and multi-collision output at several scales
+# python3 benchmarks/bench_suite.py [--quick] [--filter name] [--out results.json]
+# python3 benchmarks/bench_suite.py --baseline benchmarks/results/<earlier run>.json [--threshold 0.2]
+#
+# Every run is stored as json (benchmarks/results/ by default). With --baseline, cases that became
+# slower than threshold (relative) are listed and the exit code is 1.
+#
+
+
+import os, sys
+import io
+import json
+import itertools
+import time
+import platform
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from collision_builder import CollisionBuider, newCollsionPoint, bouncePaths, array2d_string, calculatePathLength
+from consecutive_collisions import ConsecutiveCollisionBuilder
+from disc_simulation import DiscSimulation, randomDiscs
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+WIDTH, HEIGHT = 800, 300
+SEED = 12345
+WALLS = [([402, 230], [['C', 'D', 'C'], ['B', 'A', 'D', 'A']]),
+         ([5, 10], [['C', 'D', 'C'], ['C', 'A']]),
+         ([751, 190], [['A', 'D', 'C'], ['B']]),
+         ([81, 280], [['B', 'D', 'A', 'C'], ['A', 'D']]),
+         ([300, 100], [['A', 'D', 'A'], ['B', 'C', 'A']])]
+
+
+
+def measure(fn, repeat=5, min_time=0.05):
+    '''
+    Seconds per call of fn: calls are batched until a batch takes min_time, the fastest of repeat batches counts.
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(1.2*min_time/elapsed))
+
+    best = elapsed/number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start)/number)
+    return best
+
+
+def collision(n_bounces, n_secondaries, n_primaries=3):
+    builder = CollisionBuider(WIDTH, HEIGHT, [310, 120], incoming_angles=[17., 131., 250.][:n_primaries], seed=SEED)
+    builder.calculatePrimaryPaths(n_bounces)
+    builder.calculateSecondaryPaths(n_secondaries, alpha_std=40, length_mean=200, length_std=100)
+    return builder
+
+
+def consecutive(n_collisions, n_secondaries=40, fragment_cache=False):
+    builder = ConsecutiveCollisionBuilder(WIDTH, HEIGHT, [300, 100], seed=SEED, fragment_cache=fragment_cache)
+    for i in range(n_collisions):
+        point, walls = WALLS[i % len(WALLS)]
+        builder.addCollision(point, walls, primary_duration=2, n_secondaries=n_secondaries)
+    return builder
+
+
+def random_path(n_points):
+    rng = np.random.default_rng(SEED)
+    return rng.uniform(0, [[WIDTH], [HEIGHT]], size=(2, n_points))
+
+
+
+def cases(quick=False):
+    '''
+    Yields (name, scale, setup), setup() prepares the inputs and returns the function to time.
+    '''
+    pick = lambda scales: scales[:2] if quick else scales
+
+    yield 'newCollsionPoint', '-', lambda: (lambda: newCollsionPoint(310., 120., 37., WIDTH, HEIGHT))
+
+    for n in pick([10, 100, 1000]):
+        def setup(n=n):
+            builder = collision(0, 0)
+            def run():
+                builder.primary_paths.clear()
+                builder.calculatePrimaryPaths(n)
+            return run
+        yield 'calculatePrimaryPaths', f'bounces={n}', setup
+
+    # enough rays for the vectorized engine (the 3 rays above take the scalar path)
+    for n in pick([10, 100, 1000]):
+        def setup(n=n):
+            builder = collision(0, 0)
+            angles = np.linspace(1., 359., 64).tolist()
+            def run():
+                builder.primary_paths.clear()
+                builder.calculatePrimaryPaths(n, incoming_angles=angles)
+            return run
+        yield 'calculatePrimaryPaths', f'rays=64,bounces={n}', setup
+
+    # the engine alone, across the scalar (below 12 rays) and the vectorized path
+    for n_rays in [1, 100, 10_000]:
+        for n in pick([10, 100, 1000]):
+            def setup(n_rays=n_rays, n=n):
+                angles = np.random.default_rng(SEED).uniform(0, 360, n_rays).tolist()
+                return lambda: bouncePaths(310., 120., angles, n, WIDTH, HEIGHT)
+            yield 'bouncePaths', f'rays={n_rays},bounces={n}', setup
+
+    for n in pick([100, 1000, 10000]):
+        def setup(n=n):
+            builder = collision(0, 0)
+            def run():
+                builder.secondary_paths.clear()
+                builder.calculateSecondaryPaths(n, alpha_std=40, length_mean=200, length_std=100)
+            return run
+        yield 'calculateSecondaryPaths', f'secondaries={n}', setup
+
+    for n in pick([100, 1000, 10000]):
+        yield 'array2d_string', f'points={n}', lambda n=n: (lambda path=random_path(n): array2d_string(path))
+        yield 'calculatePathLength', f'points={n}', lambda n=n: (lambda path=random_path(n): calculatePathLength(path))
+
+    for n_bounces, n_secondaries in pick([(15, 30), (100, 300), (1000, 3000)]):
+        def setup(n_bounces=n_bounces, n_secondaries=n_secondaries):
+            builder = collision(n_bounces, n_secondaries)
+            return lambda: builder.to_svg(io.StringIO())
+        yield 'CollisionBuider.to_svg', f'bounces={n_bounces},secondaries={n_secondaries}', setup
+
+    for n in pick([5, 50, 200]):
+        def setup(n=n):
+            builder = consecutive(n)
+            builder.collisions  # geometry is built on first access, only the output is timed
+            return lambda: builder.to_svg(io.StringIO())
+        yield 'ConsecutiveCollisionBuilder.to_svg', f'collisions={n}', setup
+
+    for n in pick([50, 200, 500]):
+        def setup(n=n):
+            builder = consecutive(n, fragment_cache=True)
+            builder.to_svg(io.StringIO())
+            point = np.array(builder.points_of_collision[n//2 + 1], dtype=float)
+            shift = itertools.cycle([[1., 1.], [-1., -1.]])
+            def run():
+                # nudge one point in the middle: two collisions are rebuilt, the rest is reused
+                point[:] += next(shift)
+                builder.editCollision(n//2, point.tolist())
+                builder.to_svg(io.StringIO())
+            return run
+        yield 'ConsecutiveCollisionBuilder.editCollision', f'collisions={n}', setup
+
+    for n in pick([100, 500, 2000]):
+        def setup(n=n):
+            discs = randomDiscs(n, 2, WIDTH, HEIGHT, (20, 60), rng=SEED)
+            return lambda: DiscSimulation(WIDTH, HEIGHT, *discs, radii=2).run(2)
+        yield 'DiscSimulation.run', f'discs={n},time=2', setup
+
+
+
+def run_suite(quick=False, name_filter=None, repeat=5):
+    results = {}
+    for name, scale, setup in cases(quick):
+        if name_filter and name_filter not in name:
+            continue
+        seconds = measure(setup(), repeat=repeat)
+        results[f'{name}[{scale}]'] = seconds
+        print(f'{name:>36} {scale:<28} {seconds*1e3:10.4f} ms')
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns the cases slower than baseline by more than threshold: [(case, old, new), ...]
+    '''
+    regressions = []
+    for case, seconds in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        change = seconds/old - 1
+        flag = 'REGRESSION' if change > threshold else ''
+        print(f'{case:>66} {old*1e3:10.4f} -> {seconds*1e3:10.4f} ms  {change*100:+6.1f}%  {flag}')
+        if change > threshold:
+            regressions.append((case, old, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark suite of the collision builders.')
+    parser.add_argument('--quick', action='store_true', help='only the two smaller scales of every case')
+    parser.add_argument('--filter', default=None, help='only cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5, help='timed batches per case, the fastest counts')
+    parser.add_argument('--out', default=None, help='result file (default: benchmarks/results/<date>.json)')
+    parser.add_argument('--baseline', default=None, help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown that counts as regression')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.quick, args.filter, args.repeat)
+
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                            'numpy': np.__version__, 'machine': platform.machine(), 'platform': platform.platform(),
+                            'repeat': args.repeat, 'quick': args.quick},
+                   'results': results}, f, indent=4)
+    print(f'Writen to {out}!')
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    print(f'\nCompared to {args.baseline} (threshold {args.threshold*100:.0f}%):')
+    regressions = compare(results, baseline, args.threshold)
+    print(f'{len(regressions)} regression(s)')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
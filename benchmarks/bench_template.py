@@ -0,0 +1,70 @@
+#
+# Benchmark: compiled path template vs. the former per-path str.replace chain
+# python3 benchmarks/bench_template.py [n_collisions] [n_paths]
+#
+
+
+import os, sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collision_builder import PATH_TEMPLATE, loadPathTemplate
+
+
+SLOTS = ['path', 'length', 'color', 'width', 'stroke_id', 'stroke_begin', 'stroke_duration',
+         'stroke_reset_begin', 'opacity_id', 'opacity_begin', 'opacity_duration', 'opacity_reset_begin']
+
+
+def replace_chain(template_path, collisions):
+    # the former prepare_for_multi_svg: re-read the file per collision, twelve replaces per path
+    out = []
+    for paths, shared in collisions:
+        with open(template_path) as template_file:
+            template_string = template_file.read()
+        for d, length in paths:
+            values = dict(shared, path=d, length=length)
+            path_string = template_string
+            for slot in SLOTS:
+                path_string = path_string.replace('_' + slot.upper().replace('_', '-') + '_', values[slot])
+            out.append(path_string + '\n\n')
+    return ''.join(out)
+
+
+def compiled(template_path, collisions):
+    out = []
+    template = loadPathTemplate(template_path)
+    for paths, shared in collisions:
+        shared_template = template.partial(**shared)
+        for d, length in paths:
+            out.append(shared_template.fill(path=d, length=length) + '\n\n')
+    return ''.join(out)
+
+
+def main(n_collisions=1000, n_paths=50):
+    collisions = []
+    for i in range(n_collisions):
+        shared = {'color': '#eb6e21', 'width': '3.5',
+                  'stroke_id': f'primary{i}_stroke', 'stroke_begin': f'primary{i-1}_stroke.end',
+                  'stroke_duration': '2s', 'stroke_reset_begin': f'primary{i-1}_stroke.end-0.001s',
+                  'opacity_id': f'primary{i}_opacity', 'opacity_begin': f'primary{i}_stroke.end',
+                  'opacity_duration': '0.5s', 'opacity_reset_begin': f'primary{i-1}_stroke.end-0.001s'}
+        paths = [(f'M{p},{p} L{p+10.5},{p+3.25}', str(11.0 + p)) for p in range(n_paths)]
+        collisions.append((paths, shared))
+
+    timings, results = {}, {}
+    for name, fill in [('replace chain', replace_chain), ('compiled', compiled)]:
+        start = time.perf_counter()
+        results[name] = fill(PATH_TEMPLATE, collisions)
+        timings[name] = time.perf_counter() - start
+        print(f'{name:>14}: {timings[name]*1e3:8.1f} ms  ({len(results[name])/1e6:.1f} MB)')
+
+    assert results['replace chain'] == results['compiled'], 'compiled template differs from the replace chain'
+
+    print(f'{"speedup":>14}: {timings["replace chain"]/timings["compiled"]:8.1f} x'
+          f'  ({n_collisions} collisions x {n_paths} paths)')
+    return timings
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
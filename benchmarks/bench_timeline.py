@@ -0,0 +1,83 @@
+#
+# Benchmark: chained (syncbase begin references) vs absolute (timeline.py) timing of ConsecutiveCollisionBuilder
+# and the css backend (css_backend.py)
+# python3 benchmarks/bench_timeline.py [n_collisions ...]
+#
+# Per document: size, elements, animation elements, longest begin reference chain, xml parse time and the
+# time to resolve the begin of every animation (the timing graph a SMIL engine builds while loading).
+# Playback in a real browser is not measured here.
+#
+
+
+import os, sys
+import re
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import consecutive
+from timeline import documentStats
+
+
+def _seconds(value):
+    return float(value[:-1]) if value.endswith('s') else float(value)
+
+
+def resolveBegins(svg):
+    '''
+    First begin time of every animation. Syncbase references (id.end+offset) are resolved by repeated
+    passes until nothing changes, the number of passes grows with the length of the chains.
+    Returns (begins, passes).
+    '''
+    animations = []
+    for tag in re.findall(r'<(?:animate|set)\b[^>]*>', svg):
+        element_id = re.search(r'\bid="([^"]*)"', tag)
+        begin = re.search(r'\bbegin="([^"]*)"', tag).group(1)
+        dur = re.search(r'\bdur="([^"]*)"', tag)
+        animations.append((element_id.group(1) if element_id else None, begin.split(';'),
+                           _seconds(dur.group(1)) if dur else 0.))
+
+    ends, begins, passes, changed = {}, [None]*len(animations), 0, True
+    while changed:
+        changed, passes = False, passes + 1
+        for k, (element_id, conditions, dur) in enumerate(animations):
+            times = []
+            for condition in conditions:
+                reference = re.match(r'([\w-]+)\.end([+-][\d.]+s)?$', condition)
+                if reference is None:
+                    times.append(_seconds(condition))
+                elif reference.group(1) in ends:
+                    times.append(ends[reference.group(1)] + (_seconds(reference.group(2)) if reference.group(2) else 0.))
+            if times and min(times) != begins[k]:
+                begins[k], changed = min(times), True
+                if element_id is not None:
+                    ends[element_id] = begins[k] + dur
+    return begins, passes
+
+
+def measure(svg):
+    stats = documentStats(svg)
+    start = time.perf_counter()
+    ET.fromstring(svg)
+    stats['parse ms'] = (time.perf_counter() - start)*1e3
+    start = time.perf_counter()
+    _, stats['resolve passes'] = resolveBegins(svg)
+    stats['resolve ms'] = (time.perf_counter() - start)*1e3
+    return stats
+
+
+def main(sizes=(10, 100, 500)):
+    columns = ['bytes', 'elements', 'animations', 'chain depth', 'parse ms', 'resolve passes', 'resolve ms']
+    outputs = [('chained', {}), ('absolute', {'timing': 'absolute'}), ('css', {'backend': 'css'})]
+    print(f'{"collisions":>10} {"output":>9} ' + ' '.join(f'{c:>14}' for c in columns))
+    for n in sizes:
+        builder = consecutive(n)
+        for output, options in outputs:
+            stats = measure(builder.to_svg_bytes(**options).decode('utf-8'))
+            print(f'{n:>10} {output:>9} ' + ' '.join(f'{stats[c]:>14.1f}' if isinstance(stats[c], float)
+                                                   else f'{stats[c]:>14}' for c in columns))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or (10, 100, 500))
@@ -6,13 +6,34 @@
 
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os, sys
-import webbrowser
+import re
+import io
+import itertools
+import contextlib
 import json
-import time
 
-np.random.seed(int(time.time()))
+from pathset import PathSet
+from profiling import NO_STATS
+from timeline import roleKeyframes, loopAnimations, loopSlots, dashValues
+from css_backend import CssStyleSheet, cssPath, roleClass
+from level_of_detail import cullSecondaries, reportCulling
+
+
+
+def seedSequence(seed=None):
+    '''
+    - seed: None (fresh OS entropy), int, np.random.SeedSequence or np.random.Generator
+    ---------------------------------------
+    Root of the random streams of a builder. Independent child streams are spawned from it,
+    so the same seed renders the same document, no matter in which process or order.
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        # derived deterministically from the state of the generator
+        return np.random.SeedSequence(seed.integers(2**63, size=4))
+    return np.random.SeedSequence(seed)
 
 
 
@@ -58,28 +79,271 @@ def newCollsionPoint(x, y, alpha, width, height):
         return (width, yright, 540-alpha) # collision right vertical
     else:
         return (xbottom, 0, 360-alpha) # collision bottom horizontal
-    
-    
 
 
-def secondaryPaths(n, x0, y0, alpha1, alpha2, alpha_std=30, length_mean=50, length_std=10):
-    alpha_mean = (alpha1 + alpha2)/2
-    alpha_mean -= 180 #flip
 
-    sec_alphas = alpha_mean + alpha_std*np.random.randn(n)
+def newCollisionPoints(x, y, alpha, width, height):
+    '''
+    - x, y, alpha: arrays (same shape) of ray positions and angles
+    ---------------------------------------
+    Vectorized newCollsionPoint: advance every ray to its next wall collision at once.
+    Returns the arrays (x_new, y_new, alpha_new).
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    alpha = np.asarray(alpha, dtype=float)
+
+    # same arithmetic as angle2line/inv_angle2line, but tan is evaluated once per ray;
+    # horizontal/vertical rays divide by tan(0), those branches are never selected
+    slope = np.tan(np.deg2rad(alpha))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yleft = slope*(0-x) + y
+        yright = slope*(width-x) + y
+        xbottom = (0-y)/slope + x
+        xtop = (height-y)/slope + x
+
+    top_right = alpha < 90
+    top_left = ~top_right & (alpha < 180)
+    bottom_left = (alpha >= 180) & (alpha < 270)
+    bottom_right = alpha >= 270
+
+    # same branching as newCollsionPoint (NaN comparisons fall into the else branches)
+    hit_right = (top_right & (xtop > width)) | (bottom_right & (xbottom > width))
+    hit_left = (top_left & ~(yleft > height)) | (bottom_left & (xbottom < 0))
+    hit_top = (top_right & ~(xtop > width)) | (top_left & (yleft > height))
+
+    x_new = np.where(hit_right, width, np.where(hit_left, 0, np.where(hit_top, xtop, xbottom)))
+    y_new = np.where(hit_right, yright, np.where(hit_left, yleft, np.where(hit_top, height, 0)))
+
+    vertical = hit_right | hit_left
+    alpha_new = np.where(vertical, np.where(alpha < 180, 180-alpha, 540-alpha), 360-alpha)
+
+    return x_new, y_new, alpha_new
+
+
+
+def scalarBouncePath(x0, y0, alpha, n_bounces, width, height):
+    '''
+    - x0, y0, alpha: start point and angle of a single ray
+    ---------------------------------------
+    One wall collision after the other with newCollsionPoint. Returns [x_path, y_path].
+    '''
+    x_path, y_path = [x0], [y0]
+    for i in range(int(n_bounces)):
+        xi, yi, alpha = newCollsionPoint(x_path[-1], y_path[-1], alpha, width, height)
+        x_path.append(xi)
+        y_path.append(yi)
+    return [x_path, y_path]
+
+
+
+def bouncePaths(x0, y0, alphas, n_bounces, width, height):
+    '''
+    - x0, y0: start point(s) of the rays (scalars or arrays broadcastable to alphas)
+    - alphas: start angle of each ray
+    - n_bounces: number of wall collisions to compute for every ray
+    ---------------------------------------
+    Batch bounce engine: all rays are advanced with one array operation per bounce.
+    Returns the coordinates with shape (n_rays, n_bounces+1, 2); [:, 0] is the start point.
+    '''
+    # below a dozen rays the per-step array overhead outweighs the scalar loop,
+    # the paths are traced as before and converted to an array once
+    if np.isscalar(alphas):
+        alphas = [alphas]
+    if len(alphas) < 12 and np.isscalar(x0) and np.isscalar(y0):
+        paths = [scalarBouncePath(x0, y0, a, n_bounces, width, height) for a in alphas]
+        return np.array(paths, dtype=float).reshape(len(paths), 2, int(n_bounces)+1).transpose(0, 2, 1)
+
+    alpha = np.asarray(alphas, dtype=float)
+    n_rays = alpha.shape[0]
+
+    coords = np.empty((n_rays, int(n_bounces)+1, 2))
+    coords[:, 0, 0] = x0
+    coords[:, 0, 1] = y0
+
+    x, y = coords[:, 0, 0], coords[:, 0, 1]
+    for i in range(1, int(n_bounces)+1):
+        x, y, alpha = newCollisionPoints(x, y, alpha, width, height)
+        coords[:, i, 0] = x
+        coords[:, i, 1] = y
+
+    return coords
+
+
+
+def _crossingDistance(d0, spacing, speed, i):
+    # travelled distance until the i-th (i >= 1) grid line of the unfolded table is crossed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (d0 + (i-1)*spacing)/speed
+    return np.where(i > 0, t, -np.inf)
+
+def _fold(v, period):
+    # mirror an unfolded coordinate back into [0, period]
+    m = np.floor(v/period)
+    r = v - m*period
+    return np.where(m % 2 == 0, r, period - r)
+
+
+def unfoldedBouncePoints(x0, y0, alpha, ks, width, height):
+    '''
+    - x0, y0, alpha: start point and angle of a single ray
+    - ks: array of bounce indices (0 is the start point)
+    ---------------------------------------
+    Closed form wall collisions: mirrored at the walls the ray is a straight line,
+    so the k-th collision is the k-th grid line it crosses in the unfolded plane.
+    Every index costs O(1), independent of the bounces before it.
+    Returns the arrays (x, y, t) with t the travelled distance up to each collision.
+    '''
+    ks = np.asarray(ks, dtype=np.int64)
+    rad = np.deg2rad(alpha)
+    cx, cy = np.cos(rad), np.sin(rad)
+    ax, ay = abs(cx), abs(cy)
+
+    # distance (along each axis) to the first wall in flight direction
+    dx0 = width - x0 if cx > 0 else x0
+    dy0 = height - y0 if cy > 0 else y0
+
+    # the k-th event is min_i max(tx(i), ty(k-i)); the continuous optimum sits where both meet
+    with np.errstate(divide='ignore', invalid='ignore'):
+        i_star = ((dy0 + (ks-1)*height)/ay - (dx0 - width)/ax) / (width/ax + height/ay)
+    if ax == 0:
+        i_star = np.zeros(ks.shape)
+    elif ay == 0:
+        i_star = ks.astype(float)
+
+    candidates = np.floor(i_star).astype(np.int64)[..., None] + np.arange(-1, 3)
+    candidates = np.clip(candidates, 0, ks[..., None])
+    times = np.maximum(_crossingDistance(dx0, width, ax, candidates),
+                       _crossingDistance(dy0, height, ay, ks[..., None] - candidates))
+    best = np.argmin(times, axis=-1)[..., None]
+    i = np.take_along_axis(candidates, best, axis=-1)[..., 0]
+    j = ks - i
+    t = np.take_along_axis(times, best, axis=-1)[..., 0]
+    t = np.where(ks > 0, t, 0.)
+
+    # vertical wall hits lie exactly on 0 or width, the other coordinate is folded back
+    is_x = _crossingDistance(dx0, width, ax, i) >= _crossingDistance(dy0, height, ay, j)
+    is_y = (ks > 0) & ~is_x
+    is_x &= ks > 0
+
+    x = np.where(is_x, np.where((i % 2 == 1) == (cx > 0), width, 0), _fold(x0 + t*cx, width))
+    y = np.where(is_y, np.where((j % 2 == 1) == (cy > 0), height, 0), _fold(y0 + t*cy, height))
+
+    return x, y, t
+
+
+def bouncePoint(x0, y0, alpha, k, width, height):
+    '''
+    Jump directly to the k-th wall collision of a ray, returns (x, y).
+    '''
+    x, y, _ = unfoldedBouncePoints(x0, y0, alpha, [k], width, height)
+    return x[0], y[0]
+
+
+def unfoldedPathLength(x0, y0, alpha, n_bounces, width, height, end_point=None):
+    '''
+    Length of a ray path up to its n-th wall collision (plus an optional last segment to end_point).
+    '''
+    x, y, t = unfoldedBouncePoints(x0, y0, alpha, [n_bounces], width, height)
+    length = t[0]
+    if end_point is not None:
+        length += np.hypot(end_point[0] - x[0], end_point[1] - y[0])
+    return length
+
+
+def iterBouncePoints(x0, y0, alpha, n_bounces, width, height, start=0, reverse=False, chunk_size=4096):
+    '''
+    - start: first bounce index to produce (0 is the start point)
+    - reverse: produce the points from n_bounces down to start
+    ---------------------------------------
+    Generator over the collision points of one ray in (chunk_size, 2) arrays.
+    Memory stays bounded by chunk_size, no matter how many bounces are requested.
+    '''
+    bounds = range(start, n_bounces+1, chunk_size)
+    if reverse:
+        bounds = reversed(bounds)
+
+    for lo in bounds:
+        ks = np.arange(lo, min(lo + chunk_size, n_bounces+1))
+        if reverse:
+            ks = ks[::-1]
+        x, y, _ = unfoldedBouncePoints(x0, y0, alpha, ks, width, height)
+        yield np.column_stack((x, y))
+
+
+def iterPathData(chunks, **encoding):
+    '''
+    - chunks: iterable of (n, 2) point arrays, e.g. from iterBouncePoints
+    - encoding: precision, relative, shortcuts (see encodePathData)
+    ---------------------------------------
+    Generator over pieces of a svg path data string (Mx,y Lx,y ...).
+    '''
+    previous = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        yield encodePathData(chunk, previous=previous, **encoding)
+        previous = chunk[-1]
+
+
+
+def sampleSpray(shape, alpha_mean, alpha_std, length_mean, length_std, rng=None):
+    '''
+    Draw the angles and lengths of secondaries (normal distributed around the means).
+    - rng: np.random.Generator or seed (default: fresh entropy)
+    The lengths are signed: with a large length_std some are <= 0, those point backwards (see sprayEndpoints)
+    and are flagged in the PathSet of the secondaries, level_of_detail drops them.
+    '''
+    rng = np.random.default_rng(rng)
+    sec_alphas = alpha_mean + alpha_std*rng.standard_normal(np.atleast_1d(shape))
     sec_alphas[sec_alphas > 360] -= 360
 
+    sec_lengths = length_mean + length_std*rng.standard_normal(np.atleast_1d(shape))
+    return sec_alphas, sec_lengths
 
-    sec_lengths = length_mean + length_std*np.random.randn(n)
 
-    sec_paths = []
-    for s_a, s_l in zip(sec_alphas, sec_lengths):
-        y1 = y0 + np.sin(np.deg2rad(s_a)) * s_l
-        x1 = x0 + np.cos(np.deg2rad(s_a)) * s_l
-        
-        new_path = [[x0, x1], [y0, y1]]
-        sec_paths.append(new_path)
+def sprayEndpoints(x0, y0, alphas, lengths):
+    '''
+    Endpoints (..., 2) of secondaries starting at x0, y0, all computed in one array expression.
+    A negative length ends on the opposite side, the secondary points against its angle.
+    '''
+    rad = np.deg2rad(alphas)
+    return np.stack((x0 + np.cos(rad)*lengths, y0 + np.sin(rad)*lengths), axis=-1)
+
+
+def secondaryPaths(n, x0, y0, alpha1, alpha2, alpha_std=30, length_mean=50, length_std=10, rng=None):
+    alpha_mean = (alpha1 + alpha2)/2
+    alpha_mean -= 180 #flip
 
+    sec_alphas, sec_lengths = sampleSpray(n, alpha_mean, alpha_std, length_mean, length_std, rng=rng)
+
+    sec_paths = PathSet()
+    sec_paths.add_segments([x0, y0], sprayEndpoints(x0, y0, sec_alphas, sec_lengths), flags=sec_lengths <= 0)
+    return sec_paths
+
+
+def secondarySprays(points, alpha_means, n, alpha_std=30, length_mean=50, length_std=10, dtype=np.float64, rng=None):
+    '''
+    - points: (m, 2) contact points
+    - alpha_means: (m) mean angle of the spray at every point
+    - n: number of secondaries per point
+    - alpha_std, length_mean, length_std: scalars or one value per point
+    - rng: np.random.Generator or seed
+    ---------------------------------------
+    Batch variant of secondaryPaths: the sprays of all points are drawn and computed at once.
+    Returns a PathSet, the secondaries of point i are the paths [i*n, (i+1)*n).
+    '''
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    m = len(points)
+    column = lambda v: np.reshape(v, (-1, 1)) if np.ndim(v) else v
+
+    sec_alphas, sec_lengths = sampleSpray((m, n), column(alpha_means), column(alpha_std),
+                                          column(length_mean), column(length_std), rng=rng)
+    x0, y0 = points[:, :1], points[:, 1:]
+
+    sec_paths = PathSet(dtype=dtype)
+    sec_paths.add_segments(np.repeat(points, n, axis=0),
+                           sprayEndpoints(x0, y0, sec_alphas, sec_lengths).reshape(-1, 2), flags=sec_lengths <= 0)
     return sec_paths
 
 
@@ -103,7 +367,7 @@ def calculateAngle(A, Bstar):
 
 def calculatePathLength(coordinates):
     
-    coords = np.array(coordinates)
+    coords = np.asarray(coordinates)
     deltas = np.diff(coords, axis=1)
     
     distances = np.sqrt(np.sum(deltas**2, axis=0))
@@ -111,24 +375,98 @@ def calculatePathLength(coordinates):
     return np.sum(distances)
     
 
-def array2d_string(path_arr, inverse_direction=True):
-
-    x_arr = np.array(path_arr[0])
-    y_arr = np.array(path_arr[1])
-
+_TRAILING_ZERO = re.compile(r'\.0(?!\d)')
+
+def encodePathData(points, precision=3, relative=False, shortcuts=False, previous=None):
+    '''
+    - points: (n, 2) array of path points
+    - precision: decimals of the coordinates (0 snaps to the integer grid)
+    - relative: use relative l/h/v commands instead of absolute L/H/V
+    - shortcuts: use H/V for horizontal/vertical segments
+    - previous: last point of a preceding piece, the output then continues that path (no M)
+    ---------------------------------------
+    Format all coordinates of a path in one pass (linear in the number of points).
+    Numbers are written in their shortest form, '12.500' -> '12.5', '3.000' -> '3'.
+    '''
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) == 0:
+        return ''
+
+    # relative steps are taken between the rounded absolute points, so they never drift
+    rounded = np.round(points, precision) + 0.  # + 0. turns -0. into 0.
+    if previous is None:
+        head = 'M%r,%r' % tuple(rounded[0].tolist())
+        anchor, rounded = rounded[0], rounded[1:]
+    else:
+        head = ''
+        anchor = np.round(np.asarray(previous, dtype=float), precision) + 0.
+
+    steps = np.diff(np.vstack((anchor, rounded)), axis=0)
+    values = np.round(steps, precision) + 0. if relative else rounded
+
+    # the repr of a rounded float is its shortest decimal form
+    snippets = [' L%r,%r', ' H%r', ' V%r']
+    if relative:
+        snippets = [snippet.lower() for snippet in snippets]
+
+    if shortcuts:
+        # 0: L x,y  1: H x  2: V y
+        commands = np.zeros(len(values), dtype=np.int64)
+        commands[steps[:, 1] == 0] = 1
+        commands[(steps[:, 0] == 0) & (steps[:, 1] != 0)] = 2
+        template = ''.join(np.array(snippets)[commands].tolist())
+        values = values[np.column_stack((commands != 2, commands != 1))]
+    else:
+        template = snippets[0]*len(values)
+
+    content = head + template % tuple(values.ravel().tolist())
+    return _TRAILING_ZERO.sub('', content)
+
+
+def encodeSegments(starts, ends, precision=3, relative=False, shortcuts=False):
+    '''
+    - starts, ends: (n, 2) arrays, one straight two point path per row (e.g. the secondaries of sprays)
+    ---------------------------------------
+    Path data of all segments in one formatting pass, the same strings as encodePathData of every segment.
+    '''
+    starts = np.round(np.asarray(starts, dtype=float).reshape(-1, 2), precision) + 0.
+    ends = np.round(np.asarray(ends, dtype=float).reshape(-1, 2), precision) + 0.
+    if len(starts) == 0:
+        return []
+
+    steps = ends - starts
+    values = np.round(steps, precision) + 0. if relative else ends
+    snippets = ['M%r,%r L%r,%r\n', 'M%r,%r H%r\n', 'M%r,%r V%r\n']
+    if relative:
+        snippets = [snippet.replace(' L', ' l').replace(' H', ' h').replace(' V', ' v') for snippet in snippets]
+
+    commands = np.zeros(len(steps), dtype=np.int64)
+    if shortcuts:
+        commands[steps[:, 1] == 0] = 1
+        commands[(steps[:, 0] == 0) & (steps[:, 1] != 0)] = 2
+    template = ''.join(np.array(snippets)[commands].tolist())
+    values = np.column_stack((starts, values))[np.column_stack((commands >= 0, commands >= 0, commands != 2, commands != 1))]
+
+    return _TRAILING_ZERO.sub('', template % tuple(values.tolist())).split('\n')[:-1]
+
+
+def array2d_string(path_arr, inverse_direction=True, **encoding):
+    '''
+    - path_arr: (2, n) x and y values of a path
+    - encoding: precision, relative, shortcuts (see encodePathData)
+    '''
+    points = np.asarray(path_arr).T
     if inverse_direction:
-        x_arr = x_arr[::-1]
-        y_arr = y_arr[::-1]
+        points = points[::-1]
 
-    content = f'M{x_arr[0]},{y_arr[0]}'
-    for px, py in zip(x_arr[1:], y_arr[1:]):
-        content += f' L{px:.3f},{py:.3f}'
-        
-    return content
+    return encodePathData(points, **encoding)
 
 
-def line2svgPath(d, identifier, color='#ffffff', stroke_width=2, begin=0, dur=3, stroke_max=1000, fill='none', animate=True):
+def line2svgPath(d, identifier, color='#ffffff', stroke_width=2, begin=0, dur=3, stroke_max=1000, fill='none', animate=True,
+                fill_rule=None):
     line = f'<path d="{d}"\n  stroke="{color}" stroke-width="{stroke_width}" fill="{fill}"'
+    if fill_rule is not None:
+        line += f' fill-rule="{fill_rule}"'
 
     if animate:
         #growing animation
@@ -165,6 +503,33 @@ def primary2Path(d, color='#ffffff', stroke_width=2, begin=0, dur=3, dur_fade= 1
     return line
 
 
+def streamPrimary2Path(file, x0, y0, alpha, n_bounces, width, height, end_point=None, chunk_size=4096, encoding={},
+                       css_class=None, **style):
+    '''
+    - file: writable text file object
+    - x0, y0, alpha, n_bounces: the ray (as in calculatePrimaryPaths), end_point: optional last point
+    - encoding: path data options (see encodePathData), style: keyword arguments of primary2Path
+    - css_class: write a path of the css backend with this class instead (style: only an optional color)
+    ---------------------------------------
+    Write the primary2Path element of a very long ray without building its path data in memory.
+    The points come from the closed form iterBouncePoints in inverse direction (like array2d_string).
+    '''
+    length = unfoldedPathLength(x0, y0, alpha, n_bounces, width, height, end_point)
+    if css_class is None:
+        head, tail = primary2Path(d='_PATH_', stroke_max=length, **style).split('_PATH_')
+    else:
+        head, tail = cssPath('_PATH_', css_class, length, style.get('color')).split('_PATH_')
+
+    chunks = iterBouncePoints(x0, y0, alpha, n_bounces, width, height, reverse=True, chunk_size=chunk_size)
+    if end_point is not None:
+        chunks = itertools.chain([np.array([end_point], dtype=float)], chunks)
+
+    file.write(head)
+    for piece in iterPathData(chunks, **encoding):
+        file.write(piece)
+    file.write(tail)
+
+
 def secondary2Path(d, color='#00c666', stroke_width=2, dur=3, dur_fade= 1.0, dur_freeze=1.5, stroke_max=1000, fill='none', animate=True):
     line = f'<path d="{d}"\n  stroke="{color}" stroke-width="{stroke_width}" fill="{fill}"'
 
@@ -190,16 +555,349 @@ def secondary2Path(d, color='#00c666', stroke_width=2, dur=3, dur_fade= 1.0, dur
 
 
 
+def secondaryGroup2Path(d_strings, lengths, color='#00c666', stroke_width=2, dur=3, dur_fade=1.0,
+                        grow_begin='primarygrow.end', fade_begin='primarygrow.end+1.5s',
+                        reset_begin='secondaryfade.end-0.001s', grow_id='secondarygrow', fade_id='secondaryfade',
+                        colors=None, merge=False, timeline=None):
+    '''
+    - d_strings, lengths: path data and length of every secondary of a collision
+    - colors: optional color per secondary (overrides color, prevents merging)
+    - merge: draw all secondaries as subpaths of one single path (uniform style only)
+    - timeline: optional (keyframes, begin, period), looping animations instead of the begin chain (see timeline.py)
+    ---------------------------------------
+    All secondaries share one set of animations instead of four per path.
+    Grouped: the animations run on a <g>; stroke-dasharray/-dashoffset are inherited and every path
+    is normalized with pathLength="1", so each one still grows over the whole duration.
+    Merged: one multi-subpath <path>; the dashing restarts at every subpath, so all subpaths grow
+    at the same speed and only the longest one takes the whole duration.
+    Returns the svg string and its number of elements.
+    '''
+    if len(d_strings) == 0:
+        return '', 0
+
+    merge = merge and colors is None
+    dash = max(lengths) if merge else 1
+
+    if timeline is None:
+        animations = (f'<animate id="{grow_id}" attributeName="stroke-dashoffset" from="{dash}" to="0" begin="{grow_begin}" dur="{dur}s" fill="freeze"/>\n'
+                      f'<animate id="{fade_id}" attributeName="opacity" from="1" to="0" begin="{fade_begin}" dur="{dur_fade}s" fill="freeze"/>\n'
+                      f'<set attributeName="stroke-dashoffset" to="{dash}" begin="{reset_begin}"/>\n'
+                      f'<set attributeName="opacity" to="1" begin="{reset_begin}"/>\n')
+    else:
+        animations = loopAnimations(*timeline[:3], length=dash)
+    n_animations = animations.count('\n')
+    style = f'stroke="{color}" stroke-width="{stroke_width}" fill="none" stroke-dasharray="{dash}" stroke-dashoffset="{dash}"'
+
+    if merge:
+        return f'<path d="{" ".join(d_strings)}"\n  {style}>\n{animations}</path>', 1 + n_animations
+
+    group = [f'<g {style}>\n', animations]
+    if colors is None:
+        group += [f'<path d="{d}" pathLength="1"/>\n' for d in d_strings]
+    else:
+        group += [f'<path d="{d}" pathLength="1" stroke="{c}"/>\n' for d, c in zip(d_strings, colors)]
+    group.append('</g>')
+
+    return ''.join(group), 1 + n_animations + len(d_strings)
+
+
+def reportGrouping(report):
+    print(f"Secondaries: {report['secondaries']} paths, "
+          f"{report['nodes_ungrouped']} -> {report['nodes']} elements, "
+          f"{report['bytes_ungrouped']} -> {report['bytes']} bytes")
+
+
+
+
+PATH_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'path_template.txt')
+# absolute begin and looping keyTimes instead of syncbase chains (see timeline.py)
+LOOP_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'path_template_loop.txt')
+
+
+class PathTemplate:
+    '''
+    Template text with _NAME_ placeholder slots (e.g. _STROKE-BEGIN_), parsed once.
+    Slots are addressed by lower case keywords: _STROKE-BEGIN_ -> stroke_begin.
+    Filling is a single str.format pass; partial() binds slots shared by many paths ahead of time.
+    '''
+    _SLOT = re.compile(r'_([A-Z][A-Z-]*)_')
+
+    def __init__(self, text):
+        pieces = self._SLOT.split(text)
+        self._compile(pieces[0::2], [name.lower().replace('-', '_') for name in pieces[1::2]])
+
+    def _compile(self, literals, slots):
+        self.literals = literals
+        self.slots = slots
+        # literal braces are escaped, every slot becomes a named format field
+        escaped = [literal.replace('{', '{{').replace('}', '}}') for literal in literals]
+        self._format = escaped[0] + ''.join(f'{{{slot}}}{literal}' for slot, literal in zip(slots, escaped[1:]))
+
+    def fill(self, **values):
+        return self._format.format_map(values)
+
+    def partial(self, **values):
+        '''
+        New template with the given slots filled in, the remaining ones stay open.
+        '''
+        literals, slots = [self.literals[0]], []
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            if slot in values:
+                literals[-1] += str(values[slot]) + literal
+            else:
+                slots.append(slot)
+                literals.append(literal)
+
+        compiled = PathTemplate.__new__(PathTemplate)
+        compiled._compile(literals, slots)
+        return compiled
+
+
+_template_cache = {}
+
+def loadPathTemplate(template_path=PATH_TEMPLATE):
+    '''
+    Compiled PathTemplate of a file, cached by absolute path and modification time.
+    '''
+    template_path = os.path.abspath(template_path)
+    key = (template_path, os.stat(template_path).st_mtime_ns)
+    if key not in _template_cache:
+        with open(template_path) as template_file:
+            _template_cache[key] = PathTemplate(template_file.read())
+    return _template_cache[key]
+
+
+
+class SvgMinifier:
+    '''
+    Streaming whitespace removal: runs of whitespace become one space, and none is left next to
+    tags ('<', '>', '/>'). The documents have no text content where whitespace matters, so this is lossless.
+    Fragments can be split anywhere (e.g. path data written piece by piece), end() returns what is held back.
+    '''
+    # after collapsing whitespace to single spaces, the spaces next to tags go
+    _TIGHTEN = [(' />', '/>'), (' >', '>'), ('> ', '>'), (' <', '<')]
+
+    def __init__(self):
+        self.pending = False  # the last fragment ended in whitespace that is not written yet
+        self.last = ''
+        self.carry = ''  # a trailing '/' could be the start of '/>'
+
+    def feed(self, fragment):
+        fragment, self.carry = self.carry + fragment, ''
+        if fragment.endswith('/'):
+            fragment, self.carry = fragment[:-1], '/'
+        words = fragment.split()
+        if not words:
+            self.pending = self.pending or bool(fragment)
+            return ''
+        space = self.pending or fragment[0].isspace()
+        self.pending = fragment[-1].isspace()
+        text = ' '.join(words)
+        for old, new in self._TIGHTEN:
+            text = text.replace(old, new)
+
+        if space and self.last not in ('', '>') and not text.startswith(('<', '>', '/>')):
+            text = ' ' + text
+        self.last = text[-1]
+        return text
+
+    def end(self):
+        carry, self.carry = self.carry, ''
+        return (' ' if self.pending and carry and self.last not in ('', '>') else '') + carry
+
+
+def minifySvg(text):
+    '''whitespace free version of a complete svg document (see SvgMinifier)'''
+    minifier = SvgMinifier()
+    return minifier.feed(text) + minifier.end()
+
+
+
+class SvgWriter:
+    '''
+    Buffered svg output: fragments are collected and handed to the file object in chunks
+    of about chunk_size characters. Works with text targets (files, sys.stdout, io.StringIO)
+    and binary targets (io.BytesIO, gzip streams, socket.makefile('wb'), ...).
+    - stats: optional RenderStats, the time spent in the file object is counted as 'file writing'
+    - minify: strip the whitespace of all fragments on the way (see SvgMinifier)
+    '''
+    def __init__(self, file, chunk_size=1<<16, encoding='utf-8', stats=NO_STATS, minify=False):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.binary = isBinaryFile(file)
+        self.bytes_written = 0
+        self.stats = stats
+        self.minifier = SvgMinifier() if minify else None
+
+        self._parts = []
+        self._size = 0
+
+    def write(self, fragment):
+        if self.minifier is not None:
+            fragment = self.minifier.feed(fragment)
+        self._parts.append(fragment)
+        self._size += len(fragment)
+        if self._size >= self.chunk_size:
+            self._writeChunk()
+
+    def flush(self):
+        '''
+        Hand everything written so far to the file object (at the end of the document).
+        '''
+        if self.minifier is not None:
+            self._parts.append(self.minifier.end())
+        self._writeChunk()
+
+    def _writeChunk(self):
+        if not self._parts:
+            return
+        with self.stats.span('file writing'):
+            chunk = ''.join(self._parts)
+            if self.binary:
+                chunk = chunk.encode(self.encoding)
+            self.file.write(chunk)
+        self.bytes_written += len(chunk)
+        self.stats.count('bytes written', len(chunk))
+
+        self._parts = []
+        self._size = 0
+
+
+def isBinaryFile(file):
+    if isinstance(file, io.TextIOBase):
+        return False
+    if isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    mode = getattr(file, 'mode', '')
+    return isinstance(mode, str) and 'b' in mode
+
+
+def checkBackend(backend, grouped=False):
+    if backend not in ('smil', 'css'):
+        raise ValueError(f"backend must be 'smil' or 'css', not {backend!r}")
+    if backend == 'css' and grouped:
+        raise ValueError('group_secondaries and merge_secondaries only apply to the smil backend')
+
+
+@contextlib.contextmanager
+def openSvgTarget(target, compresslevel=9):
+    '''
+    Open a file name for writing, file objects are passed through (and left open).
+    Names ending in .svgz are gzip compressed on the fly with compresslevel (1 fastest - 9 smallest).
+    '''
+    if isinstance(target, (str, os.PathLike)) and os.fspath(target).endswith('.svgz'):
+        import gzip
+        # mtime=0: the same document always gives the same file
+        with gzip.GzipFile(target, 'wb', compresslevel=compresslevel, mtime=0) as file:
+            yield file
+    elif isinstance(target, (str, os.PathLike)):
+        with open(target, 'w') as file:
+            yield file
+    else:
+        yield target
+
+
+def writeSvgData(target, data, compresslevel=9):
+    '''
+    Copy a finished utf-8 document (e.g. from a RenderCache) to a file name or file object.
+    '''
+    with openSvgTarget(target, compresslevel) as file:
+        file.write(data if isBinaryFile(file) else data.decode('utf-8'))
+
+
+def svgHeader(width, height, relative_margin, background_color, box_color, table=None):
+    '''
+    Start of a document: svg tag, background, the scaled group and the surrounding box.
+    - table: optional tables.Table, drawn instead of the box (its obstacles are left out)
+    '''
+    header = f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n\n'
+
+    # background box
+    d_box = f'M0,0 L{width},0 L{width},{height} L0,{height} Z'
+    header += line2svgPath(d=d_box, identifier='box',
+                           color=background_color, stroke_width=0, animate=False, fill=background_color)
+    header += '\n\n'
+
+    # rescaling and translation to center
+    scale_w = 1 - relative_margin
+    scale_h = round(1 - width * relative_margin / height, 3)
+    translation = relative_margin*width/2
+    header += f'<g transform="scale({scale_w},{scale_h}) translate({translation}, {translation})"> \n\n'
+
+    # surrounding box
+    fill_rule = None
+    if table is not None:
+        d_box = table.pathData()
+        fill_rule = 'evenodd' if len(table.rings) > 1 else None
+    header += line2svgPath(d=d_box, identifier='box',
+                           color=box_color, stroke_width=0.5, animate=False, fill=box_color, fill_rule=fill_rule)
+    header += '\n\n'
+
+    return header
+
+
+
+
+def plotTable(ax, width, height, table=None):
+    '''outline of the box or of every polygon of the table'''
+    if table is None:
+        ax.plot([0, width, width, 0, 0], [0, 0, height, height, 0], color='k')
+        return
+    for ring in table.rings:
+        ring = np.vstack((ring, ring[:1]))
+        ax.plot(ring[:, 0], ring[:, 1], color='k')
+
+
+def plotSegments(path_set, max_points=None):
+    '''
+    - path_set: PathSet, max_points: optional decimation of longer paths (first and last point are kept)
+    ---------------------------------------
+    Lines of a PathSet for a matplotlib LineCollection: a (n, 2, 2) array if all paths are
+    straight segments, else a list of (n_i, 2) views.
+    '''
+    n_points = np.diff(path_set.offsets)
+    if len(n_points) and (n_points == 2).all():
+        return path_set.coords.reshape(-1, 2, 2)
+
+    lines = []
+    for i, n in enumerate(n_points):
+        points = path_set.points(i)
+        if max_points is not None and n > max_points:
+            keep = np.unique(np.linspace(0, n - 1, max_points).astype(np.int64))
+            points = points[keep]
+        lines.append(points)
+    return lines
+
+
+
+
 class CollisionBuider:
-    def __init__(self, width, height, point_of_contact, incoming_angles=[], relative_margin=0.05):
+    def __init__(self, width, height, point_of_contact, incoming_angles=[], relative_margin=0.05, dtype=np.float64,
+                 seed=None, stats=None, table=None):
+        '''
+        - seed: None, int, np.random.SeedSequence or np.random.Generator (see seedSequence)
+        - stats: optional RenderStats (see profiling.py) collecting the time of every stage
+        - table: optional tables.Table (polygon with obstacles inside width x height) instead of the box,
+          its edge labels are the walls of addPrimaryFrom
+        '''
         self.width = width
         self.height = height 
         self.point_of_contact = point_of_contact
         self.incoming_angles = incoming_angles
         self.relative_margin = relative_margin
 
-        self.primary_paths = []
-        self.secondary_paths = []
+        # one stream for the geometry, one for the random colors (restarted on every write)
+        self.seed_sequence = seedSequence(seed)
+        geometry_seed, self.color_seed = self.seed_sequence.spawn(2)
+        self.rng = np.random.default_rng(geometry_seed)
+
+        # array backed storage, path i is a (2, n) view: primary_paths[i][0] -> x values
+        self.primary_paths = PathSet(dtype=dtype)
+        self.secondary_paths = PathSet(dtype=dtype)
+        self.streamed_primaries = []
+        self.stats = NO_STATS if stats is None else stats
+        self.table = table
 
 
     def setStyle(self, collision_index, primary_color='#ffffff', secondary_color='#00c666',
@@ -223,48 +921,94 @@ class CollisionBuider:
 
 
 
-    def calculatePrimaryPaths(self, n_bounces):
+    def calculatePrimaryPaths(self, n_bounces, incoming_angles=None, end_point=None):
+        '''
+        - n_bounces: int or one number of wall collisions per angle
+        - incoming_angles: angles to trace (default: self.incoming_angles)
+        - end_point: optional last point appended to every path
+        '''
+        if incoming_angles is None:
+            incoming_angles = self.incoming_angles
         if type(n_bounces) == int:
-            n_bounces = [n_bounces]* len(self.incoming_angles)
-        
-        for n, alpha in zip(n_bounces, self.incoming_angles):
-            x_path, y_path = [self.point_of_contact[0]], [self.point_of_contact[1]]
-            
-            for i in range(int(n)):
-                xi, yi, alpha = newCollsionPoint(x_path[-1], y_path[-1], alpha, self.width, self.height)
-                x_path.append(xi)
-                y_path.append(yi)
-            self.primary_paths.append([x_path, y_path])
+            n_bounces = [n_bounces]* len(incoming_angles)
+
+        n_bounces = [int(n) for n, _ in zip(n_bounces, incoming_angles)]
+        if not n_bounces:
+            return
+
+        with self.stats.span('primary geometry'):
+            # all rays are traced together up to the longest one and cut afterwards
+            if self.table is None:
+                coords = bouncePaths(self.point_of_contact[0], self.point_of_contact[1],
+                                     incoming_angles[:len(n_bounces)], max(n_bounces),
+                                     self.width, self.height)
+            else:
+                coords = self.table.bouncePaths(self.point_of_contact[0], self.point_of_contact[1],
+                                                incoming_angles[:len(n_bounces)], max(n_bounces))
+
+            paths = [path[:n+1] for n, path in zip(n_bounces, coords)]
+            if end_point is not None:
+                paths = [np.vstack((path, end_point)) for path in paths]
+            self.primary_paths.extend(paths)
+
+        self.stats.count('primary paths', len(paths))
+        self.stats.count('primary points', sum(len(path) for path in paths))
 
 
     def calculateSecondaryPaths(self, n_secondaries, alpha_std=30, length_mean=10, length_std=2):
         
-        alpha_mean = np.mean(self.incoming_angles) + 180
-        sec_alphas = alpha_mean + alpha_std*np.random.randn(n_secondaries)
-        sec_alphas[sec_alphas > 360] -= 360
+        with self.stats.span('secondary sampling'):
+            alpha_mean = np.mean(self.incoming_angles) + 180
+            sec_alphas, sec_lengths = sampleSpray(n_secondaries, alpha_mean, alpha_std, length_mean, length_std, rng=self.rng)
 
-        sec_lengths = length_mean + length_std*np.random.randn(n_secondaries)
+            x0, y0 = self.point_of_contact[0], self.point_of_contact[1]
+            self.secondary_paths.add_segments([x0, y0], sprayEndpoints(x0, y0, sec_alphas, sec_lengths),
+                                              flags=sec_lengths <= 0)
 
-        for s_a, s_l in zip(sec_alphas, sec_lengths):
-            x1 = self.point_of_contact[0] + np.cos(np.deg2rad(s_a)) * s_l
-            y1 = self.point_of_contact[1] + np.sin(np.deg2rad(s_a)) * s_l
-            
-            new_path = [[self.point_of_contact[0], x1], [self.point_of_contact[1], y1]]
-            self.secondary_paths.append(new_path)
+        self.stats.count('secondary paths', n_secondaries)
 
 
-    def addPrimaryFrom(self, start_pos, wall_collisions):
+    def levelOfDetail(self, min_length=1.0, display_width=None, max_overlap=0.5, max_elements=None, max_bytes=None,
+                      report=False, **svg_options):
+        '''
+        - min_length: drop secondaries shorter than this many pixels
+        - display_width: width in pixels the document is shown at (default: width)
+        - max_overlap: drop secondaries covered by longer ones by more than this fraction (None: keep them)
+        - max_elements, max_bytes: budget of the document written with svg_options (write_svg arguments)
+        - report: print what was removed
+        ---------------------------------------
+        Remove the secondaries that are not worth their elements (see level_of_detail.py).
+        The report is returned and kept in self.lod_report.
+        '''
+        pixel_size = self.width/(display_width or self.width)/(1 - self.relative_margin)
+        self.lod_report = cullSecondaries([self], lambda: self.to_svg_bytes(**svg_options), min_length, pixel_size,
+                                          svg_options.get('secondary_stroke_width', 1), max_overlap,
+                                          max_elements, max_bytes, measure=report,
+                                          precision=svg_options.get('precision', 3))
+        if report:
+            reportCulling(self.lod_report)
+        return self.lod_report
+
+
+    def addPrimaryFrom(self, start_pos, wall_collisions, check_routes=False):
         '''
         - start_pos: a (x, y)
-        - wall collisions: Combination of "A", "B", "C", "D" [[path1], [path2], ...] (in time-forward order)
+        - wall collisions: Combination of "A", "B", "C", "D" [[path1], [path2], ...] (in time-forward order),
+          the edge labels of self.table if there is one
+        - check_routes: with a table, raise a ValueError for routes that do not hit these walls (see tableRoute)
         ---------------------------------------
         Calculate and Save the path(s) to be taken from start_pos (a) -> point_of_collision (b)
         '''
 
-        n_bounces = []
+        n_bounces, start_alphas = [], []
         # allow multiple paths to be computed
         for this_wall_collision_path in wall_collisions:
 
+            if self.table is not None:
+                start_alphas.append(self.tableRoute(start_pos, this_wall_collision_path, check=check_routes))
+                n_bounces.append(len(this_wall_collision_path))
+                continue
+
             # calculate virtual endpoint
             virtual_end_pos = start_pos.copy()
             for coll in this_wall_collision_path[::-1]:
@@ -274,154 +1018,306 @@ class CollisionBuider:
             # calculate angle going out from a, aimed at virtual b
             start_alpha = calculateAngle(self.point_of_contact, virtual_end_pos)
 
-            self.incoming_angles.append(start_alpha)
+            start_alphas.append(start_alpha)
             n_bounces.append(len(this_wall_collision_path))
 
+        self.incoming_angles.extend(start_alphas)
+
+        # compute the paths of collision, need to add a last point: b
+        self.calculatePrimaryPaths(n_bounces, start_alphas, end_point=start_pos)
 
-        # compute the paths of collision
-        self.calculatePrimaryPaths(n_bounces)
 
-        # need to add a last point: b
-        for i in range(len(self.primary_paths)):
-            self.primary_paths[i][0].append(start_pos[0])
-            self.primary_paths[i][1].append(start_pos[1])
 
 
+    def tableRoute(self, start_pos, walls, check=True):
+        '''
+        Angle of the ray leaving point_of_contact that runs the route start_pos -> walls -> point_of_contact
+        on self.table backwards (mirror images at the edge lines, as for the box).
+        check: the mirror image is only a candidate, the traced ray has to hit the same edges and then
+        see start_pos (ValueError otherwise, e.g. behind an obstacle or past the end of an edge).
+        '''
+        alpha = self.table.routeAngle(start_pos, self.point_of_contact, walls)
+        if not check:
+            return alpha
+        coords, edges = self.table.bouncePaths(self.point_of_contact[0], self.point_of_contact[1], [alpha],
+                                               len(walls), return_edges=True)
+        if not self.table.checkRoute(coords[0], edges[0], walls, start_pos):
+            raise ValueError(f'the route {list(walls)} from {list(start_pos)} is not possible on this table')
+        return alpha
+
 
 
-    def plotResult(self):
-        plt.figure(figsize=(10, self.height/self.width*10))
-        plt.plot([0, self.width, self.width, 0, 0], [0, 0, self.height, self.height, 0], color='k')
-        for primary_path in self.primary_paths:
-            plt.plot(*primary_path, color='blue', linewidth=2)
+    def plotResult(self, max_points=None, ax=None, show=True):
+        '''
+        - max_points: decimate longer primaries to about this many points (only the plot)
+        - ax: draw into these matplotlib axes instead of a new figure
+        ---------------------------------------
+        Debug plot, all primaries and all secondaries are one line collection each.
+        '''
+        # plotting is optional, matplotlib is only loaded here
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
 
-        for secondary_path in self.secondary_paths:
-            plt.plot(*secondary_path, color='orange', linewidth=1)
+        if ax is None:
+            _, ax = plt.subplots(figsize=(10, self.height/self.width*10))
+        plotTable(ax, self.width, self.height, self.table)
 
-        plt.show()
+        ax.add_collection(LineCollection(plotSegments(self.primary_paths, max_points), colors='blue', linewidths=2))
+        ax.add_collection(LineCollection(plotSegments(self.secondary_paths), colors='orange', linewidths=1))
+        ax.autoscale_view()
 
-        
+        if show:
+            plt.show()
+        return ax
 
-    def to_svg(self, name, primary_color='#ffffff', secondary_color='#00c666',
-                primary_stroke_width=2, secondary_stroke_width=1,
-                  primary_duration=2, secondary_duration=1, primary_begin=0, 
-                  dur_fade_primary=1.0, dur_fade_secondary=0.5, dur_freeze_secondary=1.0,
-                  background_color='#dc7474', box_color='#3c3c3c'):
         
-        
-        secondary_begin = (primary_duration + primary_begin)
-
-        #begin the string
-        total_string = f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" viewBox="0 0 {self.width} {self.height}">\n\n'
 
+    def addStreamedPrimary(self, alpha, n_bounces, end_point=None):
+        '''
+        - alpha: angle of the ray leaving point_of_contact, n_bounces: number of wall collisions
+        ---------------------------------------
+        Register a (very long) primary that is not stored, but evaluated in closed form
+        and streamed into the document by write_svg (see streamPrimary2Path).
+        '''
+        if self.table is not None:
+            raise ValueError('streamed primaries are evaluated in closed form, only for the box without a table')
+        self.streamed_primaries.append((alpha, int(n_bounces), end_point))
 
 
-        # background box
-        d_box = f'M0,0 L{self.width},0 L{self.width},{self.height} L0,{self.height} Z'
-        box_string = line2svgPath(d=d_box, identifier='box',
-                                  color=background_color, stroke_width=0, animate=False, fill=background_color)
-        total_string += box_string + '\n\n'   
 
+    def to_svg(self, name, compresslevel=9, **kwargs):
+        '''
+        - name: file name (.svgz: gzip compressed with compresslevel) or writable (text or binary) file object
+        - kwargs: style parameters, see write_svg
+        '''
+        with openSvgTarget(name, compresslevel) as file:
+            self.write_svg(file, **kwargs)
 
-        # rescaling and translation to center
-        scale_w = 1 - self.relative_margin
-        scale_h = round(1 - self.width * self.relative_margin / self.height, 3)
-        translation = self.relative_margin*self.width/2
-        total_string += f'<g transform="scale({scale_w},{scale_h}) translate({translation}, {translation})"> \n\n'
+        if isinstance(name, (str, os.PathLike)):
+            print(f'Writen to {name}!')
 
 
-        # surrounding box
-        d_box = f'M0,0 L{self.width},0 L{self.width},{self.height} L0,{self.height} Z'
-        box_string = line2svgPath(d=d_box, identifier='box',
-                                  color=box_color, stroke_width=0.5, animate=False, fill=box_color)
-        total_string += box_string + '\n\n'   
+    def to_svg_bytes(self, **kwargs):
+        '''
+        Render the svg document into memory and return it as utf-8 bytes.
+        '''
+        buffer = io.BytesIO()
+        self.write_svg(buffer, **kwargs)
+        return buffer.getvalue()
 
 
+    def pathArrays(self):
+        '''
+        The raw buffers of primaries and secondaries (see PathSet.from_arrays), e.g. to store in a RenderCache.
+        '''
+        return {'primary_coords': self.primary_paths.coords, 'primary_offsets': self.primary_paths.offsets,
+                'secondary_coords': self.secondary_paths.coords, 'secondary_offsets': self.secondary_paths.offsets}
 
-        # loop over primary paths
-        for primary_path in self.primary_paths:
-            # this is the path as a string of Mx,y Lx,y ...
-            d_string = array2d_string(primary_path, inverse_direction=True)
-            total_length = calculatePathLength(primary_path)
 
-            if primary_color == '0':
-                col = hsl_to_hex(np.random.rand(), 1, 0.5)
-            else:
-                col = primary_color
+    def write_svg(self, file, primary_color='#ffffff', secondary_color='#00c666',
+                primary_stroke_width=2, secondary_stroke_width=1,
+                  primary_duration=2, secondary_duration=1, primary_begin=0, 
+                  dur_fade_primary=1.0, dur_fade_secondary=0.5, dur_freeze_secondary=1.0,
+                  background_color='#dc7474', box_color='#3c3c3c', chunk_size=1<<16,
+                  precision=3, relative=False, shortcuts=False,
+                  group_secondaries=False, merge_secondaries=False, report=False, backend='smil', minify=False):
+        '''
+        Stream the svg document fragment by fragment to a text or binary file object.
+        - precision, relative, shortcuts: path data encoding (see encodePathData)
+        - group_secondaries, merge_secondaries: shared secondary animations (see secondaryGroup2Path)
+        - report: print the element and byte reduction of the grouped secondaries
+        - backend: 'smil' (<animate> elements in every path) or 'css' (shared classes and @keyframes,
+          see css_backend.py; every secondary stays its own path, no grouping)
+        - minify: no whitespace between and inside the elements (see SvgMinifier)
+        '''
+        checkBackend(backend, group_secondaries or merge_secondaries)
+        stats = self.stats
+        writer = SvgWriter(file, chunk_size=chunk_size, stats=stats, minify=minify)
+        encoding = dict(precision=precision, relative=relative, shortcuts=shortcuts)
+        color_rng = np.random.default_rng(self.color_seed)
+
+        #begin the document: header, background and surrounding box
+        with stats.span('template filling'):
+            writer.write(svgHeader(self.width, self.height, self.relative_margin, background_color, box_color, self.table))
+
+        if backend == 'css':
+            self.writeCssBody(writer, color_rng, encoding, primary_color=primary_color, secondary_color=secondary_color,
+                              primary_stroke_width=primary_stroke_width, secondary_stroke_width=secondary_stroke_width,
+                              primary_duration=primary_duration, secondary_duration=secondary_duration,
+                              primary_begin=primary_begin, dur_fade_primary=dur_fade_primary,
+                              dur_fade_secondary=dur_fade_secondary, dur_freeze_secondary=dur_freeze_secondary)
+            writer.write('</g>\n\n</svg>')
+            writer.flush()
+            return
+
+
+        # primary paths as strings of Mx,y Lx,y ...
+        with stats.span('path encoding'):
+            d_strings = [array2d_string(primary_path, inverse_direction=True, **encoding) for primary_path in self.primary_paths]
+
+        with stats.span('template filling'):
+            for d_string, total_length in zip(d_strings, self.primary_paths.lengths()):
+                if primary_color == '0':
+                    col = randomColor(color_rng)
+                else:
+                    col = primary_color
             
-            path_string = primary2Path(d=d_string,
-                                       color=col, stroke_width=primary_stroke_width,
-                                       begin=primary_begin, dur=primary_duration, stroke_max=total_length,
-                                         animate=True, dur_fade=dur_fade_primary)
+                path_string = primary2Path(d=d_string,
+                                           color=col, stroke_width=primary_stroke_width,
+                                           begin=primary_begin, dur=primary_duration, stroke_max=total_length,
+                                             animate=True, dur_fade=dur_fade_primary)
             
-            total_string += path_string + '\n\n\n'
-
-
-        # loop over secondary paths
-        for secondary_path in self.secondary_paths:
-            # this is the path as a string of Mx,y Lx,y ...
-            d_string = array2d_string(secondary_path, inverse_direction=False)
-            total_length = calculatePathLength(secondary_path)
-
-
+                writer.write(path_string + '\n\n\n')
+
+
+        # primaries evaluated in closed form, their path data never exists as a whole
+        with stats.span('path encoding'):
+            for alpha, n_bounces, end_point in self.streamed_primaries:
+                col = randomColor(color_rng) if primary_color == '0' else primary_color
+                streamPrimary2Path(writer, self.point_of_contact[0], self.point_of_contact[1], alpha, n_bounces,
+                                   self.width, self.height, end_point=end_point, encoding=encoding,
+                                   color=col, stroke_width=primary_stroke_width,
+                                   begin=primary_begin, dur=primary_duration, animate=True, dur_fade=dur_fade_primary)
+                writer.write('\n\n\n')
+
+
+        with stats.span('path encoding'):
+            lengths = self.secondary_paths.lengths()
+            d_strings = [array2d_string(path, inverse_direction=False, **encoding) for path in self.secondary_paths]
+
+        # secondaries of the collision in one group (or one merged path) with shared animations
+        if group_secondaries or merge_secondaries:
+            with stats.span('template filling'):
+                colors = [randomColor(color_rng) for _ in d_strings] if secondary_color == '0' else None
+
+                group_string, n_nodes = secondaryGroup2Path(d_strings, lengths, color=secondary_color,
+                                                            stroke_width=secondary_stroke_width, dur=secondary_duration,
+                                                            dur_fade=dur_fade_secondary,
+                                                            fade_begin=f'primarygrow.end+{dur_freeze_secondary}s',
+                                                            colors=colors, merge=merge_secondaries)
+                writer.write(group_string + '\n\n')
+
+            if report:
+                ungrouped = [secondary2Path(d=d, color=colors[i] if colors else secondary_color,
+                                            stroke_width=secondary_stroke_width, dur=secondary_duration,
+                                            stroke_max=length, animate=True,
+                                            dur_fade=dur_fade_secondary, dur_freeze=dur_freeze_secondary) + '\n\n'
+                             for i, (d, length) in enumerate(zip(d_strings, lengths))]
+                self.secondary_report = {'secondaries': len(d_strings),
+                                         'nodes': n_nodes, 'nodes_ungrouped': 5*len(d_strings),
+                                         'bytes': len(group_string) + 2, 'bytes_ungrouped': sum(map(len, ungrouped))}
+                reportGrouping(self.secondary_report)
 
-
-            if secondary_color == '0':
-                col = hsl_to_hex(np.random.rand(), 1, 0.5)
-            else:
-                col = secondary_color
+        else:
+            # loop over secondary paths
+            with stats.span('template filling'):
+                for d_string, total_length in zip(d_strings, lengths):
+                    if secondary_color == '0':
+                        col = randomColor(color_rng)
+                    else:
+                        col = secondary_color
             
 
-            path_string = secondary2Path(d=d_string, 
-                                       color=col, stroke_width=secondary_stroke_width,
-                                       dur=secondary_duration,stroke_max=total_length,
-                                    animate=True, dur_fade=dur_fade_secondary, dur_freeze=dur_freeze_secondary)
+                    path_string = secondary2Path(d=d_string, 
+                                               color=col, stroke_width=secondary_stroke_width,
+                                               dur=secondary_duration,stroke_max=total_length,
+                                            animate=True, dur_fade=dur_fade_secondary, dur_freeze=dur_freeze_secondary)
             
-            total_string += path_string + '\n\n'
+                    writer.write(path_string + '\n\n')
 
 
-        #end the string
-        total_string += '</g>\n\n</svg>'
-
-        # write
-        with open(name, 'w') as file:
-            file.write(total_string)
-        
-        print(f'Writen to {name}!')
+        #end the document
+        writer.write('</g>\n\n</svg>')
+        writer.flush()
 
 
-    #########################################################################
-    def prepare_for_multi_svg(self, template_path, last_collision_index=-1):
-        with open(template_path) as template_file:
-            template_string = template_file.read()
-
-
-        def insertParameters(path, length, color, width,
-                            stroke_id, stroke_begin, stroke_duration, stroke_reset_begin,
-                            opacity_id, opacity_begin, opacity_duration, opacity_reset_begin):
-            path_string = template_string
-            
-            path_string = path_string.replace('_PATH_', path)
-            path_string = path_string.replace('_LENGTH_', length)
-            path_string = path_string.replace('_COLOR_', color)
-            path_string = path_string.replace('_WIDTH_', width)
-            path_string = path_string.replace('_STROKE-ID_', stroke_id)
-            path_string = path_string.replace('_STROKE-BEGIN_', stroke_begin)
-            path_string = path_string.replace('_STROKE-DURATION_', stroke_duration)
-            path_string = path_string.replace('_OPACITY-ID_', opacity_id)
-            path_string = path_string.replace('_OPACITY-BEGIN_', opacity_begin)
-            path_string = path_string.replace('_OPACITY-DURATION_', opacity_duration)
-            path_string = path_string.replace('_STROKE-RESET-BEGIN_', stroke_reset_begin)
-            path_string = path_string.replace('_OPACITY-RESET-BEGIN_', opacity_reset_begin)
-
-            return path_string + '\n\n'
-        
-
-
-        this_collision_string = ''
+    def writeCssBody(self, writer, color_rng, encoding, primary_color, secondary_color,
+                     primary_stroke_width, secondary_stroke_width, primary_duration, secondary_duration,
+                     primary_begin, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary):
+        '''
+        Style sheet and paths of the css backend (write_svg with backend='css'). The collision loops
+        from primary_begin on, one period lasts until the secondaries have faded.
+        '''
+        stats = self.stats
+        sheet = CssStyleSheet()
+        sheet.addCollision(0, primary_begin, primary_duration + dur_freeze_secondary + dur_fade_secondary,
+                           primary_color, secondary_color, primary_stroke_width, secondary_stroke_width,
+                           primary_duration=primary_duration, secondary_duration=secondary_duration,
+                           dur_fade_primary=dur_fade_primary, dur_fade_secondary=dur_fade_secondary,
+                           dur_freeze_secondary=dur_freeze_secondary)
+        with stats.span('template filling'):
+            writer.write(sheet.text())
+
+        roles = [('primary', self.primary_paths, primary_color, True), ('secondary', self.secondary_paths, secondary_color, False)]
+        for role, paths, color, inverse in roles:
+            with stats.span('path encoding'):
+                d_strings = [array2d_string(path, inverse_direction=inverse, **encoding) for path in paths]
+            with stats.span('template filling'):
+                for d_string, total_length in zip(d_strings, paths.lengths()):
+                    col = randomColor(color_rng) if color == '0' else None
+                    writer.write(cssPath(d_string, roleClass(0, role), total_length, col) + '\n')
+
+            if role == 'primary':
+                # primaries evaluated in closed form, their path data never exists as a whole
+                with stats.span('path encoding'):
+                    for alpha, n_bounces, end_point in self.streamed_primaries:
+                        col = randomColor(color_rng) if primary_color == '0' else None
+                        streamPrimary2Path(writer, self.point_of_contact[0], self.point_of_contact[1], alpha, n_bounces,
+                                           self.width, self.height, end_point=end_point, encoding=encoding,
+                                           css_class=roleClass(0, 'primary'), color=col)
+                        writer.write('\n')
+
+
+    def prepare_for_css(self, **encoding):
+        '''
+        Paths of this collision for the css backend, the classes (see css_backend.roleClass with
+        collision_index) are written once for the whole document by ConsecutiveCollisionBuilder.
+        '''
+        fragments = []
+        for role, paths, inverse in [('primary', self.primary_paths, True), ('secondary', self.secondary_paths, False)]:
+            with self.stats.span('path encoding'):
+                d_strings = [array2d_string(path, inverse_direction=inverse, **encoding) for path in paths]
+            with self.stats.span('template filling'):
+                class_name = roleClass(self.collision_index, role)
+                fragments += [cssPath(d_string, class_name, total_length)
+                              for d_string, total_length in zip(d_strings, paths.lengths())]
+        return '\n'.join(fragments) + '\n\n' if fragments else ''
 
 
-        if self.collision_index > 0:
+    #########################################################################
+    def prepare_for_multi_svg(self, template, last_collision_index=-1,
+                              group_secondaries=False, merge_secondaries=False, report=False,
+                              previous_index=None, first=None, timeline=None, **encoding):
+        '''
+        - template: PathTemplate or path of a template file (see loadPathTemplate), LOOP_TEMPLATE with timeline
+        - last_collision_index: index of the last collision of the chain (collision 0 starts after it)
+        - group_secondaries, merge_secondaries: shared secondary animations (see secondaryGroup2Path)
+        - report: store the element and byte reduction of the grouped secondaries in self.secondary_report
+        - previous_index: collision_index this collision follows (default: collision_index-1 or last_collision_index)
+        - first: starts the chain at 0s (default: collision_index == 0)
+        - timeline: optional (begin, period) of this collision in the chain (see timeline.chainBegins),
+          absolute looping animations instead of begin references to the previous collision
+        - encoding: path data options (see encodePathData)
+        '''
+        grouped = group_secondaries or merge_secondaries
+        if not isinstance(template, PathTemplate):
+            template = loadPathTemplate(template)
+
+        loop = {'primary': {}, 'secondary': {}}
+        if timeline is not None:
+            begin, period = timeline
+            keyframes = roleKeyframes(period, primary_duration=self.primary_duration,
+                                      secondary_duration=self.secondary_duration,
+                                      dur_fade_primary=self.dur_fade_primary, dur_fade_secondary=self.dur_fade_secondary,
+                                      dur_freeze_secondary=self.dur_freeze_secondary)
+            loop = {role: loopSlots(keyframes[role], begin, period) for role in loop}
+            dash_values = {role: keyframes[role]['dash'][1] for role in loop}
+
+        if first is None:
+            first = self.collision_index == 0
+        if previous_index is not None:
+            last_collision_index = previous_index
+        elif self.collision_index > 0:
             last_collision_index = self.collision_index - 1
 
         # loop over the primaries
@@ -430,20 +1326,15 @@ class CollisionBuider:
         primary_opacity_id = f'primary{self.collision_index}_opacity'
 
         primary_stroke_begin = f'primary{last_collision_index}_stroke.end'
-        if self.collision_index == 0:
+        if first:
             primary_stroke_begin += ';0s'
         primary_stroke_reset = f'primary{last_collision_index}_stroke.end-0.001s'
         
         primary_opacity_begin = f'primary{self.collision_index}_stroke.end'
         primary_opacity_reset = f'primary{last_collision_index}_stroke.end-0.001s'
 
-
-        for path_array in self.primary_paths:
-            d_string = array2d_string(path_array, inverse_direction=True)
-            total_length = calculatePathLength(path_array)
-
-            this_collision_string += insertParameters(path=d_string, length=str(total_length),
-                                            color=self.primary_color,
+        # everything but path and length is shared by all primaries of this collision
+        primary_template = template.partial(color=self.primary_color,
                                             width=f'{self.primary_stroke_width}',
                                             stroke_id=primary_stroke_id,
                                             stroke_begin=primary_stroke_begin,
@@ -452,9 +1343,19 @@ class CollisionBuider:
                                             opacity_id=primary_opacity_id,
                                             opacity_begin=primary_opacity_begin,
                                             opacity_duration=f'{self.dur_fade_primary}s',
-                                            opacity_reset_begin=primary_opacity_reset)
-            
-
+                                            opacity_reset_begin=primary_opacity_reset,
+                                            **loop['primary'])
+
+        with self.stats.span('path encoding'):
+            d_strings = [array2d_string(path_array, inverse_direction=True, **encoding) for path_array in self.primary_paths]
+        with self.stats.span('template filling'):
+            if timeline is None:
+                fragments = [primary_template.fill(path=d_string, length=str(total_length))
+                             for d_string, total_length in zip(d_strings, self.primary_paths.lengths())]
+            else:
+                fragments = [primary_template.fill(path=d_string, length=str(total_length),
+                                                   stroke_values=dashValues(dash_values['primary'], total_length))
+                             for d_string, total_length in zip(d_strings, self.primary_paths.lengths())]
 
 
         # loop over the secondaries
@@ -468,25 +1369,54 @@ class CollisionBuider:
         secondary_opacity_begin = f'primary{self.collision_index}_stroke.end+{self.dur_freeze_secondary}s'
         secondary_opacity_reset = f'primary{last_collision_index}_stroke.end-0.001s'
 
+        secondary_template = template.partial(color=self.secondary_color,
+                                              width=f'{self.primary_stroke_width}',
+                                              stroke_id=secondary_stroke_id,
+                                              stroke_begin=secondary_stroke_begin,
+                                              stroke_duration=f'{self.secondary_duration}s',
+                                              stroke_reset_begin=secondary_stroke_reset,
+                                              opacity_id=secondary_opacity_id,
+                                              opacity_begin=secondary_opacity_begin,
+                                              opacity_duration=f'{self.dur_fade_secondary}s',
+                                              opacity_reset_begin=secondary_opacity_reset,
+                                              **loop['secondary'])
+
+        with self.stats.span('path encoding'):
+            lengths = self.secondary_paths.lengths()
+            d_strings = [array2d_string(path_array, inverse_direction=False, **encoding) for path_array in self.secondary_paths]
+        with self.stats.span('template filling'):
+            if grouped and not report:
+                ungrouped = []
+            elif timeline is None:
+                ungrouped = [secondary_template.fill(path=d_string, length=str(total_length))
+                             for d_string, total_length in zip(d_strings, lengths)]
+            else:
+                ungrouped = [secondary_template.fill(path=d_string, length=str(total_length),
+                                                     stroke_values=dashValues(dash_values['secondary'], total_length))
+                             for d_string, total_length in zip(d_strings, lengths)]
+
+        if grouped:
+            # all secondaries with one shared set of animations (same timing ids as the per path form)
+            with self.stats.span('template filling'):
+                group_string, n_nodes = secondaryGroup2Path(d_strings, lengths, color=self.secondary_color,
+                                                            stroke_width=self.primary_stroke_width,
+                                                            dur=self.secondary_duration, dur_fade=self.dur_fade_secondary,
+                                                            grow_begin=secondary_stroke_begin, fade_begin=secondary_opacity_begin,
+                                                            reset_begin=secondary_stroke_reset,
+                                                            grow_id=secondary_stroke_id, fade_id=secondary_opacity_id,
+                                                            merge=merge_secondaries,
+                                                            timeline=None if timeline is None else (keyframes['secondary'], begin, period))
+            if report:
+                self.secondary_report = {'secondaries': len(d_strings),
+                                         'nodes': n_nodes, 'nodes_ungrouped': (5 if timeline is None else 3)*len(d_strings),
+                                         'bytes': len(group_string) + 2,
+                                         'bytes_ungrouped': sum(len(fragment) + 2 for fragment in ungrouped)}
+            if group_string:
+                fragments.append(group_string)
+        else:
+            fragments += ungrouped
 
-
-        for path_array in self.secondary_paths:
-            d_string = array2d_string(path_array, inverse_direction=False)
-            total_length = calculatePathLength(path_array)
-
-            this_collision_string += insertParameters(path=d_string, length=str(total_length),
-                                            color=self.secondary_color,
-                                            width=f'{self.primary_stroke_width}',
-                                            stroke_id=secondary_stroke_id,
-                                            stroke_begin=secondary_stroke_begin,
-                                            stroke_duration=f'{self.secondary_duration}s',
-                                            stroke_reset_begin=secondary_stroke_reset,
-                                            opacity_id=secondary_opacity_id,
-                                            opacity_begin=secondary_opacity_begin,
-                                            opacity_duration=f'{self.dur_fade_secondary}s',
-                                            opacity_reset_begin=secondary_opacity_reset)
-            
-        return this_collision_string
+        return '\n\n'.join(fragments) + '\n\n' if fragments else ''
             
             
             
@@ -529,6 +1459,11 @@ def hsl_to_hex(h, s, l):
     return f'#{r:02x}{g:02x}{b:02x}'
 
 
+def randomColor(rng=None):
+    '''Fully saturated color of random hue'''
+    return hsl_to_hex(np.random.default_rng(rng).random(), 1, 0.5)
+
+
 ##################################################################
 
 def clear_terminal():
@@ -539,11 +1474,12 @@ def clear_terminal():
     else:
         _ = os.system('clear')
 
-def get_random_point(width, height):
-    return (np.random.uniform(0, width), np.random.uniform(0, height))
+def get_random_point(width, height, rng=None):
+    rng = np.random.default_rng(rng)
+    return (rng.uniform(0, width), rng.uniform(0, height))
 
-def get_random_angles(n):
-    return list(np.random.uniform(0, 360, size=n))
+def get_random_angles(n, rng=None):
+    return list(np.random.default_rng(rng).uniform(0, 360, size=n))
 
 
 
@@ -680,12 +1616,145 @@ def input_mask(params):
     return params
 
 
+# style keys of a parameter set, passed on to CollisionBuider.to_svg
+STYLE_PARAMETERS = ['primary_color', 'secondary_color', 'primary_stroke_width', 'secondary_stroke_width',
+                    'primary_duration', 'secondary_duration', 'primary_begin', 'background_color', 'box_color',
+                    'dur_fade_primary', 'dur_fade_secondary', 'dur_freeze_secondary']
+
+# keys of a parameter set that do not change the rendered document
+OUTPUT_PARAMETERS = ['name', 'parameter_file', 'store_parameters']
+
+
+def validate_parameters(params):
+    '''
+    Check a parameter set (as in main() or configs/*.json) before rendering.
+    Returns a list of error messages, empty if the set can be rendered.
+    '''
+    errors = []
+    number = (int, float)
+
+    required = ['width', 'height', 'point_of_contact', 'incoming_angles', 'n_border_collisions',
+                'n_secondaries', 'alpha_std', 'length_mean', 'length_std']
+    missing = [key for key in required if key not in params]
+    if missing:
+        return [f'missing parameter(s): {", ".join(missing)}']
+
+    for key in ['width', 'height']:
+        if not isinstance(params[key], number) or params[key] <= 0:
+            errors.append(f'{key} must be a positive number')
+    if errors:
+        return errors
+
+    poc = params['point_of_contact']
+    if not isinstance(poc, (list, tuple)) or len(poc) != 2 or not all(isinstance(v, number) for v in poc):
+        errors.append('point_of_contact must be a pair of numbers')
+    elif not (0 <= poc[0] <= params['width'] and 0 <= poc[1] <= params['height']):
+        errors.append('point_of_contact lies outside of the box')
+
+    angles = params['incoming_angles']
+    if not isinstance(angles, (list, tuple)) or not all(isinstance(v, number) for v in angles):
+        errors.append('incoming_angles must be a list of numbers')
+
+    bounces = params['n_border_collisions']
+    if isinstance(bounces, (list, tuple)):
+        if not all(isinstance(v, number) and v >= 0 for v in bounces):
+            errors.append('n_border_collisions must be non-negative numbers')
+    elif not isinstance(bounces, int) or bounces < 0:
+        errors.append('n_border_collisions must be a non-negative int or a list of them')
+
+    if not isinstance(params['n_secondaries'], int) or params['n_secondaries'] < 0:
+        errors.append('n_secondaries must be a non-negative int')
+    if params.get('seed') is not None and (not isinstance(params['seed'], int) or params['seed'] < 0):
+        errors.append('seed must be a non-negative int')
+    for key in ['alpha_std', 'length_mean', 'length_std', 'relative_margin'] + STYLE_PARAMETERS:
+        if key not in params:
+            continue
+        if key.endswith('color'):
+            if not isinstance(params[key], str):
+                errors.append(f'{key} must be a color string')
+        elif not isinstance(params[key], number):
+            errors.append(f'{key} must be a number')
+
+    return errors
+
+
+def build_collision(params, stats=None):
+    '''
+    CollisionBuider with primaries and secondaries of a parameter set (style not applied, see STYLE_PARAMETERS).
+    '''
+    collision = CollisionBuider(width=params['width'],
+                                height=params['height'],
+                                point_of_contact=params['point_of_contact'],
+                                incoming_angles=list(params['incoming_angles']),
+                                relative_margin=params.get('relative_margin', 0.05),
+                                seed=params.get('seed'),
+                                stats=stats
+                                )
+    collision.calculatePrimaryPaths(params['n_border_collisions'])
+    collision.calculateSecondaryPaths(n_secondaries=params['n_secondaries'],
+                                      alpha_std=params['alpha_std'],
+                                      length_mean=params['length_mean'],
+                                      length_std=params['length_std'])
+    return collision
+
+
+def render_parameters(params, target=None, cache=None, store_arrays=False, stats=None, minify=False, compresslevel=9):
+    '''
+    - params: parameter set (as in main() or configs/*.json)
+    - target: file name (.svgz: gzip compressed with compresslevel) or file object (default: params['name'])
+    - cache: optional RenderCache, only used for seeded parameter sets (others are not reproducible)
+    - store_arrays: also cache the path arrays of the collision
+    - stats: optional RenderStats collecting the time of every stage
+    - minify: whitespace free document (see SvgMinifier)
+    ---------------------------------------
+    Build the collision of a parameter set and write it as svg. Returns the CollisionBuider,
+    or None if the document came from the cache (no geometry was computed).
+    '''
+    if target is None:
+        target = params['name']
+
+    key = None
+    if cache is not None and params.get('seed') is not None:
+        from render_cache import cacheKey
+        key_params = {k: v for k, v in params.items() if k not in OUTPUT_PARAMETERS}
+        if minify:
+            key_params['minify'] = True
+        key = cacheKey('collision', key_params)
+        data = cache.get(key)
+        if data is not None:
+            writeSvgData(target, data, compresslevel)
+            if isinstance(target, (str, os.PathLike)):
+                print(f'Writen to {target}! (cached)')
+            return None
+
+    collision = build_collision(params, stats=stats)
+
+    #collision.plotResult()
+
+    style = {key: params[key] for key in STYLE_PARAMETERS if key in params}
+    if key is None:
+        collision.to_svg(target, compresslevel=compresslevel, minify=minify, **style)
+    else:
+        data = collision.to_svg_bytes(minify=minify, **style)
+        cache.put(key, data, arrays=collision.pathArrays() if store_arrays else None)
+        writeSvgData(target, data, compresslevel)
+        if isinstance(target, (str, os.PathLike)):
+            print(f'Writen to {target}!')
+    return collision
+
+
+
 ##################################################################
 ##################################################################
 ##################################################################
 
 
 def main():
+    # python3 collision_builder.py [file.json] --profile: print the time of every render stage
+    profile = '--profile' in sys.argv
+    if profile:
+        sys.argv.remove('--profile')
+
     params = {
         'width': 800,
         'height': 300,
@@ -711,42 +1780,23 @@ def main():
         'box_color': '#3c3c3c',
         'relative_margin': 0.05,
         'name': 'animations/test.svg',
+        'seed': int(np.random.SeedSequence().entropy),
         'parameter_file': 'configs/test.json',
         'store_parameters': 1,
     }
 
     params = input_mask(params)
 
-    collision = CollisionBuider(width=params['width'],
-                                height=params['height'],
-                                point_of_contact=params['point_of_contact'],
-                                incoming_angles=params['incoming_angles'],
-                                relative_margin=params['relative_margin']
-                                )
-    collision.calculatePrimaryPaths(params['n_border_collisions'])
-    collision.calculateSecondaryPaths(n_secondaries=params['n_secondaries'],
-                                      alpha_std=params['alpha_std'],
-                                      length_mean=params['length_mean'],
-                                      length_std=params['length_std'])
-    
-
-    #collision.plotResult()
-    
-    collision.to_svg(name=params['name'],
-                     primary_color=params['primary_color'],
-                     secondary_color=params['secondary_color'],
-                     primary_stroke_width=params['primary_stroke_width'],
-                     secondary_stroke_width=params['secondary_stroke_width'],
-                     primary_duration=params['primary_duration'],
-                     secondary_duration=params['secondary_duration'],
-                     primary_begin=params['primary_begin'],
-                     background_color=params['background_color'],
-                     box_color=params['box_color'],
-                     dur_fade_primary=params['dur_fade_primary'],
-                     dur_fade_secondary=params['dur_fade_secondary'],
-                     dur_freeze_secondary=params['dur_freeze_secondary'])
+    if profile:
+        from profiling import RenderStats
+        stats = RenderStats()
+        render_parameters(params, stats=stats)
+        print(stats.report())
+    else:
+        render_parameters(params)
     
     # display the new animation
+    import webbrowser
     webbrowser.open(params['name'])
 
     
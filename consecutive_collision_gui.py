@@ -7,12 +7,53 @@
 
 import webbrowser
 import sys
+import traceback
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QListWidget, QGroupBox, QFormLayout, QSpinBox, QDoubleSpinBox, QColorDialog, 
-                             QScrollArea, QFrame)
+                             QScrollArea, QFrame, QProgressBar)
 from PyQt5.QtGui import QColor
-from PyQt5.QtCore import Qt, QSize
-from consecutive_collisions import ConsecutiveCollisionBuilder
+from PyQt5.QtCore import Qt, QSize, QObject, QRunnable, QThreadPool, pyqtSignal
+from consecutive_collisions import ConsecutiveCollisionBuilder, RenderCancelled
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int, int)  # done, total
+    finished = pyqtSignal(object)    # return value of the job
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class Job(QRunnable):
+    '''
+    Runs fn(*args, progress=callback, **kwargs) on a QThreadPool and reports back through signals
+    (delivered in the GUI thread). After cancel() the next progress callback raises RenderCancelled.
+    '''
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = JobSignals()
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def report_progress(self, done, total):
+        if self.is_cancelled:
+            raise RenderCancelled()
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, progress=self.report_progress, **self.kwargs)
+        except RenderCancelled:
+            self.signals.cancelled.emit()
+        except Exception:
+            self.signals.failed.emit(traceback.format_exc())
+        else:
+            self.signals.finished.emit(result)
+
 
 
 class CollapsibleBox(QWidget):
@@ -50,10 +91,18 @@ class CollapsibleBox(QWidget):
         self.content_area.widget().setLayout(layout)
 
 class CollisionGUI(QWidget):
-    def __init__(self):
+    def __init__(self, open_browser=True):
+        '''
+        - open_browser: show the generated svg in the browser
+        '''
         super().__init__()
-        self.initUI()
+        self.open_browser = open_browser
         self.ccb = None
+        self.job = None
+        # one worker, jobs run in the order they were started
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.initUI()
 
     def initUI(self):
         layout = QVBoxLayout()
@@ -173,6 +222,17 @@ class CollisionGUI(QWidget):
         self.generate_svg_btn.clicked.connect(self.generate_svg)
         layout.addWidget(self.generate_svg_btn)
 
+        # Progress of the running job
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_job)
+        self.cancel_btn.setEnabled(False)
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_btn)
+        layout.addLayout(progress_layout)
+
         self.setLayout(layout)
         self.setWindowTitle('Consecutive Collision Builder GUI')
         
@@ -190,6 +250,48 @@ class CollisionGUI(QWidget):
         self.add_collision_btn.setEnabled(enabled)
         self.generate_svg_btn.setEnabled(enabled)
 
+    def start_job(self, on_finished, fn, *args, **kwargs):
+        '''
+        Run fn on the worker thread, the inputs are locked until it finished, failed or was cancelled.
+        '''
+        self.job = Job(fn, *args, **kwargs)
+        self.job.signals.progress.connect(self.on_progress)
+        self.job.signals.finished.connect(on_finished)
+        self.job.signals.finished.connect(self.end_job)
+        self.job.signals.failed.connect(self.on_failed)
+        self.job.signals.cancelled.connect(self.on_cancelled)
+
+        self.set_widgets_enabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setRange(0, 0)  # busy until the first progress
+        self.pool.start(self.job)
+
+    def end_job(self, *_):
+        self.job = None
+        self.cancel_btn.setEnabled(False)
+        self.set_widgets_enabled(True)
+
+    def cancel_job(self):
+        if self.job:
+            self.job.cancel()
+            self.cancel_btn.setEnabled(False)
+
+    def on_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def on_failed(self, message):
+        print(message)
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.end_job()
+
+    def on_cancelled(self):
+        print("Cancelled")
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.end_job()
+
     def create_builder(self):
         width = self.width_input.value()
         height = self.height_input.value()
@@ -232,18 +334,41 @@ class CollisionGUI(QWidget):
             elif isinstance(widget, (QSpinBox, QDoubleSpinBox)):
                 config[key] = widget.value()
 
+        # the paths stay listed until the collision is kept, a failed or cancelled add can be retried
+        self.start_job(self.collision_added, self.build_collision, new_point, border_collisions, config)
+
+    def build_collision(self, new_point, border_collisions, config, progress):
+        # worker thread: the geometry is built right away, invalid walls show up here and not at export
+        progress(0, 1)
         self.ccb.addCollision(new_point, border_collisions, **config)
-        print("Collision added")
+        try:
+            self.ccb.collisionAt(-1)
+            progress(1, 1)
+        except Exception:
+            # failed or cancelled (RenderCancelled): the collision is not kept
+            self.ccb.removeCollision(-1)
+            raise
+
+    def collision_added(self, _):
         self.paths_list.clear()
+        print("Collision added")
 
     def generate_svg(self):
         if not self.ccb:
             print("Please create a builder first")
             return
 
-        self.ccb.to_svg(self.file_name.text())
+        self.start_job(self.svg_generated, self.ccb.to_svg, self.file_name.text())
+
+    def svg_generated(self, _):
         print(f"SVG generated: {self.file_name.text()}")
-        webbrowser.open(self.file_name.text())
+        if self.open_browser:
+            webbrowser.open(self.file_name.text())
+
+    def closeEvent(self, event):
+        self.cancel_job()
+        self.pool.waitForDone()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
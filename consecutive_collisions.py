@@ -5,18 +5,50 @@
 #
 
 
+import os, io
 import numpy as np
-import matplotlib.pyplot as plt 
 from collision_builder import *
+from timeline import chainBegins
+from css_backend import CssStyleSheet
+
+
+
+class RenderCancelled(Exception):
+    '''
+    Raised by a progress callback of ConsecutiveCollisionBuilder.write_svg to stop the render.
+    '''
+
 
 
 class ConsecutiveCollisionBuilder:
-    def __init__(self, width, height, inital_point, relative_margin=0.05):
+    def __init__(self, width, height, inital_point, relative_margin=0.05, dtype=np.float64, seed=None, stats=None,
+                 fragment_cache=True, table=None, check_routes=False):
+        '''
+        - seed: None, int, np.random.SeedSequence or np.random.Generator (see seedSequence)
+        - table: optional tables.Table instead of the box, border_collisions are then its edge labels
+        - check_routes: with a table, building a collision whose walls are not hit in this order raises
+          a ValueError (see CollisionBuider.tableRoute)
+        - stats: optional RenderStats (see profiling.py) shared by all collisions
+        - fragment_cache: keep the svg fragment of every collision, the next write_svg only renders
+          the collisions that were edited, inserted or removed (and their successors)
+        '''
         self.points_of_collision = [inital_point]
-        self.collisions = []
+        self.collision_specs = []  # (start, point, border_collisions, config) of every collision in chain order
+        self.collision_keys = []  # stable id of every collision: seed stream and svg timing ids
+        self._next_key = 0
+        self._geometry = {}  # key -> CollisionBuider
+        self._fragments = {}  # key -> (render state, svg fragment)
+        self._culled = {}  # key -> digest of the secondaries left by levelOfDetail
+        self.fragment_cache = fragment_cache
         self.relative_margin = relative_margin
         self.width = width
         self.height = height
+        self.dtype = dtype  # coordinate precision of the collisions' PathSets
+        self.seed_sequence = seedSequence(seed)
+        self.seeded = seed is not None
+        self.stats = NO_STATS if stats is None else stats
+        self.table = table
+        self.check_routes = check_routes
 
         self.default_config = {
             'n_secondaries': 40,
@@ -38,14 +70,137 @@ class ConsecutiveCollisionBuilder:
             }
 
     def addCollision(self, new_point_of_collision, border_collisions, **kwargs):
-        
+        '''
+        Only the collision is recorded, its geometry is computed on first access of self.collisions.
+        '''
+        self.insertCollision(len(self.collision_specs), new_point_of_collision, border_collisions, **kwargs)
+
+
+    def insertCollision(self, index, new_point_of_collision, border_collisions, **kwargs):
+        '''
+        Insert a collision before collision number index (index == number of collisions appends).
+        The collision after it now starts at new_point_of_collision and is rebuilt.
+        '''
+        if not 0 <= index <= len(self.collision_specs):
+            raise IndexError(f'collision index {index} out of range')
         config = self.default_config.copy()
         config.update(kwargs)
 
+        self.points_of_collision.insert(index + 1, new_point_of_collision)
+        self.collision_specs.insert(index, (self.points_of_collision[index], new_point_of_collision,
+                                            border_collisions, config))
+        self.collision_keys.insert(index, self._next_key)
+        self._next_key += 1
+        self._restart(index + 1)
+
+
+    def editCollision(self, index, new_point_of_collision=None, border_collisions=None, **kwargs):
+        '''
+        Change the point, walls or config (kwargs) of collision number index, everything not given is kept.
+        Only this collision is rebuilt, and the next one if the point moved.
+        '''
+        index = range(len(self.collision_specs))[index]
+        start, point, walls, config = self.collision_specs[index]
+        config = {**config, **kwargs}
+        if border_collisions is not None:
+            walls = border_collisions
+        moved = new_point_of_collision is not None
+        if moved:
+            point = new_point_of_collision
+            self.points_of_collision[index + 1] = point
+
+        self.collision_specs[index] = (start, point, walls, config)
+        self._invalidate(index)
+        if moved:
+            self._restart(index + 1)
+
+
+    def removeCollision(self, index):
+        '''
+        Remove collision number index, the next one then starts at the point before it and is rebuilt.
+        '''
+        index = range(len(self.collision_specs))[index]
+        self._invalidate(index)
+        del self.collision_specs[index]
+        del self.collision_keys[index]
+        del self.points_of_collision[index + 1]
+        self._restart(index)
+
+
+    def _restart(self, index):
+        # collision index starts at the point before it, refresh the start and drop its geometry
+        if index < len(self.collision_specs):
+            _, point, walls, config = self.collision_specs[index]
+            self.collision_specs[index] = (self.points_of_collision[index], point, walls, config)
+            self._invalidate(index)
+
+
+    def _invalidate(self, index):
+        key = self.collision_keys[index]
+        self._geometry.pop(key, None)
+        self._fragments.pop(key, None)
+        self._culled.pop(key, None)
+
+
+    def levelOfDetail(self, min_length=1.0, display_width=None, max_overlap=0.5, max_elements=None, max_bytes=None,
+                      report=False, **svg_options):
+        '''
+        Remove the secondaries that are not worth their elements from all collisions at once (arguments see
+        CollisionBuider.levelOfDetail, the budget holds for the whole chain written with svg_options).
+        It works on the current geometry: a collision that is edited, inserted or rebuilt comes back
+        with all its secondaries, call it again after editing.
+        '''
+        collisions = self.collisions
+        pixel_size = self.width/(display_width or self.width)/(1 - self.relative_margin)
+        self.lod_report = cullSecondaries(collisions, lambda: self.to_svg_bytes(**svg_options), min_length, pixel_size,
+                                          # the secondaries are drawn with the primary stroke width
+                                          [collision.primary_stroke_width for collision in collisions], max_overlap,
+                                          max_elements, max_bytes, measure=report,
+                                          precision=svg_options.get('precision', 3), on_change=self._fragments.clear)
+        self._culled.update({key: collision.secondary_paths.digest()
+                             for key, collision in zip(self.collision_keys, collisions)})
+        if report:
+            reportCulling(self.lod_report)
+        return self.lod_report
+
+
+    def wallSequencesTo(self, new_point_of_collision, max_bounces, **kwargs):
+        '''
+        Candidate border_collisions from the last point to new_point_of_collision for addCollision,
+        sorted by length: [(walls, length), ...] (kwargs see wall_sequences.wallSequences)
+        '''
+        if self.table is not None:
+            raise ValueError('wall sequences are enumerated on the mirror lattice of the box, not on a table')
+        from wall_sequences import wallSequences
+        return wallSequences(self.points_of_collision[-1], new_point_of_collision,
+                             self.width, self.height, max_bounces, **kwargs)
+
+
+    @property
+    def collisions(self):
+        '''CollisionBuider of every collision in chain order'''
+        return [self.collisionAt(index) for index in range(len(self.collision_specs))]
+
+
+    def collisionAt(self, index):
+        '''
+        CollisionBuider of collision number index, built if necessary.
+        '''
+        key = self.collision_keys[index]
+        if key not in self._geometry:
+            self._geometry[key] = self._buildCollision(index)
+        return self._geometry[key]
+
+
+    def _buildCollision(self, index):
+        start_point, new_point_of_collision, border_collisions, config = self.collision_specs[index]
+        key = self.collision_keys[index]
+
         new_collision = CollisionBuider(self.width, self.height, new_point_of_collision,
-                                        incoming_angles=[], relative_margin=self.relative_margin)
+                                        incoming_angles=[], relative_margin=self.relative_margin, dtype=self.dtype,
+                                        seed=self.collisionSeed(key), stats=self.stats, table=self.table)
         
-        new_collision.addPrimaryFrom(self.points_of_collision[-1], border_collisions)
+        new_collision.addPrimaryFrom(start_point, border_collisions, check_routes=self.check_routes)
 
         new_collision.calculateSecondaryPaths(n_secondaries=config['n_secondaries'],
                                             alpha_std=config['alpha_std'],
@@ -54,56 +209,229 @@ class ConsecutiveCollisionBuilder:
 
 
         style_dict = {k: v for k, v in config.items() if k not in ['n_secondaries', 'alpha_std', 'length_mean', 'length_std']}
-        new_collision.setStyle(collision_index=len(self.collisions), **style_dict)
-
-        self.points_of_collision.append(new_point_of_collision)
-        self.collisions.append(new_collision)
+        new_collision.setStyle(collision_index=key, **style_dict)
+        return new_collision
+
+
+    def collisionSeed(self, key):
+        '''
+        Independent stream of the collision with this key, only depends on the root seed and the key
+        (the same child SeedSequence.spawn would return as key-th child). Keys are handed out in
+        the order collisions are added, so inserting or removing one does not reseed the others.
+        '''
+        root = self.seed_sequence
+        return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (key,), pool_size=root.pool_size)
+
+
+    def plotResult(self, max_points=None, ax=None, show=True, cmap='viridis'):
+        '''
+        - max_points: decimate longer primaries to about this many points (only the plot)
+        - ax: draw into these matplotlib axes instead of a new figure
+        ---------------------------------------
+        Debug plot of all collisions at once, colored by collision index
+        (one line collection for all primaries and one for all secondaries).
+        '''
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+        from matplotlib.colors import Normalize
+
+        if ax is None:
+            _, ax = plt.subplots(figsize=(10, self.height/self.width*10))
+        plotTable(ax, self.width, self.height, self.table)
+
+        primaries, secondaries, primary_index, secondary_index = [], [], [], []
+        for index, coll in enumerate(self.collisions):
+            lines = plotSegments(coll.primary_paths, max_points)
+            primaries += list(lines)
+            primary_index += [index]*len(lines)
+            if len(coll.secondary_paths):
+                secondaries.append(plotSegments(coll.secondary_paths))
+                secondary_index += [index]*len(coll.secondary_paths)
+
+        # secondaries are straight segments, usually they stay one (n, 2, 2) array
+        if secondaries and all(isinstance(lines, np.ndarray) for lines in secondaries):
+            secondaries = np.concatenate(secondaries)
+        else:
+            secondaries = [line for lines in secondaries for line in lines]
+
+        norm = Normalize(0, max(1, len(self.collisions) - 1))
+        secondary_lines = LineCollection(secondaries, cmap=cmap, norm=norm, linewidths=1, alpha=0.5)
+        secondary_lines.set_array(np.array(secondary_index, dtype=float))
+        primary_lines = LineCollection(primaries, cmap=cmap, norm=norm, linewidths=2)
+        primary_lines.set_array(np.array(primary_index, dtype=float))
+
+        ax.add_collection(secondary_lines)
+        ax.add_collection(primary_lines)
+        ax.autoscale_view()
+        ax.figure.colorbar(primary_lines, ax=ax, label='collision index')
+
+        if show:
+            plt.show()
+        return ax
+
+
+    def cacheKey(self, **kwargs):
+        '''
+        Key of the document for a RenderCache: size, seed, all collisions, render options and template
+        (and the remaining secondaries of the collisions culled by levelOfDetail).
+        '''
+        from render_cache import cacheKey, templateDigest
+
+        options = {k: v for k, v in kwargs.items() if k not in ['chunk_size', 'report', 'progress']}
+        return cacheKey('consecutive', {'width': self.width, 'height': self.height,
+                                        'relative_margin': self.relative_margin, 'dtype': np.dtype(self.dtype).str,
+                                        'seed': self.seed_sequence, 'collisions': self.collision_specs,
+                                        'keys': self.collision_keys,
+                                        'options': options,
+                                        **({} if self.table is None else
+                                           {'table': [[ring.tolist() for ring in self.table.rings], self.table.labels]}),
+                                        **({} if not self._culled else
+                                           {'culled': [self._culled.get(key) for key in self.collision_keys]}),
+                                        'template': templateDigest(LOOP_TEMPLATE if options.get('timing') == 'absolute'
+                                                                   else PATH_TEMPLATE)})
+
+
+    def to_svg(self, file_name, cache=None, compresslevel=9, **kwargs):
+        '''
+        - file_name: file name (.svgz: gzip compressed with compresslevel) or writable (text or binary) file object
+        - cache: optional RenderCache, only used with an explicit seed
+        ---------------------------------------
+        A render stopped by RenderCancelled (see write_svg) leaves no partial file behind.
+        '''
+        try:
+            if cache is not None and self.seeded:
+                key = self.cacheKey(**kwargs)
+                data = cache.get(key)
+                if data is None:
+                    data = self.to_svg_bytes(**kwargs)
+                    cache.put(key, data)
+                writeSvgData(file_name, data, compresslevel)
+            else:
+                with openSvgTarget(file_name, compresslevel) as file:
+                    self.write_svg(file, **kwargs)
+        except RenderCancelled:
+            if isinstance(file_name, (str, os.PathLike)) and os.path.exists(file_name):
+                os.remove(file_name)
+            raise
+
+        if isinstance(file_name, (str, os.PathLike)):
+            print(f'Writen to {file_name}!')
+
+
+    def to_svg_bytes(self, **kwargs):
+        '''
+        Render the svg document into memory and return it as utf-8 bytes.
+        '''
+        buffer = io.BytesIO()
+        self.write_svg(buffer, **kwargs)
+        return buffer.getvalue()
+
+
+    def fragment(self, index, template, **options):
+        '''
+        svg fragment of collision number index (options see prepare_for_multi_svg). It also depends on
+        the key of the collision before (its timing starts at that one's end) and on being the first,
+        a cached fragment is reused as long as those, the template and the options are the same.
+        template None: paths of the css backend (prepare_for_css), their timing is in the style sheet.
+        '''
+        key = self.collision_keys[index]
+        if template is None:
+            state = (None, None, None, options)
+        else:
+            state = (self.collision_keys[index - 1], index == 0, template, options)
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] == state:
+            self.stats.count('fragments reused')
+            return cached[1]
+
+        if template is None:
+            fragment = self.collisionAt(index).prepare_for_css(**options)
+        else:
+            fragment = self.collisionAt(index).prepare_for_multi_svg(template, previous_index=state[0],
+                                                                     first=state[1], **options)
+        self.stats.count('fragments rendered')
+        if self.fragment_cache:
+            self._fragments[key] = (state, fragment)
+        return fragment
+
+
+    def styleSheet(self, begins, period):
+        '''
+        CssStyleSheet of all collisions (begin times and period see timeline.chainBegins).
+        The secondaries are drawn with the primary stroke width like in prepare_for_multi_svg.
+        '''
+        sheet = CssStyleSheet()
+        for key, (*_, config), begin in zip(self.collision_keys, self.collision_specs, begins):
+            sheet.addCollision(key, float(begin), period, config['primary_color'], config['secondary_color'],
+                               config['primary_stroke_width'], config['primary_stroke_width'],
+                               primary_duration=config['primary_duration'],
+                               secondary_duration=config['secondary_duration'],
+                               dur_fade_primary=config['dur_fade_primary'],
+                               dur_fade_secondary=config['dur_fade_secondary'],
+                               dur_freeze_secondary=config['dur_freeze_secondary'])
+        return sheet
+
+
+    def write_svg(self, file, chunk_size=1<<16, precision=3, relative=False, shortcuts=False,
+                  group_secondaries=False, merge_secondaries=False, report=False, progress=None, timing='chained',
+                  backend='smil', minify=False):
+        '''
+        Stream the document collision by collision to a text or binary file object.
+        - precision, relative, shortcuts: path data encoding (see encodePathData)
+        - group_secondaries, merge_secondaries: shared secondary animations (see secondaryGroup2Path)
+        - report: print the element and byte reduction of the grouped secondaries
+        - progress: optional callback(done, total) after every collision, may raise RenderCancelled to stop
+        - timing: 'chained' (every collision begins at the end of the one before) or 'absolute'
+          (begin times computed from the durations, looping animations without references, see timeline.py)
+        - backend: 'smil' or 'css' (shared classes and @keyframes, see css_backend.py; always absolute timing)
+        - minify: no whitespace between and inside the elements (see SvgMinifier)
+        '''
+        if timing not in ('chained', 'absolute'):
+            raise ValueError(f"timing must be 'chained' or 'absolute', not {timing!r}")
+        checkBackend(backend, group_secondaries or merge_secondaries)
 
-
-    def to_svg(self, file_name):
         # closing the loop
         #self.addCollision(self.points_of_collision[0], [['A'], ['B', 'C']])
-        
-
-        #begin the string
-        total_string = f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" viewBox="0 0 {self.width} {self.height}">\n\n'
-
 
-        # background box
-        d_box = f'M0,0 L{self.width},0 L{self.width},{self.height} L0,{self.height} Z'
-        box_string = line2svgPath(d=d_box, identifier='box',
-                                  color=self.default_config['background_color'],
-                                  stroke_width=0, animate=False, fill=self.default_config['background_color'])
-        total_string += box_string + '\n\n'   
+        writer = SvgWriter(file, chunk_size=chunk_size, stats=self.stats, minify=minify)
 
+        #begin the document: header, background and surrounding box
+        with self.stats.span('template filling'):
+            writer.write(svgHeader(self.width, self.height, self.relative_margin,
+                                   self.default_config['background_color'], self.default_config['box_color'], self.table))
 
-        # rescaling and translation to center
-        scale_w = 1 - self.relative_margin
-        scale_h = round(1 - self.width * self.relative_margin / self.height, 3)
-        translation = self.relative_margin*self.width/2
-        total_string += f'<g transform="scale({scale_w},{scale_h}) translate({translation}, {translation})"> \n\n'
+        if backend == 'css' or timing == 'absolute':
+            begins, period = chainBegins([config['primary_duration'] for *_, config in self.collision_specs])
 
+        if backend == 'css':
+            # one style sheet for all collisions, the paths only carry their class
+            template, options = None, dict(precision=precision, relative=relative, shortcuts=shortcuts)
+            with self.stats.span('template filling'):
+                writer.write(self.styleSheet(begins, period).text())
+        else:
+            # the template is compiled once and shared by all collisions
+            template = loadPathTemplate(PATH_TEMPLATE if timing == 'chained' else LOOP_TEMPLATE)
+            options = dict(group_secondaries=group_secondaries, merge_secondaries=merge_secondaries, report=report,
+                           precision=precision, relative=relative, shortcuts=shortcuts)
 
-        # surrounding box
-        d_box = f'M0,0 L{self.width},0 L{self.width},{self.height} L0,{self.height} Z'
-        box_string = line2svgPath(d=d_box, identifier='box',
-                                  color=self.default_config['box_color'], stroke_width=0.5, animate=False, fill=self.default_config['box_color'])
-        total_string += box_string + '\n\n'   
+        # for each collision add the paths (geometry that is still missing is built on the way)
+        n_collisions = len(self.collision_specs)
+        self.stats.count('collisions', n_collisions)
+        for index in range(n_collisions):
+            if timing == 'absolute' and template is not None:
+                options['timeline'] = (float(begins[index]), period)
+            writer.write(self.fragment(index, template, **options))
+            if progress is not None:
+                progress(index + 1, n_collisions)
 
-        # for each collision add the paths
-        for coll in self.collisions:
-            total_string += coll.prepare_for_multi_svg('templates/path_template.txt', len(self.collisions)-1)
+        if report and (group_secondaries or merge_secondaries) and self.collisions:
+            reports = [coll.secondary_report for coll in self.collisions]
+            reportGrouping({key: sum(report[key] for report in reports) for key in reports[0]})
 
 
-
-        #end the string
-        total_string += '\n\n</g>\n\n</svg>'
-
-        # write
-        with open(file_name, 'w') as file:
-            file.write(total_string)
-        
-        print(f'Writen to {file_name}!')
+        #end the document
+        writer.write('\n\n</g>\n\n</svg>')
+        writer.flush()
 
 
 
@@ -126,5 +454,6 @@ if __name__ == "__main__":
     ccb.to_svg('unicolor.svg')
     
     # display the new animation
+    import webbrowser
     webbrowser.open('unicolor.svg')
     
\ No newline at end of file
@@ -0,0 +1,99 @@
+#
+# CSS output backend: shared classes and @keyframes instead of inline <animate>/<set> elements
+# https://github.com/LEMettler
+#
+# Every collision gets one class per role (primary, secondary) with its stroke style and animations,
+# the @keyframes come from the absolute timeline (timeline.roleKeyframes) and are shared by all collisions
+# with the same durations. A path only carries its d, its dash length (--l) and the class name.
+#
+
+
+import math
+from timeline import roleKeyframes, formatNumber
+
+
+# a step (zero duration fade) is written as two keyframes this far apart (in percent)
+STEP = 0.001
+
+
+def roleClass(index, role):
+    '''class name of the primaries ('p') or secondaries ('s') of collision index'''
+    return f'c{index}{role[0]}'
+
+
+def cssLength(length):
+    '''
+    Dash length of a path, rounded up so the dash always covers the whole path.
+    '''
+    return repr(math.ceil(float(length)*100)/100)
+
+
+def _dashValue(v):
+    if v == 1:
+        return 'var(--l)'
+    if v == 0:
+        return '0'
+    return f'calc(var(--l)*{formatNumber(v)})'
+
+
+def keyframesRule(name, prop, times, values):
+    '''
+    - prop: 'stroke-dashoffset' (values are hidden fractions of the path) or 'opacity'
+    - times, values: keyTimes/values of one period (see timeline.loopKeyframes)
+    '''
+    frames = []
+    for k, (t, v) in enumerate(zip(times, values)):
+        percent = t*100
+        if k + 1 < len(times) and times[k + 1] == t:
+            # first value of a step, shown until right before it
+            percent = max(0., percent - STEP)
+        value = _dashValue(v) if prop == 'stroke-dashoffset' else formatNumber(v)
+        frames.append(f'{formatNumber(percent)}%{{{prop}:{value}}}')
+    return f'@keyframes {name}{{{"".join(frames)}}}'
+
+
+
+class CssStyleSheet:
+    '''
+    Class rules and the (deduplicated) @keyframes of a document.
+    '''
+    def __init__(self):
+        self.keyframes = {}  # rule body -> name
+        self.rules = []
+
+    def _keyframesName(self, prop, times, values):
+        rule = keyframesRule('{name}', prop, times, values)
+        if rule not in self.keyframes:
+            self.keyframes[rule] = f'k{len(self.keyframes)}'
+        return self.keyframes[rule]
+
+    def addCollision(self, index, begin, period, primary_color, secondary_color, primary_width, secondary_width,
+                     **timing):
+        '''
+        - index: class names of the collision (see roleClass)
+        - begin, period: absolute begin and loop duration (see timeline.chainBegins)
+        - timing: primary_duration, secondary_duration, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary
+        '''
+        keyframes = roleKeyframes(period, **timing)
+        for role, color, width in [('primary', primary_color, primary_width), ('secondary', secondary_color, secondary_width)]:
+            dash = self._keyframesName('stroke-dashoffset', *keyframes[role]['dash'])
+            opacity = self._keyframesName('opacity', *keyframes[role]['opacity'])
+            loop = f'{formatNumber(period)}s linear {formatNumber(begin)}s infinite'
+            # color '0': random color per path, given on the path itself
+            stroke = '' if color == '0' else f'stroke:{color};'
+            self.rules.append(f'.{roleClass(index, role)}{{{stroke}stroke-width:{width};fill:none;'
+                              f'stroke-dasharray:var(--l);stroke-dashoffset:var(--l);'
+                              f'animation:{dash} {loop},{opacity} {loop}}}')
+
+    def text(self):
+        keyframes = [rule.replace('{name}', name, 1) for rule, name in self.keyframes.items()]
+        return '<style>\n' + '\n'.join(keyframes + self.rules) + '\n</style>\n\n'
+
+
+
+def cssPath(d, class_name, length, color=None):
+    '''
+    Path element of the css backend (color: only for random colors, otherwise it is in the class).
+    '''
+    stroke = '' if color is None else f' stroke="{color}"'
+    return f'<path class="{class_name}" style="--l:{cssLength(length)}"{stroke} d="{d}"/>'
@@ -0,0 +1,461 @@
+#
+# Event driven simulation of many discs in the width x height box, ball-ball and wall collisions
+# https://github.com/LEMettler
+#
+# Discs move on straight lines between events. The next wall hit, cell crossing and disc contact of every
+# disc are predicted and kept in one priority queue; an event is only executed if no disc involved changed
+# its velocity since the prediction (collision counters, stale events are skipped when they come up).
+# A uniform grid with cells at least one diameter wide limits the contact predictions to the discs of the
+# 3x3 neighbouring cells, the grid is updated by the cell crossing events.
+#
+# The trajectories are the primaries and every contact gets a spray of secondaries, written with the
+# absolute timeline (templates/path_template_loop.txt): each path is drawn at the simulated speed.
+#
+
+
+import os, io
+import math
+import heapq
+import numpy as np
+
+from pathset import PathSet
+from profiling import NO_STATS
+from timeline import loopKeyframes, roleKeyframes, dashValues, formatNumber
+from collision_builder import (CollisionBuider, seedSequence, secondarySprays, array2d_string, encodeSegments, secondaryGroup2Path,
+                               loadPathTemplate, randomColor, svgHeader, SvgWriter, openSvgTarget, LOOP_TEMPLATE)
+
+
+# event kinds
+CONTACT, WALL, CELL = 0, 1, 2
+
+
+def randomDiscs(n, radius, width, height, speed, rng=None):
+    '''
+    - n: number of discs, radius: their radius (scalar)
+    - speed: scalar or (min, max), the directions are uniform
+    - rng: np.random.Generator or seed
+    ---------------------------------------
+    Non overlapping start positions (jittered in the cells of a grid) and velocities: (n, 2), (n, 2)
+    '''
+    rng = np.random.default_rng(rng)
+    spacing = 2*radius*1.001
+    nx, ny = max(1, int((width - 2*radius)//spacing)), max(1, int((height - 2*radius)//spacing))
+    if nx*ny < n:
+        raise ValueError(f'{n} discs of radius {radius} do not fit into {width}x{height}')
+
+    # one disc per cell of the grid, the slack of the cell is left for the jitter
+    cw, ch = (width - 2*radius)/nx, (height - 2*radius)/ny
+    cells = rng.choice(nx*ny, size=n, replace=False)
+    jitter = rng.uniform(-0.5, 0.5, size=(n, 2))*[max(cw - spacing, 0), max(ch - spacing, 0)]
+    positions = np.stack((radius + (cells // ny + 0.5)*cw, radius + (cells % ny + 0.5)*ch), axis=-1) + jitter
+
+    speeds = rng.uniform(*speed, size=n) if np.ndim(speed) else np.full(n, float(speed))
+    angles = rng.uniform(0, 2*np.pi, size=n)
+    return positions, np.stack((np.cos(angles)*speeds, np.sin(angles)*speeds), axis=-1)
+
+
+
+class DiscSimulation:
+    '''
+    Elastic discs in the box [0, width] x [0, height], masses proportional to the area by default.
+    - run(until): execute all events up to time until
+    - paths(): trajectories of the disc centers (PathSet), times(i): time of every point of path i
+    - contacts: (time, x, y, angle, kind, i, j) of every contact, angle is the mean angle of its spray
+    - to_svg / to_svg_bytes / write_svg: the animation, collisionBuilder(): a static CollisionBuider
+    '''
+    def __init__(self, width, height, positions, velocities, radii=0., masses=None, cell_size=None,
+                 relative_margin=0.05, seed=None, stats=None):
+        '''
+        - positions, velocities: (n, 2)
+        - radii: scalar or (n), discs with radius 0 are points and only hit the walls
+        - cell_size: width of the cells of the spatial hash, at least one diameter (default: two diameters,
+          fewer cell crossings for a few more candidate pairs)
+        - seed: None, int, np.random.SeedSequence or np.random.Generator (sprays of the svg, see seedSequence)
+        - stats: optional RenderStats (see profiling.py), time of the simulation and its event counts
+        '''
+        self.width = width
+        self.height = height
+        self.relative_margin = relative_margin
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        velocities = np.asarray(velocities, dtype=float).reshape(-1, 2)
+        n = len(positions)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), (n,))
+        masses = np.where(radii > 0, radii**2, 1.) if masses is None else np.broadcast_to(np.asarray(masses, dtype=float), (n,))
+
+        if ((positions < radii[:, None]) | (positions > np.array([width, height]) - radii[:, None])).any():
+            raise ValueError('every disc has to lie inside the box')
+
+        # scalar state in lists, every event only touches one or two discs
+        self.x, self.y = positions[:, 0].tolist(), positions[:, 1].tolist()
+        self.vx, self.vy = velocities[:, 0].tolist(), velocities[:, 1].tolist()
+        self.t0 = [0.]*n  # time at which x, y were stored
+        self.radii = radii.tolist()
+        self.masses = masses.tolist()
+        self.counts = [0]*n  # velocity changes, predictions made before are stale
+
+        # spatial hash: cells at least one diameter wide, a single cell if all discs are points
+        diameter = 2*max(self.radii, default=0.)
+        size = max(cell_size or 2*diameter, diameter) if diameter > 0 else max(width, height)
+        self.nx, self.ny = max(1, int(width//size)), max(1, int(height//size))
+        self.cw, self.ch = width/self.nx, height/self.ny
+        self.cells = [set() for _ in range(self.nx*self.ny)]
+        self.cell = []
+        for i in range(n):
+            c = min(int(self.x[i]//self.cw), self.nx - 1)*self.ny + min(int(self.y[i]//self.ch), self.ny - 1)
+            self.cell.append(c)
+            self.cells[c].add(i)
+        self._checkOverlaps()
+
+        self.time = 0.
+        self.horizon = 0.
+        self.queue = []
+        self.trajectories = [[(0., self.x[i], self.y[i])] for i in range(n)]
+        self.contacts = []
+        self.seed_sequence = seedSequence(seed)
+        self.stats = NO_STATS if stats is None else stats
+
+
+    def __len__(self):
+        return len(self.x)
+
+
+    def _checkOverlaps(self):
+        for i in range(len(self)):
+            for j in self._neighbours(i):
+                if j > i and math.hypot(self.x[j] - self.x[i], self.y[j] - self.y[i]) < self.radii[i] + self.radii[j]:
+                    raise ValueError(f'discs {i} and {j} overlap')
+
+
+    def _neighbours(self, i):
+        '''discs in the 3x3 cells around the one of disc i (i included)'''
+        cx, cy = divmod(self.cell[i], self.ny)
+        for x in range(max(cx - 1, 0), min(cx + 2, self.nx)):
+            for y in range(max(cy - 1, 0), min(cy + 2, self.ny)):
+                yield from self.cells[x*self.ny + y]
+
+
+    def position(self, i, t=None):
+        '''center of disc i at time t (default: current time)'''
+        dt = (self.time if t is None else t) - self.t0[i]
+        return self.x[i] + self.vx[i]*dt, self.y[i] + self.vy[i]*dt
+
+
+    def _advance(self, i, t):
+        dt = t - self.t0[i]
+        self.x[i] += self.vx[i]*dt
+        self.y[i] += self.vy[i]*dt
+        self.t0[i] = t
+
+
+    ##################################################################
+    # predictions
+
+    def _push(self, t, kind, i, j):
+        if t <= self.horizon:
+            heapq.heappush(self.queue, (t, kind, i, j, self.counts[i], self.counts[j] if kind == CONTACT else 0))
+
+
+    def _predictWall(self, i, t):
+        x, y = self.position(i, t)
+        vx, vy, r = self.vx[i], self.vy[i], self.radii[i]
+        dt_x = (self.width - r - x)/vx if vx > 0 else (r - x)/vx if vx < 0 else math.inf
+        dt_y = (self.height - r - y)/vy if vy > 0 else (r - y)/vy if vy < 0 else math.inf
+        if dt_x <= dt_y:
+            self._push(t + max(dt_x, 0.), WALL, i, 0)
+        elif dt_y < math.inf:
+            self._push(t + max(dt_y, 0.), WALL, i, 1)
+
+
+    def _predictCell(self, i, t):
+        x, y = self.position(i, t)
+        vx, vy = self.vx[i], self.vy[i]
+        cx, cy = divmod(self.cell[i], self.ny)
+        dt_x = ((cx + 1)*self.cw - x)/vx if vx > 0 and cx + 1 < self.nx else (cx*self.cw - x)/vx if vx < 0 and cx > 0 else math.inf
+        dt_y = ((cy + 1)*self.ch - y)/vy if vy > 0 and cy + 1 < self.ny else (cy*self.ch - y)/vy if vy < 0 and cy > 0 else math.inf
+        if dt_x <= dt_y and dt_x < math.inf:
+            self._push(t + max(dt_x, 0.), CELL, i, self.cell[i] + (self.ny if vx > 0 else -self.ny))
+        elif dt_y < math.inf:
+            self._push(t + max(dt_y, 0.), CELL, i, self.cell[i] + (1 if vy > 0 else -1))
+
+
+    def _predictContacts(self, i, t):
+        x, y = self.position(i, t)
+        vx, vy, r = self.vx[i], self.vy[i], self.radii[i]
+        for j in self._neighbours(i):
+            sigma = r + self.radii[j]
+            if j == i or sigma == 0:
+                continue
+            xj, yj = self.position(j, t)
+            dx, dy, dvx, dvy = xj - x, yj - y, self.vx[j] - vx, self.vy[j] - vy
+            b = dx*dvx + dy*dvy
+            if b >= 0:
+                continue
+            vv = dvx*dvx + dvy*dvy
+            d = b*b - vv*(dx*dx + dy*dy - sigma*sigma)
+            if d < 0:
+                continue
+            self._push(t + max(-(b + math.sqrt(d))/vv, 0.), CONTACT, i, j)
+
+
+    def _predict(self, i, t):
+        self._predictWall(i, t)
+        self._predictCell(i, t)
+        self._predictContacts(i, t)
+
+
+    ##################################################################
+    # events
+
+    def _valid(self, event):
+        _, kind, i, j, count_i, count_j = event
+        return count_i == self.counts[i] and (kind != CONTACT or count_j == self.counts[j])
+
+
+    def _collide(self, t, i, j):
+        self._advance(i, t)
+        self._advance(j, t)
+        dx, dy = self.x[j] - self.x[i], self.y[j] - self.y[i]
+        sigma = self.radii[i] + self.radii[j]
+        dvx, dvy = self.vx[j] - self.vx[i], self.vy[j] - self.vy[i]
+        mi, mj = self.masses[i], self.masses[j]
+        # spray along the common motion of the pair (along the contact tangent if they meet head-on)
+        sx, sy = mi*self.vx[i] + mj*self.vx[j], mi*self.vy[i] + mj*self.vy[j]
+        if math.hypot(sx, sy) < 1e-9*math.hypot(dvx, dvy)*(mi + mj):
+            sx, sy = -dy, dx
+
+        impulse = 2*mi*mj*(dx*dvx + dy*dvy)/(sigma*(mi + mj))
+        fx, fy = impulse*dx/sigma, impulse*dy/sigma
+        self.vx[i] += fx/mi
+        self.vy[i] += fy/mi
+        self.vx[j] -= fx/mj
+        self.vy[j] -= fy/mj
+
+        ri = self.radii[i]/sigma
+        self.contacts.append((t, self.x[i] + ri*dx, self.y[i] + ri*dy, math.degrees(math.atan2(sy, sx)) % 360, CONTACT, i, j))
+        for k in (i, j):
+            self.counts[k] += 1
+            self.trajectories[k].append((t, self.x[k], self.y[k]))
+        for k in (i, j):
+            self._predict(k, t)
+
+
+    def _bounce(self, t, i, axis):
+        self._advance(i, t)
+        r = self.radii[i]
+        if axis == 0:
+            point, angle = (self.width if self.vx[i] > 0 else 0., self.y[i]), (180. if self.vx[i] > 0 else 0.)
+            self.vx[i] = -self.vx[i]
+        else:
+            point, angle = (self.x[i], self.height if self.vy[i] > 0 else 0.), (270. if self.vy[i] > 0 else 90.)
+            self.vy[i] = -self.vy[i]
+
+        self.contacts.append((t, point[0], point[1], angle, WALL, i, -1))
+        self.counts[i] += 1
+        self.trajectories[i].append((t, self.x[i], self.y[i]))
+        self._predict(i, t)
+
+
+    def _enterCell(self, t, i, cell):
+        self.cells[self.cell[i]].discard(i)
+        self.cells[cell].add(i)
+        self.cell[i] = cell
+        # velocity unchanged: walls and earlier contacts stay valid, only the new neighbours are predicted
+        self._predictCell(i, t)
+        self._predictContacts(i, t)
+
+
+    def run(self, until, max_events=None):
+        '''
+        - until: simulate up to this time
+        - max_events: optional, stop after this many executed collisions (the time stops at the last one)
+        ---------------------------------------
+        Returns the number of executed collisions (disc and wall).
+        '''
+        stats = self.stats
+        executed = stale = crossings = 0
+        with stats.span('simulation'):
+            if until > self.horizon:
+                # events behind the old horizon were never queued, predict everything again
+                self.horizon = until
+                self.queue = []
+                for i in range(len(self)):
+                    self._predict(i, self.time)
+
+            queue = self.queue
+            while queue and queue[0][0] <= until:
+                if max_events is not None and executed >= max_events:
+                    until = self.time
+                    break
+                event = heapq.heappop(queue)
+                if not self._valid(event):
+                    stale += 1
+                    continue
+                t, kind, i, j = event[:4]
+                self.time = t
+                if kind == CONTACT:
+                    self._collide(t, i, j)
+                    executed += 1
+                elif kind == WALL:
+                    self._bounce(t, i, j)
+                    executed += 1
+                else:
+                    self._enterCell(t, i, j)
+                    crossings += 1
+            self.time = until
+
+        stats.count('executed collisions', executed)
+        stats.count('stale events', stale)
+        stats.count('cell crossings', crossings)
+        return executed
+
+
+    ##################################################################
+    # output
+
+    def paths(self, t=None):
+        '''
+        Trajectories of the disc centers up to time t (default: current time) as PathSet, one path per disc.
+        '''
+        t = self.time if t is None else t
+        paths = PathSet(capacity=sum(map(len, self.trajectories)) + len(self))
+        for i in range(len(self)):
+            points = [(x, y) for s, x, y in self.trajectories[i] if s < t]
+            points.append(self.position(i, t))
+            paths.append(np.array(points, dtype=float))
+        return paths
+
+
+    def times(self, i, t=None):
+        '''time of every point of path i (see paths)'''
+        t = self.time if t is None else t
+        return np.array([s for s, _, _ in self.trajectories[i] if s < t] + [t])
+
+
+    def contactArrays(self, walls=True, t=None):
+        '''
+        Contacts up to time t as arrays: (times, points (m, 2), angles), without the wall contacts if not walls.
+        '''
+        t = self.time if t is None else t
+        contacts = [c for c in self.contacts if c[0] <= t and (walls or c[4] == CONTACT)]
+        if not contacts:
+            return np.zeros(0), np.zeros((0, 2)), np.zeros(0)
+        contacts = np.array([c[:4] for c in contacts], dtype=float)
+        return contacts[:, 0], contacts[:, 1:3], contacts[:, 3]
+
+
+    def sprays(self, n_secondaries, alpha_std=30, length_mean=10, length_std=4, walls=True, t=None):
+        '''
+        Secondaries of every contact (see contactArrays), the secondaries of contact k are the paths [k*n, (k+1)*n).
+        The spray stream only depends on the seed, the same simulation always gets the same sprays.
+        '''
+        _, points, angles = self.contactArrays(walls, t)
+        return secondarySprays(points, angles, n_secondaries, alpha_std, length_mean, length_std,
+                               rng=np.random.default_rng(self._stream(0)))
+
+
+    def _stream(self, key):
+        # fixed child of the root seed: 0 sprays, 1 random colors
+        root = self.seed_sequence
+        return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (key,), pool_size=root.pool_size)
+
+
+    def collisionBuilder(self, n_secondaries=8, alpha_std=30, length_mean=10, length_std=4, walls=False, t=None):
+        '''
+        Static CollisionBuider with the trajectories as primaries and the sprays as secondaries, for its
+        write_svg (all paths grow at once), plotResult and the rasterizer.
+        '''
+        builder = CollisionBuider(self.width, self.height, [self.width/2, self.height/2], incoming_angles=[],
+                                  relative_margin=self.relative_margin, seed=self.seed_sequence)
+        builder.primary_paths = self.paths(t)
+        builder.secondary_paths = self.sprays(n_secondaries, alpha_std, length_mean, length_std, walls, t)
+        return builder
+
+
+    def to_svg(self, name, compresslevel=9, **kwargs):
+        '''
+        - name: file name (.svgz: gzip compressed with compresslevel) or writable (text or binary) file object
+        - kwargs: see write_svg
+        '''
+        with openSvgTarget(name, compresslevel) as file:
+            self.write_svg(file, **kwargs)
+
+        if isinstance(name, (str, os.PathLike)):
+            print(f'Writen to {name}!')
+
+
+    def to_svg_bytes(self, **kwargs):
+        buffer = io.BytesIO()
+        self.write_svg(buffer, **kwargs)
+        return buffer.getvalue()
+
+
+    def write_svg(self, file, primary_color='#ffffff', secondary_color='#00c666', primary_stroke_width=2,
+                  secondary_stroke_width=1, time_scale=1.0, secondary_duration=0.4, dur_fade_primary=1.0,
+                  dur_fade_secondary=0.5, dur_freeze_secondary=0.2, n_secondaries=8, alpha_std=30,
+                  length_mean=10, length_std=4, wall_sprays=False, merge_secondaries=False,
+                  background_color='#dc7474', box_color='#3c3c3c', chunk_size=1<<16,
+                  precision=3, relative=False, shortcuts=False, minify=False):
+        '''
+        Animation of the simulation up to the current time, one loop lasts until the last spray has faded.
+        - time_scale: seconds of animation per unit of simulated time
+        - primary_*: trajectories of the disc centers, drawn at the simulated speed ('0': random color per disc)
+        - n_secondaries, alpha_std, length_mean, length_std: spray of every contact (see sprays)
+        - wall_sprays: also a spray at every wall collision
+        - merge_secondaries: one path per spray instead of a group (see secondaryGroup2Path)
+        - precision, relative, shortcuts: path data encoding (see encodePathData), minify: see SvgMinifier
+        '''
+        stats = self.stats
+        writer = SvgWriter(file, chunk_size=chunk_size, stats=stats, minify=minify)
+        encoding = dict(precision=precision, relative=relative, shortcuts=shortcuts)
+        color_rng = np.random.default_rng(self._stream(1))
+        end = self.time*time_scale
+        period = end + max(dur_fade_primary, secondary_duration, dur_freeze_secondary + dur_fade_secondary)
+
+        with stats.span('template filling'):
+            writer.write(svgHeader(self.width, self.height, self.relative_margin, background_color, box_color))
+
+        template = loadPathTemplate(LOOP_TEMPLATE)
+        opacity_times, opacity_values = loopKeyframes([0., end, end + dur_fade_primary], [1., 1., 0.], period)
+        loop = f'begin="0s" dur="{formatNumber(period)}s" repeatCount="indefinite"'
+        primary_template = template.partial(width=f'{primary_stroke_width}', loop=loop,
+                                            opacity_values=';'.join(map(formatNumber, opacity_values)),
+                                            opacity_times=';'.join(map(formatNumber, opacity_times)))
+
+        paths = self.paths()
+        for i, (path, length) in enumerate(zip(paths, paths.lengths())):
+            if length == 0:
+                continue
+            with stats.span('path encoding'):
+                d_string = array2d_string(path, inverse_direction=False, **encoding)
+            with stats.span('template filling'):
+                # hidden fraction of the path at every event of the disc: drawn at the simulated speed
+                hidden = 1 - np.concatenate(([0.], np.cumsum(np.hypot(*np.diff(path, axis=1)))))/length
+                times, values = loopKeyframes(self.times(i)*time_scale, hidden, period)
+                col = randomColor(color_rng) if primary_color == '0' else primary_color
+                writer.write(primary_template.fill(path=d_string, length=str(length), color=col,
+                                                   stroke_values=dashValues(values, length),
+                                                   stroke_times=';'.join(map(formatNumber, times))) + '\n')
+
+        # one group per contact, it begins at the time of the contact
+        begins, _, _ = self.contactArrays(wall_sprays)
+        if n_secondaries > 0 and len(begins):
+            with stats.span('secondary sampling'):
+                sprays = self.sprays(n_secondaries, alpha_std, length_mean, length_std, wall_sprays)
+            with stats.span('path encoding'):
+                lengths = sprays.lengths()
+                d_strings = encodeSegments(sprays.coords[0::2], sprays.coords[1::2], **encoding)
+            keyframes = roleKeyframes(period, primary_duration=0, secondary_duration=secondary_duration,
+                                      dur_fade_primary=dur_fade_primary, dur_fade_secondary=dur_fade_secondary,
+                                      dur_freeze_secondary=dur_freeze_secondary)['secondary']
+            with stats.span('template filling'):
+                for k, begin in enumerate(begins*time_scale):
+                    spray = slice(k*n_secondaries, (k + 1)*n_secondaries)
+                    colors = [randomColor(color_rng) for _ in range(n_secondaries)] if secondary_color == '0' else None
+                    group, _ = secondaryGroup2Path(d_strings[spray], lengths[spray], color=secondary_color,
+                                                   stroke_width=secondary_stroke_width, colors=colors,
+                                                   merge=merge_secondaries, timeline=(keyframes, begin, period))
+                    writer.write(group + '\n')
+            stats.count('secondary paths', len(d_strings))
+
+        writer.write('</g>\n\n</svg>')
+        writer.flush()
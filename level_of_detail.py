@@ -0,0 +1,279 @@
+#
+# Level of detail for the secondaries: drop sub-pixel and covered strokes, merge collinear ones, fit a scene into
+# an element/byte budget
+# https://github.com/LEMettler
+#
+# Four passes, every one only removes secondaries (or merges them into a kept one):
+# 0. negative: sampled with a length <= 0 (flagged in the PathSet), they point backwards out of the spray
+# 1. sub-pixel: shorter than min_length pixels at the size the document is shown at
+# 2. overlap: the secondaries of a collision are laid on a grid of about one stroke width; longest first,
+#    a secondary whose cells are already covered by more than max_overlap is dropped; one that lies on the line of a
+#    kept secondary (within half a cell) and overlaps it is merged: the kept one is extended to cover both
+# 3. budget: the whole document is rendered without and with the secondaries, the remaining secondaries
+#    (longest first) are kept as long as the estimated elements/bytes fit into max_elements/max_bytes,
+#    checked by rendering; report['fits'] is False if the document is too large even without secondaries
+#
+
+
+import numpy as np
+
+
+
+def segmentEnds(paths):
+    '''first and last point of every path of a PathSet (the secondaries are straight segments): (n, 2), (n, 2)'''
+    offsets = paths.offsets
+    filled = offsets[1:] > offsets[:-1]
+    starts, ends = np.zeros((len(paths), 2)), np.zeros((len(paths), 2))
+    starts[filled] = paths.coords[offsets[:-1][filled]]
+    ends[filled] = paths.coords[offsets[1:][filled] - 1]
+    return starts, ends
+
+
+def segmentCells(starts, ends, cell_size):
+    '''
+    - starts, ends: (n, 2) segments, cell_size: width of the grid cells
+    ---------------------------------------
+    Grid cells every segment passes through (sampled every half cell): flat cell ids and the (n+1) bounds
+    of the ids of every segment.
+    '''
+    lengths = np.hypot(*(ends - starts).T)
+    n_samples = np.ceil(lengths/(cell_size/2)).astype(np.int64) + 1
+    bounds = np.concatenate(([0], np.cumsum(n_samples)))
+    segment = np.repeat(np.arange(len(starts)), n_samples)
+
+    # position of every sample along its segment, 0 at the start and 1 at the end
+    step = np.arange(bounds[-1]) - bounds[:-1][segment]
+    fraction = step/np.maximum(n_samples - 1, 1)[segment]
+    points = starts[segment] + (ends - starts)[segment]*fraction[:, None]
+
+    cells = np.floor(points/cell_size).astype(np.int64)
+    return (cells[:, 0] << 32) ^ (cells[:, 1] & 0xffffffff), bounds
+
+
+def thinOverlaps(starts, ends, cell_size, max_overlap=0.5, candidates=None, merge=False):
+    '''
+    - cell_size: about the stroke width, strokes in the same cells cover each other
+    - max_overlap: drop a secondary if more than this fraction of its cells is covered already
+    - candidates: optional mask, only these secondaries are considered (the rest is dropped)
+    - merge: join collinear overlapping secondaries, starts and ends of the kept ones are extended in place
+    ---------------------------------------
+    Greedy thinning, longest secondaries first. Returns the mask of the kept secondaries,
+    with merge the masks (kept, merged).
+    '''
+    keep = np.zeros(len(starts), dtype=bool)
+    merged = np.zeros(len(starts), dtype=bool)
+    indices = np.arange(len(starts)) if candidates is None else np.flatnonzero(candidates)
+    if len(indices) == 0:
+        return (keep, merged) if merge else keep
+
+    ids, bounds = segmentCells(starts[indices], ends[indices], cell_size)
+    ids, bounds = ids.tolist(), bounds.tolist()
+    lengths = np.hypot(*(ends[indices] - starts[indices]).T)
+
+    owners = {}  # cell -> first kept secondary in it
+    segments = np.hstack((starts, ends)).tolist() if merge else None
+    grown = set()
+    for k in np.argsort(-lengths, kind='stable').tolist():
+        cells = set(ids[bounds[k]:bounds[k + 1]])
+        covered = cells & owners.keys()
+        if merge and covered:
+            target = _collinearOwner(segments, indices[k], sorted(set(map(owners.__getitem__, covered))), cell_size/2)
+            if target is not None:
+                merged[indices[k]] = True
+                if _extend(segments, target, indices[k]):
+                    grown.add(target)
+                    x0, y0, x1, y1 = segments[target]
+                    cells = segmentCells(np.array([[x0, y0]]), np.array([[x1, y1]]), cell_size)[0].tolist()
+                    owners.update((cell, target) for cell in cells if cell not in owners)
+                continue
+        if len(covered) <= max_overlap*len(cells):
+            keep[indices[k]] = True
+            owners.update(dict.fromkeys(cells - covered, indices[k]))
+
+    for j in grown:
+        starts[j], ends[j] = segments[j][:2], segments[j][2:]
+    return (keep, merged) if merge else keep
+
+
+def _collinearOwner(segments, i, owners, tolerance):
+    # first kept secondary whose line passes within tolerance of both ends of i, and whose extent overlaps i
+    ax, ay, bx, by = segments[i]
+    for j in owners:
+        x0, y0, x1, y1 = segments[j]
+        length = np.hypot(x1 - x0, y1 - y0)
+        if length == 0:
+            continue
+        ux, uy = (x1 - x0)/length, (y1 - y0)/length
+        if abs((ay - y0)*ux - (ax - x0)*uy) > tolerance or abs((by - y0)*ux - (bx - x0)*uy) > tolerance:
+            continue
+        ta, tb = (ax - x0)*ux + (ay - y0)*uy, (bx - x0)*ux + (by - y0)*uy
+        if min(ta, tb) <= length and max(ta, tb) >= 0:
+            return j
+    return None
+
+
+def _extend(segments, j, i):
+    # extend secondary j along its own line over the projection of i, its direction is kept; True if it grew
+    ax, ay, bx, by = segments[i]
+    x0, y0, x1, y1 = segments[j]
+    length = np.hypot(x1 - x0, y1 - y0)
+    ux, uy = (x1 - x0)/length, (y1 - y0)/length
+    ta, tb = (ax - x0)*ux + (ay - y0)*uy, (bx - x0)*ux + (by - y0)*uy
+    low, high = min(ta, tb, 0.), max(ta, tb, length)
+    if low > -1e-9*length and high < (1 + 1e-9)*length:
+        return False
+    segments[j] = [x0 + low*ux, y0 + low*uy, x0 + high*ux, y0 + high*uy]
+    return True
+
+
+def budgetKeep(priorities, costs, budget):
+    '''
+    Keep the items with the highest priority as long as the sum of their costs fits into budget: mask.
+    '''
+    order = np.argsort(-np.asarray(priorities), kind='stable')
+    fits = np.cumsum(np.asarray(costs, dtype=float)[order]) <= budget
+    keep = np.zeros(len(order), dtype=bool)
+    keep[order[fits]] = True
+    return keep
+
+
+def measureSvg(data):
+    '''bytes and number of elements of a rendered document'''
+    return {'bytes': len(data),
+            'elements': data.count(b'<') - data.count(b'</') - data.count(b'<?') - data.count(b'<!')}
+
+
+
+def cullSecondaries(builders, render, min_length=1.0, pixel_size=1.0, stroke_widths=1.0, max_overlap=0.5,
+                    max_elements=None, max_bytes=None, measure=False, precision=3, on_change=None):
+    '''
+    - builders: CollisionBuider of every collision of the scene, their secondary_paths are replaced
+    - render: renders the whole scene, returns utf-8 bytes (needed for the budget and measure)
+    - min_length: in pixels, pixel_size: path units per pixel of the displayed document
+    - stroke_widths: scalar or one per builder, the cell size of the overlap grid (in path units)
+    - max_overlap: see thinOverlaps, None skips the overlap pass
+    - max_elements, max_bytes: optional budget of the whole rendered document (uncompressed)
+    - measure: render before and after, the report then has the elements and bytes
+    - precision: path data precision of render (estimates the bytes of every secondary)
+    - on_change: called after the secondaries of the builders changed (e.g. to drop cached fragments)
+    ---------------------------------------
+    Returns the report: numbers of secondaries and of the ones dropped by every pass.
+    '''
+    stroke_widths = np.broadcast_to(np.asarray(stroke_widths, dtype=float), (len(builders),))
+    on_change = on_change or (lambda: None)
+    report = {'secondaries': sum(len(builder.secondary_paths) for builder in builders),
+              'negative': 0, 'sub-pixel': 0, 'merged': 0, 'overlapping': 0, 'budget': 0}
+    if measure:
+        before = measureSvg(render())
+        report.update({'elements_before': before['elements'], 'bytes_before': before['bytes']})
+
+    for builder, stroke_width in zip(builders, stroke_widths):
+        starts, ends = segmentEnds(builder.secondary_paths)
+        negative = builder.secondary_paths.flags
+        visible = ~negative & (builder.secondary_paths.lengths() >= min_length*pixel_size)
+        keep, merged = visible, np.zeros(len(visible), dtype=bool)
+        if max_overlap is not None:
+            original = starts.copy(), ends.copy()
+            keep, merged = thinOverlaps(starts, ends, max(stroke_width, pixel_size), max_overlap, candidates=visible,
+                                        merge=True)
+        report['negative'] += int(negative.sum())
+        report['sub-pixel'] += int((~negative & ~visible).sum())
+        report['merged'] += int(merged.sum())
+        report['overlapping'] += int((visible & ~keep & ~merged).sum())
+        kept = builder.secondary_paths.subset(keep)
+        if max_overlap is not None:
+            # write the extended secondaries (two point paths) into the gathered copy
+            extended = (np.any(starts != original[0], axis=1) | np.any(ends != original[1], axis=1))[keep]
+            kept.coords[kept.offsets[:-1][extended]] = starts[keep][extended]
+            kept.coords[kept.offsets[1:][extended] - 1] = ends[keep][extended]
+        builder.secondary_paths = kept
+    on_change()
+
+    if max_elements is not None or max_bytes is not None:
+        report['budget'], report['fits'] = _fitBudget(builders, render, max_elements, max_bytes, precision, on_change)
+
+    report['kept'] = sum(len(builder.secondary_paths) for builder in builders)
+    if measure or max_elements is not None or max_bytes is not None:
+        after = measureSvg(render())
+        report.update({'elements': after['elements'], 'bytes': after['bytes']})
+    return report
+
+
+def _fitBudget(builders, render, max_elements, max_bytes, precision, on_change):
+    from collision_builder import encodeSegments
+
+    # cost of the document without any secondary and the average cost of one
+    paths = [builder.secondary_paths for builder in builders]
+    full = measureSvg(render())
+    for builder in builders:
+        builder.secondary_paths = builder.secondary_paths.subset([])
+    on_change()
+    fixed = measureSvg(render())
+    for builder, path_set in zip(builders, paths):
+        builder.secondary_paths = path_set
+    on_change()
+
+    n = sum(map(len, paths))
+    if n == 0:
+        return 0, not any(budget is not None and fixed[name] > budget
+                          for name, budget in (('elements', max_elements), ('bytes', max_bytes)))
+    lengths = np.concatenate([path_set.lengths() for path_set in paths])
+    d_lengths = np.array([len(d) for path_set in paths for d in encodeSegments(*segmentEnds(path_set), precision=precision)])
+    element_costs = np.full(n, (full['elements'] - fixed['elements'])/n)
+    byte_costs = d_lengths + (full['bytes'] - fixed['bytes'] - d_lengths.sum())/n
+
+    budgets = {'elements': max_elements, 'bytes': max_bytes}
+    costs = {'elements': element_costs, 'bytes': byte_costs}
+    split = np.cumsum([0] + [len(path_set) for path_set in paths])
+
+    def apply(keep):
+        for k, (builder, path_set) in enumerate(zip(builders, paths)):
+            builder.secondary_paths = path_set.subset(keep[split[k]:split[k + 1]])
+        on_change()
+        result = measureSvg(render())
+        return not any(budget is not None and result[name] > budget for name, budget in budgets.items()), result
+
+    for _ in range(4):
+        keep = np.ones(n, dtype=bool)
+        for name, budget in budgets.items():
+            if budget is not None:
+                keep &= budgetKeep(lengths, costs[name], budget - fixed[name])
+
+        # the costs are averages (e.g. the <g> of grouped secondaries), check and scale them if it does not fit
+        fits, result = apply(keep)
+        if fits or not keep.any():
+            break
+        over = [result[name]/budget for name, budget in budgets.items() if budget is not None and result[name] > budget]
+        for name in costs:
+            costs[name] = costs[name]*max(over)
+
+    if not fits and keep.any():
+        # the estimate still overshoots: bisect how many of the kept ones (longest first) fit
+        kept = np.flatnonzero(keep)[np.argsort(-lengths[keep], kind='stable')]
+        low, high = 0, len(kept)
+        while high - low > 1:
+            middle = (low + high)//2
+            keep = np.zeros(n, dtype=bool)
+            keep[kept[:middle]] = True
+            if apply(keep)[0]:
+                low = middle
+            else:
+                high = middle
+        keep = np.zeros(n, dtype=bool)
+        keep[kept[:low]] = True
+        fits = apply(keep)[0]
+    return int(n - keep.sum()), fits
+
+
+def reportCulling(report):
+    line = (f"Secondaries: {report['secondaries']} -> {report['kept']} "
+            f"({report['negative']} negative, {report['sub-pixel']} sub-pixel, {report['merged']} merged, "
+            f"{report['overlapping']} overlapping, {report['budget']} over budget)")
+    if 'elements' in report and 'elements_before' in report:
+        line += (f", {report['elements_before']} -> {report['elements']} elements, "
+                 f"{report['bytes_before']} -> {report['bytes']} bytes")
+    elif 'elements' in report:
+        line += f", {report['elements']} elements, {report['bytes']} bytes"
+    if not report.get('fits', True):
+        line += ', the budget is not met even without secondaries'
+    print(line)
@@ -0,0 +1,205 @@
+#
+# Array backed storage for the primary and secondary paths of a collision
+# https://github.com/LEMettler
+#
+
+
+import hashlib
+import numpy as np
+
+
+
+class PathSet:
+    '''
+    Many 2d paths in one contiguous (n_points, 2) coordinate buffer plus an offsets array.
+    Path i consists of the points coords[offsets[i]:offsets[i+1]].
+
+    - indexing returns a zero-copy (2, n) view, so path[0] are the x and path[1] the y values
+      (the same layout as the former [[x0, x1, ...], [y0, y1, ...]] lists)
+    - the buffers grow geometrically, appending is amortized O(1)
+    - pickling only ships the used part of both arrays
+    - optional flags: one bool per path set by add_segments (e.g. secondaries sampled with a negative length),
+      kept by subset and False for paths added otherwise
+    '''
+
+    def __init__(self, dtype=np.float64, capacity=0):
+        self.dtype = np.dtype(dtype)
+        self._coords = np.empty((capacity, 2), dtype=self.dtype)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._n_points = 0
+        self._flags = None
+
+
+    @classmethod
+    def from_arrays(cls, coords, offsets, dtype=None, flags=None):
+        '''
+        - coords: (n_points, 2) coordinates of all paths, one after another
+        - offsets: (n_paths+1) start index of every path and the total number of points
+        - flags: optional (n_paths) bools
+        '''
+        coords = np.asarray(coords, dtype=dtype)
+        path_set = cls(dtype=coords.dtype)
+        path_set._coords = np.ascontiguousarray(coords).reshape(-1, 2)
+        path_set._offsets = np.asarray(offsets, dtype=np.int64)
+        path_set._n_points = int(path_set._offsets[-1])
+        path_set._flags = None if flags is None else np.asarray(flags, dtype=bool)
+        return path_set
+
+
+    def _reserve(self, n_points):
+        needed = self._n_points + n_points
+        if needed > len(self._coords):
+            grown = np.empty((max(needed, 2*len(self._coords)), 2), dtype=self.dtype)
+            grown[:self._n_points] = self._coords[:self._n_points]
+            self._coords = grown
+
+
+    def append(self, points):
+        '''
+        - points: (n, 2) array-like with the points of one path
+        '''
+        self.extend([points])
+
+
+    def extend(self, paths):
+        '''
+        - paths: iterable of (n_i, 2) array-likes, one per path
+        '''
+        paths = [np.asarray(points, dtype=self.dtype).reshape(-1, 2) for points in paths]
+        if not paths:
+            return
+
+        n_new = [len(points) for points in paths]
+        self._reserve(sum(n_new))
+
+        start = self._n_points
+        self._coords[start:start + sum(n_new)] = np.concatenate(paths)
+        self._offsets = np.concatenate((self._offsets, start + np.cumsum(n_new)))
+        self._n_points += sum(n_new)
+        if self._flags is not None:
+            self._flags = np.concatenate((self._flags, np.zeros(len(paths), dtype=bool)))
+
+
+    def add_segments(self, starts, ends, flags=None):
+        '''
+        - starts, ends: (n, 2) arrays, every row pair becomes a two point path
+        - flags: optional (n) bools of the new paths
+        ---------------------------------------
+        Bulk append of straight segments, written directly into the buffers.
+        '''
+        starts = np.asarray(starts).reshape(-1, 2)
+        ends = np.asarray(ends).reshape(-1, 2)
+        n = len(ends)
+        self._reserve(2*n)
+
+        start = self._n_points
+        self._coords[start:start + 2*n:2] = starts
+        self._coords[start+1:start + 2*n:2] = ends
+        self._offsets = np.concatenate((self._offsets, start + 2*np.arange(1, n+1)))
+        self._n_points += 2*n
+        if flags is not None or self._flags is not None:
+            new = np.zeros(n, dtype=bool) if flags is None else np.asarray(flags, dtype=bool).reshape(-1)
+            self._flags = np.concatenate((self.flags[:len(self) - n], new))
+
+
+    def subset(self, indices):
+        '''
+        - indices: path indices or a boolean mask over the paths
+        ---------------------------------------
+        New PathSet with only these paths (in this order), copied in one gather.
+        '''
+        indices = np.asarray(indices)
+        indices = np.flatnonzero(indices) if indices.dtype == bool else indices.astype(np.int64)
+        starts, ends = self._offsets[indices], self._offsets[indices + 1]
+        n_points = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(n_points)))
+        # index of every kept point in the old buffer
+        points = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, n_points)
+        flags = None if self._flags is None else self._flags[indices]
+        return PathSet.from_arrays(self.coords[points], offsets, dtype=self.dtype, flags=flags)
+
+
+    def clear(self):
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._n_points = 0
+        self._flags = None
+
+
+    @property
+    def coords(self):
+        '''(n_points, 2) view of all coordinates'''
+        return self._coords[:self._n_points]
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def flags(self):
+        '''(n_paths) bools, all False if none were set'''
+        return np.zeros(len(self), dtype=bool) if self._flags is None else self._flags
+
+    @property
+    def nbytes(self):
+        return self.coords.nbytes + self._offsets.nbytes
+
+
+    def digest(self):
+        '''sha256 hex digest of the dtype, offsets and coordinates'''
+        h = hashlib.sha256(self.dtype.str.encode())
+        h.update(np.ascontiguousarray(self._offsets).tobytes())
+        h.update(np.ascontiguousarray(self.coords).tobytes())
+        return h.hexdigest()
+
+
+    def points(self, i):
+        '''(n, 2) view of the points of path i'''
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PathSet index out of range')
+        return self._coords[self._offsets[i]:self._offsets[i+1]]
+
+
+    def lengths(self):
+        '''
+        Euclidean length of every path, computed for all paths at once.
+        '''
+        coords = self.coords
+        if len(coords) == 0:
+            return np.zeros(len(self))
+
+        # segments[k] is the step from point k-1 to point k, the steps between paths cancel below
+        segments = np.sqrt(np.sum(np.diff(coords, axis=0, prepend=coords[:1])**2, axis=1, dtype=np.float64))
+        cumulative = np.cumsum(segments)
+
+        starts, ends = self._offsets[:-1], self._offsets[1:]
+        lengths = np.zeros(len(self))
+        filled = ends > starts
+        lengths[filled] = cumulative[ends[filled] - 1] - cumulative[starts[filled]]
+        return lengths
+
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self.points(i).T
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f'PathSet({len(self)} paths, {self._n_points} points, {self.dtype})'
+
+
+    def __getstate__(self):
+        return {'dtype': self.dtype.str, 'coords': self.coords, 'offsets': self._offsets, 'flags': self._flags}
+
+    def __setstate__(self, state):
+        self.dtype = np.dtype(state['dtype'])
+        self._coords = state['coords']
+        self._offsets = state['offsets']
+        self._n_points = int(self._offsets[-1])
+        self._flags = state.get('flags')
@@ -0,0 +1,111 @@
+#
+# Opt-in timing spans and counters for the render pipeline
+# https://github.com/LEMettler
+#
+
+
+import time
+import contextlib
+from collections import defaultdict
+
+
+
+class RenderStats:
+    '''
+    Collects named timing spans and counters of a render.
+
+    - span(name): context manager, the time spent inside is added to name. Spans nest, a span only
+      counts its own time (a 'file writing' span inside 'template filling' is not counted twice)
+    - count(name, n): add n to a counter (paths, points, bytes, ...)
+    - callback(name, seconds): optional, called at the end of every span (e.g. for live logging)
+    '''
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self._stack = []
+
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        self._stack.append(0.)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.times[name] += elapsed - children
+            self.calls[name] += 1
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+
+    def merge(self, other):
+        '''
+        - other: RenderStats or a dict from as_dict (e.g. returned by a worker process)
+        '''
+        if isinstance(other, RenderStats):
+            other = other.as_dict()
+        for name, seconds in other['times'].items():
+            self.times[name] += seconds
+        for name, calls in other['calls'].items():
+            self.calls[name] += calls
+        for name, n in other['counters'].items():
+            self.counters[name] += n
+        return self
+
+
+    def as_dict(self):
+        return {'times': dict(self.times), 'calls': dict(self.calls), 'counters': dict(self.counters)}
+
+
+    @property
+    def total(self):
+        return sum(self.times.values())
+
+
+    def report(self):
+        '''
+        Per stage breakdown (slowest first) and the counters as a printable table.
+        '''
+        total = self.total or 1.
+        lines = [f'{"stage":<20} {"time":>10} {"share":>7} {"calls":>7}']
+        for name, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append(f'{name:<20} {seconds*1e3:8.2f}ms {seconds/total*100:6.1f}% {self.calls[name]:>7}')
+        lines.append(f'{"total":<20} {self.total*1e3:8.2f}ms')
+        if self.counters:
+            lines.append('')
+            lines += [f'{name:<20} {n:>10}' for name, n in self.counters.items()]
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'RenderStats({len(self.times)} stages, {self.total*1e3:.2f}ms)'
+
+
+
+class _NoStats:
+    '''
+    Stand-in while profiling is disabled: spans and counters do nothing.
+    '''
+    _span = contextlib.nullcontext()
+
+    def span(self, name):
+        return self._span
+
+    def count(self, name, n=1):
+        pass
+
+    def __bool__(self):
+        return False
+
+
+NO_STATS = _NoStats()
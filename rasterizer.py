@@ -0,0 +1,549 @@
+#
+# Pure NumPy preview of the animations: frames at any time t, PNG and GIF export
+# https://github.com/LEMettler
+#
+# python3 rasterizer.py configs/example.json preview.gif --fps 20 --scale 0.5
+# python3 rasterizer.py configs/example.json frame.png --time 2.5
+# python3 rasterizer.py configs/example.json frames/            (numbered pngs)
+#
+
+
+import os, sys
+import argparse
+import inspect
+import struct
+import zlib
+import numpy as np
+
+from collision_builder import CollisionBuider, STYLE_PARAMETERS, randomColor
+from timeline import chainBegins
+
+
+
+# defaults of CollisionBuider.write_svg, the rasterizer draws with the same style
+STYLE_DEFAULTS = {key: parameter.default for key, parameter in inspect.signature(CollisionBuider.write_svg).parameters.items()
+                  if key in STYLE_PARAMETERS}
+
+
+def hexToRgb(color):
+    '''
+    '#rrggbb' or '#rgb' -> (3) floats in [0, 1]
+    '''
+    color = color.strip().lstrip('#')
+    if len(color) == 3:
+        color = ''.join(2*c for c in color)
+    if len(color) != 6:
+        raise ValueError(f'Cannot rasterize color {color!r}, use #rrggbb')
+    return np.array([int(color[i:i+2], 16) for i in (0, 2, 4)], dtype=np.float32)/255
+
+
+def _clip01(x):
+    return min(max(x, 0.), 1.)
+
+
+
+##################################################################
+# timing, the same as the SMIL animations of the svgs
+
+def collisionState(t, primary_begin, primary_duration, secondary_duration,
+                   dur_fade_primary, dur_fade_secondary, dur_freeze_secondary, **style):
+    '''
+    State of a single collision (CollisionBuider.write_svg) at time t:
+    (primary drawn fraction, primary opacity, secondary drawn fraction, secondary opacity)
+    The cycle restarts when the secondaries have faded (primarygrow begins at secondaryfade.end).
+    '''
+    if t < primary_begin:
+        return 0., 1., 0., 1.
+    period = primary_duration + dur_freeze_secondary + dur_fade_secondary
+    tau = (t - primary_begin) % period
+    return chainState(tau, primary_duration, secondary_duration, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary)
+
+
+def chainState(tau, primary_duration, secondary_duration, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary):
+    '''
+    - tau: time since the primaries of the collision started to grow (in the current cycle)
+    '''
+    primary = _clip01(tau/primary_duration) if primary_duration > 0 else 1.
+    primary_opacity = 1 - _clip01((tau - primary_duration)/dur_fade_primary) if dur_fade_primary > 0 else float(tau < primary_duration)
+
+    if tau < primary_duration:
+        return primary, primary_opacity, 0., 1.
+    after = tau - primary_duration
+    secondary = _clip01(after/secondary_duration) if secondary_duration > 0 else 1.
+    secondary_opacity = 1 - _clip01((after - dur_freeze_secondary)/dur_fade_secondary) if dur_fade_secondary > 0 \
+                        else float(after < dur_freeze_secondary)
+    return primary, primary_opacity, secondary, secondary_opacity
+
+
+def animationPeriod(builder, **style):
+    '''
+    Duration of one loop of the animation (and its start) of a CollisionBuider or ConsecutiveCollisionBuilder.
+    '''
+    if isinstance(builder, CollisionBuider):
+        style = dict(STYLE_DEFAULTS, **style)
+        return style['primary_begin'], style['primary_duration'] + style['dur_freeze_secondary'] + style['dur_fade_secondary']
+    return 0., float(sum(coll.primary_duration for coll in builder.collisions))
+
+
+
+##################################################################
+# drawing
+
+def visibleSegments(path_set, drawn, reverse=False):
+    '''
+    - path_set: PathSet, drawn: (n_paths) drawn fraction of every path (stroke-dashoffset growth)
+    - reverse: the paths are drawn from their last point (like the primaries, see array2d_string)
+    ---------------------------------------
+    The visible straight pieces: (starts (n, 2), ends (n, 2), path index (n))
+    '''
+    coords = path_set.coords.astype(np.float64)
+    offsets = path_set.offsets
+    n_paths = len(path_set)
+    empty = np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+    if len(coords) < 2 or n_paths == 0:
+        return empty
+
+    path_of_point = np.repeat(np.arange(n_paths), np.diff(offsets))
+    path = path_of_point[:-1]
+    inside = path == path_of_point[1:]  # segments between two paths are no segments
+
+    p0, p1 = coords[:-1], coords[1:]
+    lengths = np.hypot(*(p1 - p0).T)*inside
+    cumulative = np.concatenate(([0.], np.cumsum(lengths)))
+
+    # distance along the path to the beginning of every segment and total length of its path
+    start = cumulative[:-1] - cumulative[offsets[path]]
+    total = cumulative[offsets[path + 1] - 1] - cumulative[offsets[path]]
+    if reverse:
+        start = total - start - lengths
+        p0, p1 = p1, p0
+
+    drawn_length = np.asarray(drawn, dtype=np.float64)[path]*total
+    visible = inside & (drawn_length > start) & (lengths > 0)
+    part = np.minimum(1., (drawn_length - start)/np.where(lengths > 0, lengths, 1.))[visible]
+
+    p0, p1 = p0[visible], p1[visible]
+    return p0, p0 + (p1 - p0)*part[:, None], path[visible]
+
+
+
+class Rasterizer:
+    '''
+    Canvas of a document: background, the scaled and translated box or table (the same transform as svgHeader)
+    and anti-aliased strokes composited in document order.
+    - scale: output pixels per svg unit
+    - table: optional tables.Table, its polygons are filled instead of the box (even-odd, obstacles left out)
+    - piece: strokes are cut into pieces of at most this many pixels, every piece is stamped
+      with a small distance field, all pieces of a layer at once
+    '''
+
+    def __init__(self, width, height, relative_margin=0.05, background_color='#dc7474', box_color='#3c3c3c',
+                 scale=1.0, piece=8, table=None):
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.piece = piece
+        self.shape = (max(1, int(round(height*scale))), max(1, int(round(width*scale))))
+
+        # svgHeader: scale(scale_w, scale_h) translate(translation, translation)
+        self.scale_w = 1 - relative_margin
+        self.scale_h = round(1 - width*relative_margin/height, 3)
+        self.translation = relative_margin*width/2
+
+        self.background = np.empty(self.shape + (3,), dtype=np.float32)
+        self.background[:] = hexToRgb(background_color)
+        if table is None:
+            x0, y0 = self.transform(np.array([[0, 0]]))[0]
+            x1, y1 = self.transform(np.array([[width, height]]))[0]
+            self._fillRect(self.background, x0, y0, x1, y1, hexToRgb(box_color))
+        else:
+            self._fillPolygons(self.background, table.rings, hexToRgb(box_color))
+
+        self.image = self.background.copy()
+
+
+    def transform(self, points):
+        '''svg user units (n, 2) -> pixel coordinates'''
+        points = np.asarray(points, dtype=np.float64)
+        return np.stack(((points[:, 0] + self.translation)*self.scale_w*self.scale,
+                         (points[:, 1] + self.translation)*self.scale_h*self.scale), axis=-1)
+
+
+    def strokeWidth(self, stroke_width):
+        # non-uniform scaling, the mean scale of both axes
+        return stroke_width*self.scale*np.sqrt(abs(self.scale_w*self.scale_h))
+
+
+    def _fillRect(self, image, x0, y0, x1, y1, color):
+        # separable pixel coverage of an axis aligned rectangle
+        xs, ys = np.arange(self.shape[1]), np.arange(self.shape[0])
+        cover_x = np.clip(np.minimum(xs + 1, x1) - np.maximum(xs, x0), 0, 1)
+        cover_y = np.clip(np.minimum(ys + 1, y1) - np.maximum(ys, y0), 0, 1)
+        cover = (cover_y[:, None]*cover_x[None, :])[..., None]
+        image += (color - image)*cover
+
+
+    def _fillPolygons(self, image, rings, color, samples=4):
+        # even-odd scanline fill: samples rows per pixel, exact coverage along every row
+        points = [self.transform(ring) for ring in rings]
+        a = np.concatenate(points)
+        b = np.concatenate([np.roll(ring, -1, axis=0) for ring in points])
+        xs = np.arange(self.shape[1])
+        cover = np.zeros(self.shape, dtype=np.float32)
+        for k in range(self.shape[0]*samples):
+            y = (k + 0.5)/samples
+            straddles = (a[:, 1] > y) != (b[:, 1] > y)
+            if not straddles.any():
+                continue
+            (ax, ay), (bx, by) = a[straddles].T, b[straddles].T
+            crossings = np.sort(ax + (y - ay)*(bx - ax)/(by - ay))
+            starts, ends = crossings[0::2, None], crossings[1::2, None]
+            cover[k//samples] += np.clip(np.minimum(xs + 1, ends) - np.maximum(xs, starts), 0, 1).sum(axis=0)/samples
+        image += (color - image)*np.minimum(cover, 1)[..., None]
+
+
+    def clear(self):
+        self.image = self.background.copy()
+
+
+    def coverage(self, starts, ends, stroke_width):
+        '''
+        Anti-aliased coverage (rows, cols, values) of round capped strokes between pixel coordinates starts and ends.
+        '''
+        half = self.strokeWidth(stroke_width)/2
+        lengths = np.hypot(*(ends - starts).T)
+        n_pieces = np.maximum(1, np.ceil(lengths/self.piece)).astype(np.int64)
+
+        # cut into pieces of at most self.piece pixels
+        segment = np.repeat(np.arange(len(starts)), n_pieces)
+        first = np.cumsum(n_pieces) - n_pieces
+        k = np.arange(len(segment)) - first[segment]
+        direction = (ends - starts)[segment]/n_pieces[segment][:, None]
+        a = starts[segment] + direction*k[:, None]
+        b = a + direction
+
+        # one stencil of size x size pixels per piece
+        size = int(np.ceil(self.piece + 2*half + 2))
+        origin = np.floor(np.minimum(a, b) - half - 1).astype(np.int64)
+        grid = np.arange(size)
+        px = (origin[:, 0, None, None] + grid[None, None, :]) + 0.5
+        py = (origin[:, 1, None, None] + grid[None, :, None]) + 0.5
+
+        # distance of every pixel center to its piece
+        dx, dy = (b - a).T
+        dot = np.maximum(dx*dx + dy*dy, 1e-12)
+        u = np.clip(((px - a[:, 0, None, None])*dx[:, None, None] + (py - a[:, 1, None, None])*dy[:, None, None])
+                    / dot[:, None, None], 0, 1)
+        distance = np.hypot(px - a[:, 0, None, None] - u*dx[:, None, None], py - a[:, 1, None, None] - u*dy[:, None, None])
+        cover = np.clip(half + 0.5 - distance, 0, 1)
+
+        cols = np.broadcast_to(origin[:, 0, None, None] + grid[None, None, :], cover.shape)
+        rows = np.broadcast_to(origin[:, 1, None, None] + grid[None, :, None], cover.shape)
+        keep = (cover > 0) & (cols >= 0) & (cols < self.shape[1]) & (rows >= 0) & (rows < self.shape[0])
+        return rows[keep], cols[keep], cover[keep]
+
+
+    def stroke(self, starts, ends, color, stroke_width=2, opacity=1.0):
+        '''
+        - starts, ends: (n, 2) svg coordinates of straight pieces of one color and opacity
+        ---------------------------------------
+        Composite all pieces as one layer (overlaps are not darkened twice, like one svg group).
+        '''
+        if len(starts) == 0 or opacity <= 0:
+            return
+        rows, cols, cover = self.coverage(self.transform(starts), self.transform(ends), stroke_width)
+        if len(cover) == 0:
+            return
+
+        r0, r1, c0, c1 = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+        layer = np.zeros((r1 - r0, c1 - c0), dtype=np.float32)
+        np.maximum.at(layer, (rows - r0, cols - c0), cover)
+
+        region = self.image[r0:r1, c0:c1]
+        region += (np.asarray(color, dtype=np.float32) - region)*(layer*opacity)[..., None]
+
+
+    def strokePaths(self, path_set, drawn, colors, stroke_width, opacity, reverse=False):
+        '''
+        - drawn: drawn fraction of every path (or one for all), colors: one '#rrggbb' or one per path
+        ---------------------------------------
+        The color '0' is not drawn: a chain writes it as stroke="0", which is no paint.
+        '''
+        drawn = np.broadcast_to(np.asarray(drawn, dtype=np.float64), (len(path_set),))
+        starts, ends, path = visibleSegments(path_set, drawn, reverse=reverse)
+        if isinstance(colors, str):
+            if colors != '0':
+                self.stroke(starts, ends, hexToRgb(colors), stroke_width, opacity)
+            return
+        for color in dict.fromkeys(colors):
+            if color == '0':
+                continue
+            same = np.array([c == color for c in colors])[path]
+            self.stroke(starts[same], ends[same], hexToRgb(color), stroke_width, opacity)
+
+
+    def rgba(self):
+        '''The canvas as (rows, cols, 4) uint8 array'''
+        out = np.empty(self.shape + (4,), dtype=np.uint8)
+        out[..., :3] = np.clip(self.image*255 + 0.5, 0, 255)
+        out[..., 3] = 255
+        return out
+
+
+
+def _drawCollision(canvas, builder, t, style):
+    primary, primary_opacity, secondary, secondary_opacity = collisionState(t, **style)
+
+    # random colors are drawn in the same order as write_svg does
+    color_rng = np.random.default_rng(builder.color_seed)
+    n_primaries = len(builder.primary_paths) + len(builder.streamed_primaries)
+    primary_colors = style['primary_color']
+    if primary_colors == '0':
+        primary_colors = [randomColor(color_rng) for _ in range(n_primaries)][:len(builder.primary_paths)]
+    secondary_colors = style['secondary_color']
+    if secondary_colors == '0':
+        secondary_colors = [randomColor(color_rng) for _ in range(len(builder.secondary_paths))]
+
+    canvas.strokePaths(builder.primary_paths, primary, primary_colors, style['primary_stroke_width'],
+                       primary_opacity, reverse=True)
+    if secondary > 0:
+        canvas.strokePaths(builder.secondary_paths, secondary, secondary_colors, style['secondary_stroke_width'],
+                           secondary_opacity)
+
+
+def _drawChain(canvas, ccb, t):
+    collisions = ccb.collisions
+    begins, period = chainBegins([coll.primary_duration for coll in collisions])
+
+    # every collision starts when the previous primaries are finished, collision 0 after the last
+    for coll, begin in zip(collisions, begins):
+        if t < begin or period <= 0:
+            continue
+        tau = (t - begin) % period
+        primary, primary_opacity, secondary, secondary_opacity = chainState(
+            tau, coll.primary_duration, coll.secondary_duration,
+            coll.dur_fade_primary, coll.dur_fade_secondary, coll.dur_freeze_secondary)
+
+        canvas.strokePaths(coll.primary_paths, primary, coll.primary_color, coll.primary_stroke_width,
+                           primary_opacity, reverse=True)
+        if secondary > 0:
+            # prepare_for_multi_svg draws the secondaries with the primary stroke width
+            canvas.strokePaths(coll.secondary_paths, secondary, coll.secondary_color, coll.primary_stroke_width,
+                               secondary_opacity)
+
+
+def makeCanvas(builder, scale=1.0, **style):
+    if isinstance(builder, CollisionBuider):
+        style = dict(STYLE_DEFAULTS, **style)
+        return Rasterizer(builder.width, builder.height, builder.relative_margin,
+                          style['background_color'], style['box_color'], scale=scale, table=builder.table)
+    return Rasterizer(builder.width, builder.height, builder.relative_margin,
+                      builder.default_config['background_color'], builder.default_config['box_color'], scale=scale,
+                      table=builder.table)
+
+
+def renderFrame(builder, t, scale=1.0, canvas=None, **style):
+    '''
+    - builder: CollisionBuider (style as for to_svg) or ConsecutiveCollisionBuilder
+    - t: time in seconds since the start of the animation
+    - canvas: Rasterizer to reuse (see makeCanvas), saves drawing the background again
+    ---------------------------------------
+    The animation at time t as (rows, cols, 4) uint8 RGBA array. Streamed primaries are not drawn.
+    '''
+    if canvas is None:
+        canvas = makeCanvas(builder, scale, **style)
+    canvas.clear()
+
+    if isinstance(builder, CollisionBuider):
+        _drawCollision(canvas, builder, t, dict(STYLE_DEFAULTS, **style))
+    else:
+        _drawChain(canvas, builder, t)
+    return canvas.rgba()
+
+
+def renderFrames(builder, fps=20, scale=1.0, **style):
+    '''
+    Yields (t, rgba) for one loop of the animation at fps frames per second.
+    '''
+    begin, period = animationPeriod(builder, **style)
+    canvas = makeCanvas(builder, scale, **style)
+    n_frames = max(1, int(round(period*fps)))
+    for i in range(n_frames):
+        t = begin + i/fps
+        yield t, renderFrame(builder, t, canvas=canvas, **style)
+
+
+
+##################################################################
+# export
+
+def _pngChunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def savePng(file_name, rgba, level=6):
+    '''
+    - rgba: (rows, cols, 4) uint8 array
+    '''
+    rows, cols = rgba.shape[:2]
+    raw = np.concatenate((np.zeros((rows, 1), dtype=np.uint8), rgba.reshape(rows, cols*4)), axis=1)
+    with open(file_name, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_pngChunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 8, 6, 0, 0, 0)))
+        f.write(_pngChunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+        f.write(_pngChunk(b'IEND', b''))
+
+
+def gifPalette(frames, n_colors=256):
+    '''
+    The n_colors most frequent colors (at 5 bit per channel) of some frames and a lookup table
+    from 5 bit colors to the nearest palette entry.
+    '''
+    bins = np.concatenate([_colorBins(frame) for frame in frames])
+    values, counts = np.unique(bins, return_counts=True)
+    palette_bins = values[np.argsort(-counts)[:n_colors]]
+    palette = np.stack(((palette_bins >> 10) & 31, (palette_bins >> 5) & 31, palette_bins & 31), axis=-1)*8 + 4
+
+    all_bins = np.arange(1 << 15)
+    all_colors = np.stack(((all_bins >> 10) & 31, (all_bins >> 5) & 31, all_bins & 31), axis=-1)*8 + 4
+    lookup = np.empty(1 << 15, dtype=np.uint8)
+    for start in range(0, 1 << 15, 4096):
+        distance = ((all_colors[start:start+4096, None, :] - palette[None, :, :])**2).sum(axis=-1)
+        lookup[start:start+4096] = np.argmin(distance, axis=1)
+
+    full = np.zeros((n_colors, 3), dtype=np.uint8)
+    full[:len(palette)] = palette
+    return full, lookup
+
+
+def _colorBins(rgba):
+    rgb = rgba[..., :3].astype(np.int64) >> 3
+    return ((rgb[..., 0] << 10) | (rgb[..., 1] << 5) | rgb[..., 2]).ravel()
+
+
+def lzwEncode(indices, min_code_size=8):
+    '''
+    GIF flavoured LZW of a sequence of palette indices (variable code width, at most 12 bits).
+    '''
+    clear, end = 1 << min_code_size, (1 << min_code_size) + 1
+    out = bytearray()
+    buffer, n_bits = 0, 0
+    code_size, next_code, table = min_code_size + 1, end + 1, {}
+
+    indices = indices.tolist()
+    buffer, n_bits = clear, code_size
+    prefix = indices[0]
+    for k in indices[1:]:
+        key = (prefix << 8) | k
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        buffer |= prefix << n_bits
+        n_bits += code_size
+        while n_bits >= 8:
+            out.append(buffer & 255)
+            buffer >>= 8
+            n_bits -= 8
+
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > (1 << code_size) and code_size < 12:
+                code_size += 1
+        else:
+            # table full: start over
+            buffer |= clear << n_bits
+            n_bits += code_size
+            table, next_code, code_size = {}, end + 1, min_code_size + 1
+        prefix = k
+
+    for code in (prefix, end):
+        buffer |= code << n_bits
+        n_bits += code_size
+    while n_bits > 0:
+        out.append(buffer & 255)
+        buffer >>= 8
+        n_bits -= 8
+    return bytes(out)
+
+
+def saveGif(file_name, frames, fps=20, palette=None):
+    '''
+    - frames: list of (rows, cols, 4) uint8 arrays
+    - palette: optional (palette, lookup) of gifPalette, by default built from up to 8 of the frames
+    ---------------------------------------
+    Animated, endlessly looping gif.
+    '''
+    rows, cols = frames[0].shape[:2]
+    if palette is None:
+        palette = gifPalette(frames[::max(1, len(frames)//8)])
+    colors, lookup = palette
+    delay = max(2, int(round(100/fps)))
+
+    with open(file_name, 'wb') as f:
+        f.write(b'GIF89a' + struct.pack('<HHBBB', cols, rows, 0xf7, 0, 0) + colors.tobytes())
+        f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+        for frame in frames:
+            f.write(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, 0, delay, 0, 0))
+            f.write(struct.pack('<BHHHHB', 0x2c, 0, 0, cols, rows, 0))
+            data = lzwEncode(lookup[_colorBins(frame)])
+            f.write(b'\x08')
+            for start in range(0, len(data), 255):
+                block = data[start:start+255]
+                f.write(bytes([len(block)]) + block)
+            f.write(b'\x00')
+        f.write(b'\x3b')
+
+
+
+##################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Preview a parameter file without a browser.')
+    parser.add_argument('parameter_file', help='parameter file (configs/*.json)')
+    parser.add_argument('output', help='.gif (one loop), .png (one frame) or a directory (numbered pngs)')
+    parser.add_argument('--time', type=float, default=None, help='time of the .png frame (default: primaries complete)')
+    parser.add_argument('--fps', type=float, default=20, help='frames per second of the loop')
+    parser.add_argument('--scale', type=float, default=1.0, help='pixels per svg unit')
+    args = parser.parse_args(argv)
+
+    import json
+    import time
+    from collision_builder import validate_parameters, build_collision
+
+    with open(args.parameter_file) as f:
+        params = json.load(f)
+    errors = validate_parameters(params)
+    if errors:
+        print('\n'.join(errors))
+        return 1
+
+    collision = build_collision(params)
+    style = {key: params[key] for key in STYLE_PARAMETERS if key in params}
+    start = time.perf_counter()
+
+    if args.output.endswith('.png'):
+        style_all = dict(STYLE_DEFAULTS, **style)
+        t = args.time if args.time is not None else style_all['primary_begin'] + style_all['primary_duration']
+        savePng(args.output, renderFrame(collision, t, scale=args.scale, **style))
+        print(f'Writen to {args.output}! ({time.perf_counter() - start:.2f}s)')
+        return 0
+
+    frames = [frame for _, frame in renderFrames(collision, fps=args.fps, scale=args.scale, **style)]
+    rendered = time.perf_counter() - start
+    if args.output.endswith('.gif'):
+        saveGif(args.output, frames, fps=args.fps)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        for i, frame in enumerate(frames):
+            savePng(os.path.join(args.output, f'frame_{i:04d}.png'), frame)
+    print(f'Writen to {args.output}! ({len(frames)} frames rendered in {rendered:.2f}s, '
+          f'{time.perf_counter() - start:.2f}s in total)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
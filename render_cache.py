@@ -0,0 +1,198 @@
+#
+# Content addressed on-disk cache of rendered svgs
+# https://github.com/LEMettler
+#
+
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+
+
+# bump whenever the svg output of the same config changes
+CACHE_VERSION = 1
+
+
+def _normalize(value):
+    '''
+    Plain json types for a config: numpy values unpacked, tuples as lists, integral floats as ints
+    (so 30 and 30.0 give the same key, both render the same; large seeds stay exact).
+    '''
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, np.random.SeedSequence):
+        return {'entropy': _normalize(value.entropy), 'spawn_key': _normalize(value.spawn_key)}
+    if isinstance(value, (bool, np.bool_)) or value is None:
+        return value if value is None else bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return int(value) if value.is_integer() else value
+    return str(value)
+
+
+def cacheKey(*parts):
+    '''
+    - parts: configs (dicts, lists, numbers, strings)
+    ---------------------------------------
+    Stable sha256 hex digest of the normalized parts, independent of dict order and process.
+    '''
+    text = json.dumps([CACHE_VERSION, _normalize(list(parts))], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def templateDigest(template_path):
+    '''sha256 of the contents of a template file'''
+    with open(template_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+
+class RenderCache:
+    '''
+    Finished svgs (and optionally the path arrays) on disk, addressed by cacheKey.
+
+    - entries are written to a temporary file and renamed into place, so several processes can
+      share one directory, readers never see a partial file
+    - least recently used entries are evicted once the directory exceeds max_bytes
+      (a hit refreshes the modification time of the entry)
+    - hits and misses are counted per instance
+    '''
+
+    def __init__(self, directory='.render_cache', max_bytes=256<<20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    def _path(self, key, suffix='.svg'):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+
+    def get(self, key):
+        '''
+        Returns the cached svg as bytes or None.
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            # never written or evicted by another process in the meantime
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return data
+
+
+    def get_arrays(self, key):
+        '''
+        Returns the arrays stored with put(..., arrays=) as a dict or None.
+        '''
+        try:
+            with np.load(self._path(key, '.npz')) as archive:
+                return {name: archive[name] for name in archive.files}
+        except FileNotFoundError:
+            return None
+
+
+    def put(self, key, data, arrays=None):
+        '''
+        - data: svg document (bytes or str)
+        - arrays: optional dict of numpy arrays kept next to the svg
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+
+        if arrays is not None:
+            self._write(self._path(key, '.npz'), lambda f: np.savez(f, **arrays))
+        self._write(self._path(key), lambda f: f.write(data))
+        self.evict()
+
+
+    def _write(self, path, write):
+        descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+    def _entries(self):
+        '''
+        [(mtime_ns, size, [paths]), ...] with one entry per key: the svg and its arrays are used,
+        counted and evicted together (the newest file, i.e. the svg refreshed by a hit, dates the entry).
+        '''
+        entries = {}
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                key = entry.name.split('.')[0]
+                mtime, size, paths = entries.get(key, (0, 0, []))
+                entries[key] = (max(mtime, stat.st_mtime_ns), size + stat.st_size, paths + [entry.path])
+        return list(entries.values())
+
+
+    def size(self):
+        '''Bytes currently on disk'''
+        return sum(size for _, size, _ in self._entries())
+
+
+    def evict(self):
+        '''
+        Delete the least recently used entries until the cache fits into max_bytes.
+        '''
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in entries:
+            if total <= self.max_bytes:
+                break
+            self._unlink(paths)
+            total -= size
+
+
+    def _unlink(self, paths):
+        # the svg goes first: once it is gone, the entry is a miss and its arrays are never read
+        for path in sorted(paths, key=lambda path: not path.endswith('.svg')):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+    def clear(self):
+        for _, _, paths in self._entries():
+            self._unlink(paths)
+        self.hits = self.misses = 0
+
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self.size(), 'max_bytes': self.max_bytes}
+
+    def __repr__(self):
+        return f'RenderCache({self.directory!r}, {self.hits} hits, {self.misses} misses)'
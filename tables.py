@@ -0,0 +1,374 @@
+#
+# Polygonal tables with obstacles: reflections at the segment normals, ray queries through a uniform grid
+# https://github.com/LEMettler
+#
+# A table is one boundary polygon and any number of polygonal obstacles inside it. All their edges are
+# registered in the cells of a uniform grid they pass through (about one edge per cell). A ray walks the
+# cells along its direction (2d DDA) and only tests the edges of the cells it visits, the first hit inside
+# the current cell is the nearest one. All rays of a batch walk together, one array operation per step.
+#
+# Table.rectangle(width, height) is the box of CollisionBuider with its walls A (y=0), B (x=width),
+# C (y=height) and D (x=0).
+#
+
+
+import math
+import numpy as np
+
+
+
+def _cross(u, v):
+    return u[..., 0]*v[..., 1] - u[..., 1]*v[..., 0]
+
+
+def _ring(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    if len(points) < 3:
+        raise ValueError('a polygon needs at least 3 vertices')
+    return points
+
+
+def circlePolygon(center, radius, n=32, phase=0.):
+    '''vertices of a regular n-gon (an obstacle or boundary approximating a circle)'''
+    angles = phase + 2*np.pi*np.arange(n)/n
+    return np.stack((center[0] + radius*np.cos(angles), center[1] + radius*np.sin(angles)), axis=-1)
+
+
+
+class Table:
+    '''
+    - edges: a, b (m, 2) end points and normals (m, 2) unit normals of every edge, labels (m) their names
+    - contains(points): inside the boundary and outside all obstacles
+    - firstHits(origins, directions): nearest edge hit of every ray (through the grid)
+    - bouncePaths(x0, y0, alphas, n_bounces): the reflected rays, like collision_builder.bouncePaths
+    '''
+    def __init__(self, boundary, obstacles=(), labels=None, cells=None):
+        '''
+        - boundary: (n, 2) vertices of the outer polygon, obstacles: list of (k, 2) vertices
+        - labels: optional name of every edge, boundary edges first (vertex i -> i+1), then the obstacles.
+          Default: 'E0', 'E1', ... for the boundary and 'O<obstacle>.<edge>' for the obstacles
+        - cells: optional (nx, ny) of the grid (default: about one cell per edge)
+        '''
+        self.rings = [_ring(boundary)] + [_ring(obstacle) for obstacle in obstacles]
+        self.a = np.concatenate(self.rings)
+        self.b = np.concatenate([np.roll(ring, -1, axis=0) for ring in self.rings])
+        edge = self.b - self.a
+        lengths = np.hypot(edge[:, 0], edge[:, 1])
+        if (lengths == 0).any():
+            raise ValueError('polygons must not repeat a vertex')
+        self.normals = np.stack((-edge[:, 1], edge[:, 0]), axis=-1)/lengths[:, None]
+
+        if labels is None:
+            labels = [f'E{i}' for i in range(len(self.rings[0]))]
+            labels += [f'O{k}.{i}' for k, ring in enumerate(self.rings[1:]) for i in range(len(ring))]
+        if len(labels) != len(self.a):
+            raise ValueError(f'{len(labels)} labels for {len(self.a)} edges')
+        self.labels = list(labels)
+        self.edge_index = {label: i for i, label in enumerate(self.labels)}
+
+        # neighbouring edge at the end (b) and at the start (a) of every edge, within its polygon
+        sizes = np.repeat([len(ring) for ring in self.rings], [len(ring) for ring in self.rings])
+        first = np.repeat(np.cumsum([0] + [len(ring) for ring in self.rings[:-1]]), [len(ring) for ring in self.rings])
+        index = np.arange(len(self.a))
+        self.next_edge = first + (index - first + 1) % sizes
+        self.previous_edge = first + (index - first - 1) % sizes
+
+        self.low = self.a.min(axis=0)
+        self.high = self.a.max(axis=0)
+        self.scale = float(np.max(self.high - self.low))
+        # hits this close (1e-9 of the table size) to a vertex still count, a ray into a corner cannot slip through
+        self._s_tolerance = 1e-9*self.scale/lengths
+        self._buildGrid(cells)
+
+
+    @classmethod
+    def rectangle(cls, width, height):
+        '''the box of CollisionBuider, edges A (y=0), B (x=width), C (y=height), D (x=0)'''
+        return cls([[0, 0], [width, 0], [width, height], [0, height]], labels=['A', 'B', 'C', 'D'])
+
+
+    def __len__(self):
+        return len(self.a)
+
+    def __repr__(self):
+        return f'Table({len(self.rings[0])} boundary edges, {len(self.rings) - 1} obstacles, grid {self.nx}x{self.ny})'
+
+
+    def _buildGrid(self, cells):
+        size = self.high - self.low
+        if cells is None:
+            # about one edge per cell, square cells
+            cell = max(np.sqrt(size[0]*size[1]/len(self)), self.scale/512)
+            cells = np.maximum(np.ceil(size/cell), 1).astype(int)
+        self.nx, self.ny = int(cells[0]), int(cells[1])
+        self.cell_size = size/[self.nx, self.ny]
+
+        # candidate cells: the bounding box of every edge
+        lo = self._cellOf(np.minimum(self.a, self.b))
+        hi = self._cellOf(np.maximum(self.a, self.b))
+        counts = (hi[:, 0] - lo[:, 0] + 1)*(hi[:, 1] - lo[:, 1] + 1)
+        edge = np.repeat(np.arange(len(self)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = (hi[:, 0] - lo[:, 0] + 1)[edge]
+        cx, cy = lo[edge, 0] + k % width, lo[edge, 1] + k // width
+
+        # keep the cells the line of the edge passes (corners not all on one side), exact within the box
+        corners = [(0, 0), (1, 0), (0, 1), (1, 1)]
+        sides = np.stack([_cross(self.b[edge] - self.a[edge],
+                                 self.low + (np.stack((cx + i, cy + j), axis=-1))*self.cell_size - self.a[edge])
+                          for i, j in corners])
+        passes = (sides.min(axis=0) <= 0) & (sides.max(axis=0) >= 0)
+        edge, cell = edge[passes], (cx*self.ny + cy)[passes]
+
+        # edges of cell c: cell_edges[cell_start[c]:cell_start[c+1]]
+        order = np.argsort(cell, kind='stable')
+        self.cell_edges = edge[order]
+        self.cell_start = np.concatenate(([0], np.cumsum(np.bincount(cell, minlength=self.nx*self.ny))))
+
+        # the same as lists of (edge, ax, ay, ex, ey, s tolerance) for the scalar walk of single rays
+        rows = list(zip(range(len(self)), *self.a.T.tolist(), *(self.b - self.a).T.tolist(), self._s_tolerance.tolist()))
+        bounds = self.cell_start.tolist()
+        edges = self.cell_edges.tolist()
+        self._cell_rows = [[rows[e] for e in edges[bounds[c]:bounds[c + 1]]] for c in range(self.nx*self.ny)]
+
+
+    def _cellOf(self, points):
+        cells = np.floor((points - self.low)/self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, [self.nx - 1, self.ny - 1])
+
+
+    def contains(self, points):
+        '''
+        Inside the table: even number of edges crossed by a ray to the right (boundary + obstacles at once).
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        px, py = points[:, :1], points[:, 1:]
+        ax, ay, bx, by = self.a[:, 0], self.a[:, 1], self.b[:, 0], self.b[:, 1]
+        straddles = (ay > py) != (by > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = ax + (py - ay)*(bx - ax)/(by - ay)
+        return ((straddles & (x > px)).sum(axis=1) % 2) == 1
+
+
+    def pathData(self, precision=3):
+        '''svg path data of all polygons (fill-rule evenodd leaves the obstacles out)'''
+        from collision_builder import encodePathData
+        return ' '.join(encodePathData(ring, precision=precision) + ' Z' for ring in self.rings)
+
+
+    def reflect(self, pos, label):
+        '''mirror image of pos at the line of the edge with this label'''
+        i = self.edge_index[label.strip()]
+        n = self.normals[i]
+        p = np.asarray(pos, dtype=float)
+        return (p - 2*np.dot(p - self.a[i], n)*n).tolist()
+
+
+    ##################################################################
+    # ray queries
+
+    def firstHits(self, origins, directions, exclude=None):
+        '''
+        - origins, directions: (n, 2), the directions need not be normalized
+        - exclude: optional (n) edge per ray that is not hit (the one it was just reflected at), -1 for none
+        ---------------------------------------
+        Nearest hit of every ray: (t, edge), the hit point is origin + t*direction.
+        '''
+        o = np.asarray(origins, dtype=float).reshape(-1, 2)
+        d = np.asarray(directions, dtype=float).reshape(-1, 2)
+        n = len(o)
+        exclude = np.full(n, -1) if exclude is None else np.asarray(exclude)
+        if n < 12:
+            hits = [self._firstHit(*ray) for ray in zip(*o.T.tolist(), *d.T.tolist(), exclude.tolist())]
+            return np.array([t for t, _ in hits]).reshape(n), np.array([e for _, e in hits], dtype=np.int64).reshape(n)
+        t_hit, e_hit = np.full(n, np.inf), np.full(n, -1)
+        eps = 1e-9*self.scale/np.maximum(np.hypot(d[:, 0], d[:, 1]), 1e-300)
+
+        # DDA state: current cell, t of the next cell border per axis and t per cell
+        cell = self._cellOf(o)
+        step = np.where(d > 0, 1, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            border = self.low + (cell + (d > 0))*self.cell_size
+            t_next = np.where(d != 0, (border - o)/d, np.inf)
+            t_delta = np.where(d != 0, self.cell_size/np.abs(d), np.inf)
+
+        active = np.arange(n)
+        while len(active):
+            c = cell[active, 0]*self.ny + cell[active, 1]
+            starts, counts = self.cell_start[c], self.cell_start[c + 1] - self.cell_start[c]
+            ray = np.repeat(active, counts)
+            edge = self.cell_edges[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+
+            # ray o + t d against edge a + s (b - a)
+            e = self.b[edge] - self.a[edge]
+            w = self.a[edge] - o[ray]
+            denom = _cross(d[ray], e)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = _cross(w, e)/denom
+                s = _cross(w, d[ray])/denom
+            t_exit = t_next[ray].min(axis=1)
+            tolerance = self._s_tolerance[edge]
+            valid = ((denom != 0) & (t > eps[ray]) & (s >= -tolerance) & (s <= 1 + tolerance) & (edge != exclude[ray])
+                     & (t <= t_exit + eps[ray]))
+            np.minimum.at(t_hit, ray[valid], t[valid])
+            nearest = valid & (t == t_hit[ray])
+            e_hit[ray[nearest]] = edge[nearest]
+
+            # rays without a hit move to the next cell along the axis whose border comes first
+            active = active[np.isinf(t_hit[active])]
+            axis = np.argmin(t_next[active], axis=1)
+            cell[active, axis] += step[active, axis]
+            t_next[active, axis] += t_delta[active, axis]
+            inside = (cell[active] >= 0).all(axis=1) & (cell[active] < [self.nx, self.ny]).all(axis=1)
+            active = active[inside]
+
+        if (e_hit < 0).any():
+            raise ValueError('a ray left the table without hitting an edge (start point outside?)')
+        return t_hit, e_hit
+
+
+    def _firstHit(self, ox, oy, dx, dy, exclude=-1):
+        # scalar firstHits of one ray, below a dozen rays the array steps cost more than this loop
+        cx, cy = self._cellOf(np.array([ox, oy]))
+        cx, cy = int(cx), int(cy)
+        x0, y0 = self.low.tolist()
+        cw, ch = self.cell_size.tolist()
+        eps = 1e-9*self.scale/max(math.hypot(dx, dy), 1e-300)
+        step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+        t_x = (x0 + (cx + (dx > 0))*cw - ox)/dx if dx != 0 else math.inf
+        t_y = (y0 + (cy + (dy > 0))*ch - oy)/dy if dy != 0 else math.inf
+        delta_x = cw/abs(dx) if dx != 0 else math.inf
+        delta_y = ch/abs(dy) if dy != 0 else math.inf
+
+        while 0 <= cx < self.nx and 0 <= cy < self.ny:
+            t_exit = min(t_x, t_y) + eps
+            best, best_edge = math.inf, -1
+            for edge, ax, ay, ex, ey, tolerance in self._cell_rows[cx*self.ny + cy]:
+                denom = dx*ey - dy*ex
+                if denom == 0 or edge == exclude:
+                    continue
+                wx, wy = ax - ox, ay - oy
+                t = (wx*ey - wy*ex)/denom
+                s = (wx*dy - wy*dx)/denom
+                if eps < t < best and t <= t_exit and -tolerance <= s <= 1 + tolerance:
+                    best, best_edge = t, edge
+            if best_edge >= 0:
+                return best, best_edge
+            if t_x < t_y:
+                cx, t_x = cx + step_x, t_x + delta_x
+            else:
+                cy, t_y = cy + step_y, t_y + delta_y
+        raise ValueError('a ray left the table without hitting an edge (start point outside?)')
+
+
+    def bruteForceHits(self, origins, directions, exclude=None):
+        '''firstHits against all edges, without the grid (reference for tests and benchmarks)'''
+        o = np.asarray(origins, dtype=float).reshape(-1, 1, 2)
+        d = np.asarray(directions, dtype=float).reshape(-1, 1, 2)
+        e = (self.b - self.a)[None]
+        w = self.a[None] - o
+        denom = _cross(d, e)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = _cross(w, e)/denom
+            s = _cross(w, d)/denom
+        eps = 1e-9*self.scale/np.maximum(np.hypot(d[..., 0], d[..., 1]), 1e-300)
+        valid = (denom != 0) & (t > eps) & (s >= -self._s_tolerance) & (s <= 1 + self._s_tolerance)
+        if exclude is not None:
+            valid &= np.arange(len(self))[None] != np.asarray(exclude)[:, None]
+        t = np.where(valid, t, np.inf)
+        edge = np.argmin(t, axis=1)
+        return t[np.arange(len(t)), edge], edge
+
+
+    def reflectDirections(self, directions, edges):
+        '''directions mirrored at the normals of the edges'''
+        n = self.normals[edges]
+        return directions - 2*np.sum(directions*n, axis=1, keepdims=True)*n
+
+
+    def reflectHits(self, points, directions, edges):
+        '''
+        - points: (n, 2) hit points on the edges, directions: (n, 2) incoming directions
+        ---------------------------------------
+        Directions after the reflection and, for every ray that hit a vertex (within the tolerance of
+        firstHits) and would still cross the neighbouring edge, that edge (else -1). The ray is reflected
+        there next at the same point, so it cannot slip out through a corner (the box counts two walls too).
+        '''
+        reflected = self.reflectDirections(directions, edges)
+        e = self.b[edges] - self.a[edges]
+        s = np.sum((points - self.a[edges])*e, axis=1)/np.sum(e*e, axis=1)
+        tolerance = self._s_tolerance[edges]
+        other = np.where(s <= tolerance, self.previous_edge[edges], np.where(s >= 1 - tolerance, self.next_edge[edges], -1))
+
+        corner = np.flatnonzero(other >= 0)
+        n = self.normals[other[corner]]
+        before = np.sum(directions[corner]*n, axis=1)
+        after = np.sum(reflected[corner]*n, axis=1)
+        # the ray came in towards the neighbouring edge and still runs into it
+        crosses = (np.sign(before) == np.sign(after)) & (np.abs(after) > 1e-12*np.hypot(*directions[corner].T))
+        pending = np.full(len(edges), -1)
+        pending[corner[crosses]] = other[corner[crosses]]
+        return reflected, pending
+
+
+    def bouncePaths(self, x0, y0, alphas, n_bounces, return_edges=False):
+        '''
+        - x0, y0: start point(s) of the rays, alphas: start angle of each ray (degrees)
+        - n_bounces: number of edge collisions to compute for every ray
+        ---------------------------------------
+        The reflected rays with shape (n_rays, n_bounces+1, 2), [:, 0] is the start point.
+        return_edges: also the (n_rays, n_bounces) edge indices that were hit.
+        '''
+        alpha = np.deg2rad(np.atleast_1d(np.asarray(alphas, dtype=float)))
+        n_rays, n_bounces = len(alpha), int(n_bounces)
+        coords = np.empty((n_rays, n_bounces + 1, 2))
+        coords[:, 0, 0] = x0
+        coords[:, 0, 1] = y0
+        edges = np.full((n_rays, n_bounces), -1)
+        if not self.contains(coords[:, 0]).all():
+            raise ValueError('start points have to lie inside the table')
+
+        p, d, last = coords[:, 0].copy(), np.stack((np.cos(alpha), np.sin(alpha)), axis=-1), np.full(n_rays, -1)
+        pending = np.full(n_rays, -1)
+        for i in range(n_bounces):
+            # a ray in a corner hits the second edge at the same point, without a query
+            free = pending < 0
+            t, hit = np.zeros(n_rays), pending.copy()
+            if free.any():
+                t[free], hit[free] = self.firstHits(p[free], d[free], exclude=last[free])
+            p = p + t[:, None]*d
+            d, pending = self.reflectHits(p, d, hit)
+            pending[~free] = -1
+            last = hit
+            coords[:, i + 1] = p
+            edges[:, i] = last
+
+        if return_edges:
+            return coords, edges
+        return coords
+
+
+    def routeAngle(self, start, end, labels):
+        '''
+        - labels: edges of the route start -> end in time-forward order
+        ---------------------------------------
+        Angle (degrees) of the ray leaving end that runs the route backwards, from the mirror image of start.
+        '''
+        virtual = list(start)
+        for label in labels[::-1]:
+            virtual = self.reflect(virtual, label)
+        return float(np.rad2deg(np.arctan2(virtual[1] - end[1], virtual[0] - end[0])) % 360)
+
+
+    def checkRoute(self, path, edges, labels, end_point):
+        '''
+        True if the traced path (see bouncePaths) hits exactly these labels in reverse order and then
+        reaches end_point without an edge in between (obstacles can block a mirror image route).
+        '''
+        if [self.labels[e] for e in edges] != [label.strip() for label in labels[::-1]]:
+            return False
+        direction = np.asarray(end_point, dtype=float) - path[-1]
+        t, _ = self.firstHits(path[-1:], direction[None], exclude=edges[-1:] if len(edges) else None)
+        return bool(t[0] >= 1 - 1e-9)
@@ -0,0 +1,9 @@
+#
+# The modules live at the top level of the repository
+# https://github.com/LEMettler
+#
+
+
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
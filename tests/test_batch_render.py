@@ -0,0 +1,50 @@
+#
+# Headless batch rendering of parameter files
+# https://github.com/LEMettler
+#
+
+
+import os
+import io
+import gzip
+import json
+
+import batch_render
+from collision_builder import load_parameters, render_parameters
+
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configs', 'example.json')
+
+
+def parameter_file(tmp_path, name):
+    params = load_parameters(CONFIG)
+    params.update(name=name, seed=7)
+    with open(tmp_path/'params.json', 'w') as f:
+        json.dump(params, f)
+    return str(tmp_path/'params.json'), params
+
+
+def test_render_file(tmp_path):
+    for name in ['out.svg', 'out.svgz']:
+        path, params = parameter_file(tmp_path, name)
+        result = batch_render.render_file(path, out_dir=str(tmp_path))
+        assert result['status'] == 'ok'
+
+        expected = io.BytesIO()
+        render_parameters(params, expected)
+        with open(tmp_path/name, 'rb') as f:
+            data = f.read()
+        assert (gzip.decompress(data) if name.endswith('.svgz') else data) == expected.getvalue()
+    assert sorted(os.listdir(tmp_path)) == ['out.svg', 'out.svgz', 'params.json']
+
+
+def test_failed_render_leaves_no_file(tmp_path, monkeypatch):
+    def broken(params, target, **kwargs):
+        target.write(b'<svg')
+        raise MemoryError('out of memory')
+    monkeypatch.setattr(batch_render, 'render_parameters', broken)
+
+    path, _ = parameter_file(tmp_path, 'out.svg')
+    result = batch_render.render_file(path, out_dir=str(tmp_path))
+    assert result['status'] == 'error' and 'MemoryError' in result['message']
+    assert os.listdir(tmp_path) == ['params.json']
@@ -0,0 +1,158 @@
+#
+# Bounce engines, path data encoding, svg output of a single collision
+# https://github.com/LEMettler
+#
+
+
+import os
+import io
+import gzip
+import xml.etree.ElementTree as ET
+import numpy as np
+import pytest
+
+from collision_builder import (CollisionBuider, newCollsionPoint, bouncePaths, unfoldedBouncePoints, unfoldedPathLength,
+                               iterBouncePoints, calculatePathLength, encodePathData, encodeSegments, minifySvg,
+                               SvgMinifier, render_parameters, load_parameters)
+
+
+WIDTH, HEIGHT = 800, 300
+ALPHAS = np.random.default_rng(0).uniform(0, 360, 40)
+
+
+def scalarPaths(x0, y0, alphas, n_bounces):
+    coords = []
+    for alpha in alphas:
+        x, y, path = x0, y0, [(x0, y0)]
+        for _ in range(n_bounces):
+            x, y, alpha = newCollsionPoint(x, y, alpha, WIDTH, HEIGHT)
+            path.append((x, y))
+        coords.append(path)
+    return np.array(coords)
+
+
+def collision(seed=1, n_bounces=15, n_secondaries=30):
+    builder = CollisionBuider(WIDTH, HEIGHT, [310, 120], incoming_angles=[17., 131., 250.], seed=seed)
+    builder.calculatePrimaryPaths(n_bounces)
+    builder.calculateSecondaryPaths(n_secondaries, alpha_std=40, length_mean=200, length_std=100)
+    return builder
+
+
+def sameDocument(a, b):
+    '''equal xml trees, whitespace inside attributes and text normalized'''
+    normalize = lambda text: ' '.join((text or '').split())
+    a, b = ET.fromstring(a), ET.fromstring(b)
+    if len(list(a.iter())) != len(list(b.iter())):
+        return False
+    for x, y in zip(a.iter(), b.iter()):
+        if x.tag != y.tag or normalize(x.text) != normalize(y.text):
+            return False
+        if {k: normalize(v) for k, v in x.attrib.items()} != {k: normalize(v) for k, v in y.attrib.items()}:
+            return False
+    return True
+
+
+
+##################################################################
+# geometry
+
+def test_vectorized_matches_scalar():
+    coords = bouncePaths(310, 120, ALPHAS, 100, WIDTH, HEIGHT)
+    assert np.allclose(coords, scalarPaths(310, 120, ALPHAS, 100), rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('n_rays', [1, 3, 11])
+def test_few_rays_take_the_scalar_path(n_rays):
+    coords = bouncePaths(310, 120, ALPHAS[:n_rays], 100, WIDTH, HEIGHT)
+    assert coords.shape == (n_rays, 101, 2)
+    assert np.array_equal(coords, scalarPaths(310, 120, ALPHAS[:n_rays], 100))
+    assert np.array_equal(bouncePaths(310, 120, ALPHAS[0], 100, WIDTH, HEIGHT), coords[:1])
+
+
+def test_unfolded_matches_iterative():
+    ks = np.arange(201)
+    coords = bouncePaths(310, 120, ALPHAS, 200, WIDTH, HEIGHT)
+    for alpha, path in zip(ALPHAS, coords):
+        x, y, t = unfoldedBouncePoints(310, 120, alpha, ks, WIDTH, HEIGHT)
+        assert np.allclose(np.column_stack((x, y)), path, rtol=0, atol=1e-6)
+        assert np.isclose(t[-1], calculatePathLength(path.T), rtol=1e-9)
+        assert np.isclose(unfoldedPathLength(310, 120, alpha, 200, WIDTH, HEIGHT), t[-1])
+
+
+def test_iter_bounce_points_chunks():
+    x, y, _ = unfoldedBouncePoints(310, 120, 17., np.arange(1001), WIDTH, HEIGHT)
+    points = np.column_stack((x, y))
+    assert np.array_equal(np.concatenate(list(iterBouncePoints(310, 120, 17., 1000, WIDTH, HEIGHT, chunk_size=64))), points)
+    reverse = np.concatenate(list(iterBouncePoints(310, 120, 17., 1000, WIDTH, HEIGHT, reverse=True, chunk_size=64)))
+    assert np.array_equal(reverse, points[::-1])
+
+
+def test_secondaries_are_seeded():
+    a, b, c = collision(seed=5), collision(seed=5), collision(seed=6)
+    assert np.array_equal(a.secondary_paths.coords, b.secondary_paths.coords)
+    assert not np.array_equal(a.secondary_paths.coords, c.secondary_paths.coords)
+
+
+
+##################################################################
+# path data
+
+@pytest.mark.parametrize('relative', [False, True])
+@pytest.mark.parametrize('shortcuts', [False, True])
+@pytest.mark.parametrize('precision', [0, 3])
+def test_encode_segments(relative, shortcuts, precision):
+    rng = np.random.default_rng(3)
+    starts = rng.uniform(0, 100, (200, 2))
+    ends = rng.uniform(0, 100, (200, 2))
+    ends[::7, 0] = starts[::7, 0]  # vertical
+    ends[::5, 1] = starts[::5, 1]  # horizontal
+    encoding = dict(precision=precision, relative=relative, shortcuts=shortcuts)
+    expected = [encodePathData(np.array([s, e]), **encoding) for s, e in zip(starts, ends)]
+    assert encodeSegments(starts, ends, **encoding) == expected
+
+
+def test_encode_path_data():
+    points = np.array([[0, 0], [12.5, 0], [12.5, 3], [1.0004, -2]])
+    assert encodePathData(points) == 'M0,0 L12.5,0 L12.5,3 L1,-2'
+    assert encodePathData(points, shortcuts=True) == 'M0,0 H12.5 V3 L1,-2'
+    assert encodePathData(points, relative=True, shortcuts=True) == 'M0,0 h12.5 v3 l-11.5,-5'
+
+
+
+##################################################################
+# documents
+
+def test_minifier_streaming():
+    text = collision().to_svg_bytes().decode()
+    minified = minifySvg(text)
+    assert len(minified) < len(text)
+    assert sameDocument(text, minified)
+
+    rng = np.random.default_rng(4)
+    for _ in range(5):
+        cuts = [0] + np.sort(rng.choice(len(text), 300, replace=False)).tolist() + [len(text)]
+        minifier = SvgMinifier()
+        pieces = [minifier.feed(text[a:b]) for a, b in zip(cuts[:-1], cuts[1:])]
+        assert ''.join(pieces) + minifier.end() == minified
+
+
+@pytest.mark.parametrize('options', [{}, {'group_secondaries': True}, {'merge_secondaries': True}, {'backend': 'css'},
+                                     {'relative': True, 'shortcuts': True}, {'minify': True}])
+def test_documents_are_wellformed(options):
+    ET.fromstring(collision().to_svg_bytes(**options))
+
+
+def test_svgz(tmp_path):
+    builder = collision()
+    builder.to_svg(str(tmp_path/'out.svgz'))
+    with gzip.open(tmp_path/'out.svgz') as f:
+        assert f.read() == builder.to_svg_bytes()
+
+
+def test_render_parameters_reproducible():
+    params = load_parameters(os.path.join(os.path.dirname(__file__), '..', 'configs', 'example.json'))
+    params['seed'] = 7
+    a, b = io.BytesIO(), io.BytesIO()
+    render_parameters(params, a)
+    render_parameters(params, b)
+    assert a.getvalue() == b.getvalue()
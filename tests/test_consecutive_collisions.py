@@ -0,0 +1,127 @@
+#
+# Collision chains: wall sequences, fragment cache, timings and the render cache
+# https://github.com/LEMettler
+#
+
+
+import os
+import io
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
+import pytest
+
+from collision_builder import CollisionBuider
+from consecutive_collisions import ConsecutiveCollisionBuilder
+from wall_sequences import wallSequences
+from render_cache import RenderCache, cacheKey
+
+
+WIDTH, HEIGHT = 800, 300
+WALLS = [([402, 230], [['C', 'D', 'C'], ['B', 'A', 'D', 'A']]),
+         ([5, 10], [['C', 'D', 'C'], ['C', 'A']]),
+         ([751, 190], [['A', 'D', 'C'], ['B']]),
+         ([81, 280], [['B', 'D', 'A', 'C'], ['A', 'D']]),
+         ([300, 100], [['A', 'D', 'A'], ['B', 'C', 'A']])]
+
+
+def chain(n, seed=3, fragment_cache=True, **kwargs):
+    builder = ConsecutiveCollisionBuilder(WIDTH, HEIGHT, [300, 100], seed=seed, fragment_cache=fragment_cache, **kwargs)
+    for i in range(n):
+        point, walls = WALLS[i % len(WALLS)]
+        builder.addCollision(point, walls, primary_duration=2, n_secondaries=20)
+    return builder
+
+
+
+##################################################################
+# wall sequences
+
+def test_wall_sequences_reach_the_end():
+    start, end = [120, 80], [610, 240]
+    routes = wallSequences(start, end, WIDTH, HEIGHT, 6)
+    assert len(routes) > 50
+    assert [length for _, length in routes] == sorted(length for _, length in routes)
+    for walls, length in routes:
+        # traced from end in the direction of the mirror image, the ray meets exactly these walls
+        builder = CollisionBuider(WIDTH, HEIGHT, end, incoming_angles=[], seed=0)
+        builder.addPrimaryFrom(start, [walls])
+        path = builder.primary_paths.points(0)
+        assert len(path) == len(walls) + 2
+        assert np.allclose(path[-1], start) and np.allclose(path[0], end)
+        assert np.isclose(builder.primary_paths.lengths()[0], length)
+        for point, wall in zip(path[1:-1], walls):
+            coordinate, value = {'A': (1, 0), 'B': (0, WIDTH), 'C': (1, HEIGHT), 'D': (0, 0)}[wall]
+            assert np.isclose(point[coordinate], value)
+
+
+def test_wall_sequences_count():
+    # one route per lattice cell with |i| + |j| <= k (no corner routes for these points)
+    routes = wallSequences([123, 45], [456, 178], WIDTH, HEIGHT, 10)
+    assert len(routes) == 2*10*11 + 1
+
+
+
+##################################################################
+# fragments and timings
+
+def test_fragment_cache_matches_full_render():
+    cached = chain(12)
+    cached.to_svg_bytes()
+    cached.editCollision(4, [420, 210])
+    cached.removeCollision(7)
+    cached.insertCollision(2, [600, 50], [['A'], ['B', 'C']])
+
+    fresh = chain(12, fragment_cache=False)
+    fresh.editCollision(4, [420, 210])
+    fresh.removeCollision(7)
+    fresh.insertCollision(2, [600, 50], [['A'], ['B', 'C']])
+    assert cached.to_svg_bytes() == fresh.to_svg_bytes()
+
+
+@pytest.mark.parametrize('options', [{}, {'timing': 'absolute'}, {'backend': 'css'}, {'group_secondaries': True},
+                                     {'minify': True, 'timing': 'absolute'}])
+def test_chain_documents_are_wellformed(options):
+    ET.fromstring(chain(6).to_svg_bytes(**options))
+
+
+
+##################################################################
+# render cache
+
+def test_cache_key_normalization():
+    assert cacheKey({'a': 30, 'b': [1, 2]}) == cacheKey({'b': (1, 2), 'a': 30.0})
+    assert cacheKey({'a': np.float64(0.5)}) == cacheKey({'a': 0.5})
+    assert cacheKey({'a': 1}) != cacheKey({'a': 2})
+
+
+def test_render_cache(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=1 << 20)
+    builder = chain(5)
+    first, second = io.BytesIO(), io.BytesIO()
+    builder.to_svg(first, cache=cache)
+    builder.to_svg(second, cache=cache)
+    assert first.getvalue() == second.getvalue() == builder.to_svg_bytes()
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+    builder.editCollision(1, n_secondaries=5)
+    assert cache.get(builder.cacheKey()) is None
+
+
+
+def test_render_cache_eviction(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=5000)  # two entries of a 1000 byte svg and its arrays
+    for i in range(4):
+        cache.put(cacheKey(i), b'x'*1000, arrays={'coords': np.zeros(100)})
+        time.sleep(0.01)  # distinct modification times, the oldest go first
+        if i == 2:
+            cache.get(cacheKey(1))  # the hit makes 1 the most recent entry, its arrays stay older
+    assert cache.size() <= 5000
+    assert cache.get(cacheKey(1)) is not None and cache.get(cacheKey(3)) is not None
+    assert cache.get(cacheKey(0)) is None and cache.get(cacheKey(2)) is None
+    assert cache.get_arrays(cacheKey(1)) is not None and cache.get_arrays(cacheKey(2)) is None
+
+    # an entry is evicted as a whole, no svg or arrays are left behind without the other
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    keys = lambda suffix: sorted(name[:-len(suffix)] for name in files if name.endswith(suffix))
+    assert keys('.npz') == keys('.svg') == sorted([cacheKey(1), cacheKey(3)])
@@ -0,0 +1,87 @@
+#
+# Event driven discs: conservation, no overlaps, the spatial hash against all pairs
+# https://github.com/LEMettler
+#
+
+
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from disc_simulation import DiscSimulation, randomDiscs
+
+
+WIDTH, HEIGHT = 400, 200
+
+
+def simulation(n=150, radius=3, **kwargs):
+    positions, velocities = randomDiscs(n, radius, WIDTH, HEIGHT, speed=(20, 60), rng=1)
+    return DiscSimulation(WIDTH, HEIGHT, positions, velocities, radii=radius, seed=1, **kwargs)
+
+
+def energy(sim):
+    return sum(m*(vx*vx + vy*vy) for m, vx, vy in zip(sim.masses, sim.vx, sim.vy))/2
+
+
+def momentum(sim):
+    return np.array([[m*vx, m*vy] for m, vx, vy in zip(sim.masses, sim.vx, sim.vy)]).sum(axis=0)
+
+
+
+def test_energy_is_conserved():
+    sim = simulation()
+    before = energy(sim)
+    assert sim.run(10) > 500
+    assert abs(energy(sim) - before) <= 1e-12*before
+
+
+def test_momentum_between_discs():
+    # without walls only disc contacts happen: two discs head on, the momentum stays
+    sim = DiscSimulation(WIDTH, HEIGHT, [[100, 100], [200, 100]], [[30, 0], [-10, 0]], radii=[5, 10])
+    before = momentum(sim)
+    sim.run(3)  # they meet at t = 85/40
+    assert len(sim.contacts) == 1
+    assert np.allclose(momentum(sim), before)
+
+
+def test_no_overlaps():
+    sim = simulation()
+    radii = np.array(sim.radii)
+    for t in np.linspace(0.5, 5, 10):
+        sim.run(t)
+        points = np.array([sim.position(i) for i in range(len(sim))])
+        assert ((points >= radii[:, None] - 1e-9) & (points <= [WIDTH, HEIGHT] - radii[:, None] + 1e-9)).all()
+        distance = np.hypot(*(points[:, None] - points[None]).transpose(2, 0, 1))
+        np.fill_diagonal(distance, np.inf)
+        assert (distance >= radii[:, None] + radii[None] - 1e-9).all()
+
+
+def test_grid_matches_all_pairs():
+    # one cell holds all discs: every pair is checked. The orders agree until floating point chaos sets in
+    grid, brute = simulation(), simulation(cell_size=max(WIDTH, HEIGHT))
+    assert brute.nx == brute.ny == 1 and grid.nx*grid.ny > 1
+    grid.run(2)
+    brute.run(2)
+    n = 100
+    a = [(t, min(i, j), max(i, j)) for t, _, _, _, kind, i, j in grid.contacts if kind == 0][:n]
+    b = [(t, min(i, j), max(i, j)) for t, _, _, _, kind, i, j in brute.contacts if kind == 0][:n]
+    assert len(a) == n
+    assert [pair for _, *pair in a] == [pair for _, *pair in b]
+    assert np.allclose([t for t, _, _ in a], [t for t, _, _ in b])
+
+
+def test_points_only_hit_walls():
+    positions, velocities = randomDiscs(50, 1, WIDTH, HEIGHT, speed=40, rng=2)
+    sim = DiscSimulation(WIDTH, HEIGHT, positions, velocities, radii=0.)
+    sim.run(20)
+    kinds = {contact[4] for contact in sim.contacts}
+    assert kinds == {1}
+    paths = sim.paths()
+    assert ((paths.coords >= -1e-9) & (paths.coords <= [WIDTH + 1e-9, HEIGHT + 1e-9])).all()
+
+
+def test_svg():
+    sim = simulation(40)
+    sim.run(3)
+    ET.fromstring(sim.to_svg_bytes(n_secondaries=3))
+    builder = sim.collisionBuilder(n_secondaries=3)
+    assert len(builder.primary_paths) == 40
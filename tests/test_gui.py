@@ -0,0 +1,113 @@
+#
+# The GUI jobs offscreen: adding and writing on the worker thread, a failed or cancelled add leaves no collision
+# https://github.com/LEMettler
+#
+
+
+import os
+import threading
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+from PyQt5.QtCore import QRunnable
+
+from consecutive_collision_gui import CollisionGUI
+
+
+
+class Blocker(QRunnable):
+    '''occupies the single worker until released, the next job waits in the queue'''
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def run(self):
+        self.release.wait(10)
+
+
+@pytest.fixture
+def gui(tmp_path):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = CollisionGUI(open_browser=False)
+    window.file_name.setText(str(tmp_path/'out.svg'))
+    window.create_builder()
+    yield window
+    window.close()
+    app.processEvents()
+
+
+def finish(gui):
+    gui.pool.waitForDone()
+    QtWidgets.QApplication.processEvents()
+
+
+def paths(gui):
+    return [gui.paths_list.item(i).text() for i in range(gui.paths_list.count())]
+
+
+def submit_collision(gui, x=500, y=200, walls='A,B'):
+    gui.new_point_x.setValue(x)
+    gui.new_point_y.setValue(y)
+    gui.border_collision_input.setText(walls)
+    gui.add_path()
+    gui.add_collision()
+
+
+def test_add_and_generate(gui):
+    submit_collision(gui)
+    assert not gui.add_collision_btn.isEnabled() and gui.cancel_btn.isEnabled()
+    finish(gui)
+    assert len(gui.ccb.collision_specs) == 1
+    assert gui.add_collision_btn.isEnabled() and not gui.cancel_btn.isEnabled()
+    assert gui.paths_list.count() == 0
+
+    gui.generate_svg()
+    finish(gui)
+    assert os.path.getsize(gui.file_name.text()) > 0
+
+
+def test_cancel_add(gui):
+    submit_collision(gui)
+    finish(gui)
+
+    blocker = Blocker()
+    gui.pool.start(blocker)
+    submit_collision(gui, 200, 100, 'C')
+    gui.cancel_job()
+    blocker.release.set()
+    finish(gui)
+    assert len(gui.ccb.collision_specs) == 1
+    assert gui.job is None and gui.add_collision_btn.isEnabled()
+    assert paths(gui) == ['C']
+
+
+def test_cancel_while_building(gui, monkeypatch):
+    # the cancel arrives after the geometry was built, before the job reports it is done
+    build = gui.ccb.collisionAt
+    def cancelled_build(index):
+        gui.job.cancel()
+        return build(index)
+    monkeypatch.setattr(gui.ccb, 'collisionAt', cancelled_build)
+
+    submit_collision(gui)
+    finish(gui)
+    assert len(gui.ccb.collision_specs) == 0
+    assert paths(gui) == ['A,B']
+
+
+def test_failed_add_keeps_paths(gui):
+    # 'E' is no wall, the geometry fails on the worker thread
+    for walls in ['A,E', 'C']:
+        gui.border_collision_input.setText(walls)
+        gui.add_path()
+    gui.add_collision()
+    finish(gui)
+    assert len(gui.ccb.collision_specs) == 0
+    assert paths(gui) == ['A,E', 'C']
+
+    # the wrong path is replaced and the same list is added again
+    gui.paths_list.takeItem(0)
+    gui.add_collision()
+    finish(gui)
+    assert len(gui.ccb.collision_specs) == 1 and paths(gui) == []
@@ -0,0 +1,124 @@
+#
+# Level of detail: culling passes, the element/byte budget and the render cache of culled chains
+# https://github.com/LEMettler
+#
+
+
+import io
+import numpy as np
+import pytest
+
+from collision_builder import CollisionBuider
+from consecutive_collisions import ConsecutiveCollisionBuilder
+from level_of_detail import segmentEnds, thinOverlaps, budgetKeep, measureSvg
+from render_cache import RenderCache
+
+
+def collision(n_secondaries=3000):
+    builder = CollisionBuider(800, 300, [310, 120], incoming_angles=[17., 131., 250.], seed=12345)
+    builder.calculatePrimaryPaths(100)
+    builder.calculateSecondaryPaths(n_secondaries, alpha_std=40, length_mean=200, length_std=100)
+    return builder
+
+
+def chain(n=10):
+    builder = ConsecutiveCollisionBuilder(800, 300, [300, 100], seed=1)
+    points = [[402, 230], [5, 10], [751, 190], [81, 280], [300, 100]]
+    for i in range(n):
+        builder.addCollision(points[i % 5], [['A'], ['B', 'C']], n_secondaries=80)
+    return builder
+
+
+
+def test_thin_overlaps():
+    # three copies of one segment and a separate one: one copy and the separate one stay
+    starts = np.array([[0, 0], [0, 0], [0, 0], [0, 50]], dtype=float)
+    ends = np.array([[100, 0], [100, 0], [100, 0], [100, 50]], dtype=float)
+    assert thinOverlaps(starts, ends, 2.).tolist() == [True, False, False, True]
+
+
+def test_merge_collinear():
+    # a segment, a collinear one over its end (0.4 off its line), one beyond a gap and a crossing one
+    starts = np.array([[0, 0], [60, 0.4], [200, 0], [50, -50]], dtype=float)
+    ends = np.array([[100, 0], [150, 0.4], [250, 0], [50, 50]], dtype=float)
+    keep, merged = thinOverlaps(starts, ends, 2., merge=True)
+    assert keep.tolist() == [True, False, True, True] and merged.tolist() == [False, True, False, False]
+    assert starts[0].tolist() == [0, 0] and ends[0].tolist() == [150, 0]
+
+    builder = CollisionBuider(800, 300, [310, 120], incoming_angles=[17.], seed=1)
+    builder.secondary_paths.add_segments([[310, 120]]*3, [[410, 120], [360, 120], [310, 20]])
+    builder.secondary_paths.add_segments([[380, 120]], [[500, 120]])
+    report = builder.levelOfDetail(min_length=0)  # the longest (380 -> 500) takes in both others on its line
+    assert report['merged'] == 2 and report['overlapping'] == 0 and report['kept'] == 2
+    assert [path.T.tolist() for path in builder.secondary_paths] == [[[310, 120], [310, 20]], [[310, 120], [500, 120]]]
+
+
+def test_budget_keep():
+    keep = budgetKeep([3, 1, 2], [5, 5, 5], 10)
+    assert keep.tolist() == [True, False, True]
+
+
+def test_sub_pixel():
+    builder = collision()
+    lengths = builder.secondary_paths.lengths()
+    negative = builder.secondary_paths.flags
+    pixel = 1/(1 - 0.05)  # the margin scales the document down
+    report = builder.levelOfDetail(min_length=5, max_overlap=None)
+    assert report['sub-pixel'] == int((~negative & (lengths < 5*pixel)).sum())
+    assert (builder.secondary_paths.lengths() >= 5*pixel).all()
+
+
+def test_negative_lengths():
+    # length_std far above length_mean: about 40% of the lengths are drawn <= 0
+    builder = CollisionBuider(800, 300, [310, 120], incoming_angles=[17.], seed=2)
+    builder.calculateSecondaryPaths(2000, alpha_std=10, length_mean=30, length_std=120)
+    negative = builder.secondary_paths.flags
+    assert 0.3 < negative.mean() < 0.5
+
+    report = builder.levelOfDetail(min_length=0, max_overlap=None)
+    assert report['negative'] == negative.sum() and report['sub-pixel'] == 0
+    assert report['kept'] == (~negative).sum()
+    # the rest points into the spray (17 + 180 degrees, alpha_std 10)
+    starts, ends = segmentEnds(builder.secondary_paths)
+    assert ((ends - starts) @ [np.cos(np.deg2rad(197)), np.sin(np.deg2rad(197))] >= 0).all()
+    assert not builder.secondary_paths.flags.any()
+
+
+@pytest.mark.parametrize('options', [{}, {'group_secondaries': True}, {'merge_secondaries': True}])
+@pytest.mark.parametrize('max_bytes', [12000, 25000, 30100])
+def test_byte_budget(options, max_bytes):
+    builder = collision()
+    report = builder.levelOfDetail(max_bytes=max_bytes, max_overlap=None, **options)
+    assert report['fits']
+    assert len(builder.to_svg_bytes(**options)) <= max_bytes
+    assert report['bytes'] == len(builder.to_svg_bytes(**options))
+
+
+def test_element_budget():
+    builder = chain()
+    report = builder.levelOfDetail(max_elements=500, max_overlap=None)
+    assert measureSvg(builder.to_svg_bytes())['elements'] <= 500
+    assert report['kept'] < report['secondaries']
+
+
+def test_budget_out_of_reach():
+    builder = collision(300)
+    report = builder.levelOfDetail(max_bytes=100)
+    assert not report['fits'] and report['kept'] == 0
+
+
+def test_culled_chain_is_not_served_from_the_cache(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    builder = chain()
+    builder.to_svg(io.BytesIO(), cache=cache)
+
+    builder.levelOfDetail(max_bytes=30000)
+    out = io.BytesIO()
+    builder.to_svg(out, cache=cache)
+    assert out.getvalue() == builder.to_svg_bytes()
+    assert len(out.getvalue()) <= 30000
+
+    # an edited collision comes back with all its secondaries, the key follows
+    key = builder.cacheKey()
+    builder.editCollision(3, n_secondaries=80)
+    assert builder.cacheKey() != key
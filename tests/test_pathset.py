@@ -0,0 +1,59 @@
+#
+# PathSet storage
+# https://github.com/LEMettler
+#
+
+
+import pickle
+import numpy as np
+
+from pathset import PathSet
+
+
+
+def paths():
+    path_set = PathSet()
+    path_set.append([[0, 0], [3, 4]])
+    path_set.extend([[[1, 1], [1, 2], [2, 2]], np.zeros((0, 2))])
+    path_set.add_segments([[0, 0], [5, 5]], [[0, 1], [5, 6]])
+    return path_set
+
+
+def test_layout():
+    path_set = paths()
+    assert len(path_set) == 5
+    assert path_set[1].tolist() == [[1, 1, 2], [1, 2, 2]]
+    assert path_set.lengths().tolist() == [5, 2, 0, 1, 1]
+
+
+def test_pickle():
+    path_set = paths()
+    copy = pickle.loads(pickle.dumps(path_set))
+    assert np.array_equal(copy.coords, path_set.coords)
+    assert np.array_equal(copy.offsets, path_set.offsets)
+    assert [p.tolist() for p in copy] == [p.tolist() for p in path_set]
+
+
+def test_subset():
+    path_set = paths()
+    subset = path_set.subset([3, 0])
+    assert [p.tolist() for p in subset] == [path_set[3].tolist(), path_set[0].tolist()]
+    masked = path_set.subset(np.array([True, False, True, False, True]))
+    assert len(masked) == 3 and masked.lengths().tolist() == [5, 0, 1]
+    assert len(path_set.subset([])) == 0
+
+
+def test_digest():
+    path_set = paths()
+    assert pickle.loads(pickle.dumps(path_set)).digest() == path_set.digest()
+    assert path_set.subset([0, 1]).digest() != path_set.digest()
+
+
+def test_flags():
+    path_set = paths()
+    assert not path_set.flags.any()
+    path_set.add_segments([[0, 0], [1, 1]], [[2, 2], [3, 3]], flags=[True, False])
+    path_set.append([[4, 4], [5, 5]])
+    assert path_set.flags.tolist() == [False]*5 + [True, False, False]
+    assert path_set.subset([5, 0, 6]).flags.tolist() == [True, False, False]
+    assert pickle.loads(pickle.dumps(path_set)).flags.tolist() == path_set.flags.tolist()
@@ -0,0 +1,65 @@
+#
+# Rasterized previews: box and table backgrounds, unpainted colors, png and gif files
+# https://github.com/LEMettler
+#
+
+
+import zlib
+import numpy as np
+
+from collision_builder import CollisionBuider
+from consecutive_collisions import ConsecutiveCollisionBuilder
+from tables import Table, circlePolygon
+from rasterizer import Rasterizer, renderFrame, renderFrames, makeCanvas, hexToRgb, savePng, saveGif
+
+
+BOX, BACKGROUND = '#3c3c3c', '#a6480f'
+
+
+def pixel(canvas, point):
+    x, y = canvas.transform(np.array([point]))[0]
+    return canvas.image[int(y), int(x)]
+
+
+def test_table_background():
+    hexagon = [(400 + 140*np.cos(a), 150 + 140*np.sin(a)) for a in np.arange(6)*np.pi/3]
+    table = Table(hexagon, [circlePolygon((400, 150), 30, n=16)])
+    canvas = Rasterizer(800, 300, background_color=BACKGROUND, box_color=BOX, table=table)
+    assert np.allclose(pixel(canvas, (330, 150)), hexToRgb(BOX))
+    assert np.allclose(pixel(canvas, (400, 150)), hexToRgb(BACKGROUND))  # obstacle
+    assert np.allclose(pixel(canvas, (50, 150)), hexToRgb(BACKGROUND))   # outside
+
+
+def test_rectangle_table_matches_box():
+    box = Rasterizer(800, 300, background_color=BACKGROUND, box_color=BOX)
+    table = Rasterizer(800, 300, background_color=BACKGROUND, box_color=BOX, table=Table.rectangle(800, 300))
+    # the same inside, only the anti-aliased border rows differ a little
+    assert np.abs(box.image - table.image).max() < 0.1
+    assert np.mean(np.abs(box.image - table.image)) < 1e-3
+
+
+def test_unpainted_chain_colors():
+    builder = ConsecutiveCollisionBuilder(800, 300, [300, 100], seed=1)
+    builder.addCollision([402, 230], [['C'], ['B', 'A']], primary_color='0', secondary_color='0', primary_duration=1)
+    background = makeCanvas(builder).rgba()
+    assert all((renderFrame(builder, t) == background).all() for t in [0.5, 1.2, 2.])
+
+
+def test_collision_frames(tmp_path):
+    builder = CollisionBuider(200, 100, [60, 40], incoming_angles=[17., 131.], seed=1)
+    builder.calculatePrimaryPaths(5)
+    builder.calculateSecondaryPaths(10, length_mean=20, length_std=5)
+    frames = [rgba for _, rgba in renderFrames(builder, fps=5)]
+    assert len({frame.tobytes() for frame in frames}) > 1
+
+    savePng(str(tmp_path/'frame.png'), frames[-1])
+    data = (tmp_path/'frame.png').read_bytes()
+    assert data.startswith(b'\x89PNG\r\n\x1a\n')
+    # IDAT holds the rows, one filter byte each
+    start = data.index(b'IDAT') + 4
+    length = int.from_bytes(data[start - 8:start - 4], 'big')
+    rows = zlib.decompress(data[start:start + length])
+    assert len(rows) == frames[-1].shape[0]*(1 + frames[-1].shape[1]*4)
+
+    saveGif(str(tmp_path/'loop.gif'), frames, fps=5)
+    assert (tmp_path/'loop.gif').read_bytes()[:6] == b'GIF89a'
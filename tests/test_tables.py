@@ -0,0 +1,76 @@
+#
+# Polygonal tables: the rectangle preset against the box engine, grid queries against brute force
+# https://github.com/LEMettler
+#
+
+
+import numpy as np
+import pytest
+
+from collision_builder import CollisionBuider, bouncePaths
+from tables import Table, circlePolygon
+
+
+
+def test_rectangle_matches_box():
+    table = Table.rectangle(800, 300)
+    alphas = np.random.default_rng(0).uniform(0, 360, 40)
+    for n in [3, 40]:  # scalar and vectorized walk
+        coords = table.bouncePaths(310, 120, alphas[:n], 50)
+        assert np.abs(coords - bouncePaths(310, 120, alphas[:n], 50, 800, 300)).max() < 1e-8
+
+
+def test_corner_hit():
+    # (1, 1) at 45 degrees runs into the corner (4, 0) after 5 bounces
+    builder = CollisionBuider(4, 3, [1, 1], [45], table=Table.rectangle(4, 3))
+    builder.calculatePrimaryPaths(10)
+    assert np.abs(builder.primary_paths.points(0) - bouncePaths(1, 1, [45], 10, 4, 3)[0]).max() < 1e-9
+
+
+@pytest.mark.parametrize('n_rays', [1, 20])
+def test_rays_into_corners(n_rays):
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        width, height = rng.integers(2, 9, 2).astype(float)
+        x, y = rng.integers(1, [width, height])
+        for corner in [(0, 0), (width, 0), (width, height), (0, height)]:
+            alpha = np.rad2deg(np.arctan2(corner[1] - y, corner[0] - x)) % 360
+            alphas = np.full(n_rays, alpha)
+            coords = Table.rectangle(width, height).bouncePaths(x, y, alphas, 20)
+            assert np.abs(coords - bouncePaths(x, y, alphas, 20, width, height)).max() < 1e-8
+
+
+def test_grid_matches_brute_force():
+    rng = np.random.default_rng(2)
+    boundary = circlePolygon((500, 500), 480, n=400)
+    obstacles = [circlePolygon(rng.uniform(250, 750, 2), 30, n=40) for _ in range(4)]
+    table = Table(boundary, obstacles)
+    origins = rng.uniform(100, 900, (3000, 2))
+    origins = origins[table.contains(origins)]
+    directions = rng.normal(size=(len(origins), 2))
+
+    t, edges = table.firstHits(origins, directions)
+    t_ref, edges_ref = table.bruteForceHits(origins, directions)
+    assert np.array_equal(edges, edges_ref)
+    assert np.allclose(t, t_ref)
+
+    # the scalar walk of a few rays
+    t, edges = table.firstHits(origins[:5], directions[:5])
+    assert np.array_equal(edges, edges_ref[:5])
+
+
+def test_paths_stay_inside():
+    table = Table(circlePolygon((0, 0), 100, n=7), [circlePolygon((20, 10), 15, n=5)])
+    coords = table.bouncePaths(-50, 0, np.linspace(0, 360, 30, endpoint=False), 200)
+    # the midpoints of all segments lie inside the table
+    assert table.contains(((coords[:, 1:] + coords[:, :-1])/2).reshape(-1, 2)).all()
+
+
+def test_route_check():
+    hexagon = [(400 + 140*np.cos(a), 150 + 140*np.sin(a)) for a in np.arange(6)*np.pi/3]
+    table = Table(hexagon, [circlePolygon((400, 150), 30, n=16)])
+    builder = CollisionBuider(800, 300, [400, 230], incoming_angles=[], table=table)
+    builder.addPrimaryFrom([340, 100], [['E1'], ['E5']], check_routes=True)
+    assert len(builder.primary_paths) == 2
+    with pytest.raises(ValueError):
+        builder.tableRoute([400, 60], ['E1', 'E4'])
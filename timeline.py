@@ -0,0 +1,183 @@
+#
+# Timeline compiler: absolute begin times of a chain of collisions and looping animations without syncbase references
+# https://github.com/LEMettler
+#
+# The chained svg starts every collision at the end of the one before (primary{i-1}_stroke.end), so the
+# browser resolves a dependency chain as long as the animation. Here every collision gets its begin time
+# from the durations and all its animations loop on their own: begin="<absolute>s", one period long,
+# repeatCount="indefinite". The curves within one period are given as keyTimes/values.
+#
+
+
+import re
+import numpy as np
+
+
+
+def chainBegins(durations):
+    '''
+    - durations: primary_duration of every collision of the chain
+    ---------------------------------------
+    Begin of every collision (it starts when the primaries before are drawn) and the period of the loop.
+    '''
+    ends = np.cumsum(np.asarray(durations, dtype=float))
+    period = float(ends[-1]) if len(ends) else 0.
+    return np.concatenate(([0.], ends[:-1])), period
+
+
+def collisionCurves(primary_duration, secondary_duration, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary):
+    '''
+    Piecewise linear curves of one collision over its cycle: {(role, attribute): (taus, values)}
+    with tau the time since its primaries began to grow (the same states as rasterizer.chainState).
+    dash values are the hidden fraction of the path (stroke-dashoffset/length), opacity values the opacity.
+    '''
+    pd, sd = primary_duration, secondary_duration
+    fp, fs, freeze = dur_fade_primary, dur_fade_secondary, dur_freeze_secondary
+    return {('primary', 'dash'): ([0., pd], [1., 0.]),
+            ('primary', 'opacity'): ([0., pd, pd + fp], [1., 1., 0.]),
+            ('secondary', 'dash'): ([0., pd, pd + sd], [1., 1., 0.]),
+            ('secondary', 'opacity'): ([0., pd + freeze, pd + freeze + fs], [1., 1., 0.])}
+
+
+def loopKeyframes(taus, values, period):
+    '''
+    - taus, values: curve of one cycle (see collisionCurves), it is cut at period
+    ---------------------------------------
+    (keyTimes, values) over one period: times as fractions of the period, first at 0 and last at 1.
+    Steps (zero duration fades) stay as two values at the same key time.
+    '''
+    taus = np.asarray(taus, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if period <= 0:
+        return [0., 1.], [values[-1], values[-1]]
+
+    inside = taus < period
+    times = list(taus[inside]/period) + [1.]
+    # value at the end of the period, interpolated if the curve is still running
+    if inside.all():
+        end = values[-1]
+    else:
+        k = int(np.argmin(inside))
+        t0, t1, v0, v1 = taus[k - 1], taus[k], values[k - 1], values[k]
+        end = v1 if t1 == t0 else v0 + (v1 - v0)*(period - t0)/(t1 - t0)
+    values = list(values[inside]) + [end]
+
+    # drop points in the middle of constant stretches
+    keep = [0] + [k for k in range(1, len(times) - 1) if not (values[k - 1] == values[k] == values[k + 1])] + [len(times) - 1]
+    return [times[k] for k in keep], [values[k] for k in keep]
+
+
+def formatNumber(x):
+    return f'{x:.6g}'
+
+
+def dashValues(values, length):
+    '''
+    stroke-dashoffset values of a path of this length (stroke-dasharray) from hidden fractions.
+    '''
+    return ';'.join(str(length) if v == 1 else '0' if v == 0 else formatNumber(v*float(length)) for v in values)
+
+
+def loopAttributes(begin, period):
+    return f'begin="{formatNumber(begin)}s" dur="{formatNumber(period)}s" repeatCount="indefinite"'
+
+
+def loopAnimations(keyframes, begin, period, length):
+    '''
+    - keyframes: {'dash': (keyTimes, values), 'opacity': (keyTimes, values)} of one role (see roleKeyframes)
+    - begin: absolute begin of the collision in seconds, period: loop duration
+    - length: stroke-dasharray of the paths (hidden fraction 1 -> dashoffset length)
+    ---------------------------------------
+    The two looping <animate> elements that replace the chained stroke/opacity animations and resets.
+    '''
+    loop = loopAttributes(begin, period)
+    times, values = keyframes['dash']
+    animations = (f'<animate attributeName="stroke-dashoffset" values="{dashValues(values, length)}" '
+                  f'keyTimes="{";".join(map(formatNumber, times))}" {loop}/>\n')
+    times, values = keyframes['opacity']
+    animations += (f'<animate attributeName="opacity" values="{";".join(map(formatNumber, values))}" '
+                   f'keyTimes="{";".join(map(formatNumber, times))}" {loop}/>\n')
+    return animations
+
+
+def loopSlots(keyframes, begin, period):
+    '''
+    Slots of templates/path_template_loop.txt shared by all paths of a role (stroke_values is per path).
+    '''
+    return {'stroke_times': ';'.join(map(formatNumber, keyframes['dash'][0])),
+            'opacity_values': ';'.join(map(formatNumber, keyframes['opacity'][1])),
+            'opacity_times': ';'.join(map(formatNumber, keyframes['opacity'][0])),
+            'loop': loopAttributes(begin, period)}
+
+
+def roleKeyframes(period, **timing):
+    '''
+    - timing: primary_duration, secondary_duration, dur_fade_primary, dur_fade_secondary, dur_freeze_secondary
+    ---------------------------------------
+    {role: {'dash': (keyTimes, values), 'opacity': (keyTimes, values)}} of one collision.
+    '''
+    keyframes = {'primary': {}, 'secondary': {}}
+    for (role, attribute), (taus, values) in collisionCurves(**timing).items():
+        keyframes[role][attribute] = loopKeyframes(taus, values, period)
+    return keyframes
+
+
+
+##################################################################
+# chained vs absolute documents
+
+def beginReferences(svg):
+    '''
+    Syncbase references of every animation id in a document: {id: [referenced ids]}.
+    Animations without an id are collected under None.
+    '''
+    references = {}
+    for element in re.finditer(r'<(?:animate|set)\b[^>]*>', svg):
+        tag = element.group(0)
+        element_id = re.search(r'\bid="([^"]*)"', tag)
+        begin = re.search(r'\bbegin="([^"]*)"', tag)
+        refs = re.findall(r'([A-Za-z_][\w-]*)\.(?:end|begin)', begin.group(1)) if begin else []
+        references.setdefault(element_id.group(1) if element_id else None, []).extend(refs)
+    return references
+
+
+def chainDepth(references):
+    '''
+    Longest chain of begin references a browser has to follow (cycles are counted once).
+    '''
+    depth = {}
+
+    def resolve(name):
+        # iterative depth first search, a reference back into the current chain closes a cycle
+        stack, active = [(name, iter(references.get(name, [])))], {name}
+        best = {name: 0}
+        while stack:
+            node, refs = stack[-1]
+            ref = next(refs, None)
+            if ref is None:
+                stack.pop()
+                active.discard(node)
+                depth[node] = best[node]
+                if stack:
+                    parent = stack[-1][0]
+                    best[parent] = max(best[parent], depth[node] + 1)
+            elif ref in depth:
+                best[node] = max(best[node], depth[ref] + 1)
+            elif ref not in active and ref in references:
+                active.add(ref)
+                best[ref] = 0
+                stack.append((ref, iter(references[ref])))
+        return depth[name]
+
+    return max([resolve(name) for name in references if name is not None and name not in depth] + [0])
+
+
+def documentStats(svg):
+    '''
+    Size and animation structure of a document: bytes, elements, animation elements and begin chain depth.
+    '''
+    references = beginReferences(svg)
+    return {'bytes': len(svg.encode('utf-8')),
+            'elements': svg.count('<') - svg.count('</') - svg.count('<?') - svg.count('<!'),
+            'animations': svg.count('<animate') + svg.count('<set'),
+            'chain depth': chainDepth(references)}
@@ -0,0 +1,100 @@
+#
+# Enumerate the wall sequences leading from one point to another via the mirror image lattice
+# https://github.com/LEMettler
+#
+# Unfolding the box, every route start -> end with i crossings of the vertical and j of the
+# horizontal walls is a straight line from end to the mirror image of start in lattice cell (i, j).
+# So there is exactly one route per cell and all routes with up to k bounces are the cells
+# with |i| + |j| <= k, about 2k^2 instead of 4^k letter strings.
+#
+
+
+import numpy as np
+
+
+
+def _imageCoordinate(p, size, cells):
+    '''
+    Coordinate of the mirror image of p in cells [cell*size, (cell+1)*size] (odd cells are mirrored).
+    '''
+    return np.where(cells % 2 == 0, cells*size + p, (cells + 1)*size - p)
+
+
+def _crossings(p, size, cell, low_wall, high_wall):
+    '''
+    Lattice lines between cell 0 and cell, in the order they are crossed: (coordinates, walls)
+    Line m*size is the wall at 0 (low_wall) for even m, the wall at size (high_wall) for odd m.
+    '''
+    if cell > 0:
+        lines = np.arange(1, cell + 1)
+    else:
+        lines = np.arange(0, cell, -1)
+    walls = [low_wall if m % 2 == 0 else high_wall for m in lines]
+    return lines*size, walls
+
+
+def routeWalls(start, end, cell_x, cell_y, width, height):
+    '''
+    - cell_x, cell_y: lattice cell of the mirror image of start
+    ---------------------------------------
+    Walls of the route end -> start through this cell, in the order the ray leaving end meets them
+    (the order addPrimaryFrom reflects in). None if the route runs exactly into a corner.
+    '''
+    image = (_imageCoordinate(start[0], width, cell_x), _imageCoordinate(start[1], height, cell_y))
+    dx, dy = image[0] - end[0], image[1] - end[1]
+
+    lines_x, walls_x = _crossings(end[0], width, cell_x, 'D', 'B')
+    lines_y, walls_y = _crossings(end[1], height, cell_y, 'A', 'C')
+    # fraction of the way to the image at which every wall is hit
+    t_x = (lines_x - end[0])/dx if len(lines_x) else lines_x
+    t_y = (lines_y - end[1])/dy if len(lines_y) else lines_y
+
+    if len(t_x) and len(t_y) and np.isclose(t_x[:, None], t_y[None, :], rtol=0, atol=1e-12).any():
+        return None
+
+    order = np.argsort(np.concatenate((t_x, t_y)), kind='stable')
+    walls = walls_x + walls_y
+    return [walls[k] for k in order]
+
+
+def wallSequences(start, end, width, height, max_bounces, min_bounces=0,
+                  length_range=None, duration_range=None, speed=None, limit=None):
+    '''
+    - start, end: (x, y) points inside the box, e.g. the previous and the new point of collision
+    - max_bounces, min_bounces: number of wall collisions (max_bounces ~50 is still interactive)
+    - length_range: optional (min, max) length of the route
+    - duration_range: optional (min, max) duration of the route at speed (length per second)
+    - limit: only the shortest limit routes
+    ---------------------------------------
+    Every wall sequence from start to end, sorted by path length: [(walls, length), ...]
+    walls is a list of 'A' (y=0), 'B' (x=width), 'C' (y=height), 'D' (x=0) as used by
+    CollisionBuider.addPrimaryFrom and ConsecutiveCollisionBuilder.addCollision.
+    Routes through a corner are left out, their reflection is not defined.
+    '''
+    if duration_range is not None:
+        if speed is None:
+            raise ValueError('duration_range needs a speed')
+        length_range = (max(duration_range[0]*speed, length_range[0] if length_range else 0),
+                        min(duration_range[1]*speed, length_range[1] if length_range else np.inf))
+
+    # all cells |i| + |j| <= max_bounces of the lattice
+    k = int(max_bounces)
+    cell_x, cell_y = np.meshgrid(np.arange(-k, k + 1), np.arange(-k, k + 1), indexing='ij')
+    bounces = np.abs(cell_x) + np.abs(cell_y)
+    keep = (bounces <= k) & (bounces >= min_bounces)
+    cell_x, cell_y = cell_x[keep], cell_y[keep]
+
+    lengths = np.hypot(_imageCoordinate(start[0], width, cell_x) - end[0],
+                       _imageCoordinate(start[1], height, cell_y) - end[1])
+    if length_range is not None:
+        keep = (lengths >= length_range[0]) & (lengths <= length_range[1])
+        cell_x, cell_y, lengths = cell_x[keep], cell_y[keep], lengths[keep]
+
+    routes = []
+    for index in np.argsort(lengths, kind='stable'):
+        if limit is not None and len(routes) >= limit:
+            break
+        walls = routeWalls(start, end, cell_x[index], cell_y[index], width, height)
+        if walls is not None:
+            routes.append((walls, float(lengths[index])))
+    return routes